@@ -0,0 +1,221 @@
+import os
+import math
+import time
+import weakref
+import threading
+
+from flask import request, jsonify
+
+from metrics import ADMISSION_IN_FLIGHT, ADMISSION_WAITING, ADMISSION_REJECTED
+
+# *************************************!!!!!!!!!!!!! ADMISSION CONTROL !!!!!!!!!!!!!!!!!!!********************************
+# Every request is admitted through a lane picked from its endpoint. Each lane runs at most <limit> requests at once and
+# lets at most <queue> more wait up to <wait> seconds for a slot; past that the request is turned away at once with
+# 429 and a Retry-After estimated from how long the lane's requests have been taking. Lanes (ADMISSION_<LANE>_LIMIT,
+# ADMISSION_<LANE>_QUEUE and ADMISSION_<LANE>_WAIT override the defaults):
+#   upscale   Real-ESRGAN runs in the request (main.py /add_image)
+#   textract  Textract calls in the request (main.py /add_table and /add_text, the /v1 batch endpoints)
+#   upload    uploads saved and queued as background jobs (/v1/add_*, /v1/reprocess)
+#   bulk      long reads: exports, stored-table queries, statistics
+#   read      everything else: history, find, search, job status, pages
+# The lanes other than read also share ADMISSION_HEAVY_SLOTS (running or waiting), by default the server's threads per
+# worker minus ADMISSION_RESERVED_READS (1), so a burst of expensive requests can never take the threads the cheap
+# reads need. Limits are per process; with several gunicorn workers each one has its own.
+
+LANE_DEFAULTS = {
+    # lane: (limit, queue, wait seconds)
+    "upscale":(lambda: _upscale_slots(),4,10),
+    "textract":(lambda: 2,8,10),
+    "upload":(lambda: 8,16,5),
+    "bulk":(lambda: 2,4,5),
+    "read":(lambda: 64,64,2),
+}
+HEAVY_LANES = ("upscale","textract","upload","bulk")
+# The upload pages also answer GET with a form; only the uploads themselves take a processing slot
+PROCESSING_LANES = ("upscale","textract","upload")
+# Endpoints that never go through admission
+EXEMPT = ("static","metrics")
+
+def _upscale_slots():
+    from upscaler import upscale_concurrency
+    return upscale_concurrency()
+
+def _setting(lane,name,default):
+    return float(os.environ.get(f"ADMISSION_{lane.upper()}_{name}",default))
+
+class Rejected(Exception):
+    def __init__(self,lane,retry_after):
+        super().__init__(f"The {lane} lane is at capacity")
+        self.lane = lane
+        self.retry_after = retry_after
+
+class Lane:
+    def __init__(self,name,limit,queue,wait,budget=None):
+        self.name = name
+        self.limit = max(1,int(limit))
+        self.queue = max(0,int(queue))
+        self.wait = wait
+        self.budget = budget
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.average_seconds = None
+        self.condition = threading.Condition()
+
+    def retry_after(self):
+        # Roughly the time for everyone already waiting to get through, in whole seconds
+        average = self.average_seconds or 1
+        return max(1,min(300,math.ceil(average * (self.waiting + 1) / self.limit)))
+
+    def _reject(self):
+        self.rejected += 1
+        ADMISSION_REJECTED.labels(self.name).inc()
+        return Rejected(self.name,self.retry_after())
+
+    def acquire(self):
+        if self.budget is not None and not self.budget.take():
+            with self.condition:
+                raise self._reject()
+        try:
+            with self.condition:
+                if self.in_flight >= self.limit:
+                    if self.waiting >= self.queue:
+                        raise self._reject()
+                    self.waiting += 1
+                    ADMISSION_WAITING.labels(self.name).inc()
+                    deadline = time.monotonic() + self.wait
+                    try:
+                        while self.in_flight >= self.limit:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise self._reject()
+                            self.condition.wait(remaining)
+                    finally:
+                        self.waiting -= 1
+                        ADMISSION_WAITING.labels(self.name).dec()
+                self.in_flight += 1
+                ADMISSION_IN_FLIGHT.labels(self.name).inc()
+        except Rejected:
+            if self.budget is not None:
+                self.budget.give_back()
+            raise
+        return time.monotonic()
+
+    def release(self,started):
+        seconds = time.monotonic() - started
+        with self.condition:
+            self.in_flight -= 1
+            ADMISSION_IN_FLIGHT.labels(self.name).dec()
+            self.average_seconds = seconds if self.average_seconds is None else 0.8 * self.average_seconds + 0.2 * seconds
+            self.condition.notify()
+        if self.budget is not None:
+            self.budget.give_back()
+
+    def describe(self):
+        with self.condition:
+            return {"limit":self.limit,"queue":self.queue,"wait_seconds":self.wait,"in_flight":self.in_flight,
+                    "waiting":self.waiting,"rejected":self.rejected,
+                    "average_seconds":round(self.average_seconds,4) if self.average_seconds is not None else None,
+                    "retry_after":self.retry_after()}
+
+class Slot:
+    # One admitted request's hold on its lane, given back once by whichever of the release paths gets there first
+    def __init__(self,lane,started):
+        self.lane = lane
+        self.started = started
+        self.released = False
+        self.lock = threading.Lock()
+
+    def release(self):
+        with self.lock:
+            if self.released:
+                return
+            self.released = True
+        self.lane.release(self.started)
+
+class Budget:
+    # A plain counter: requests that find it empty are rejected, they never wait for it
+    def __init__(self,slots):
+        self.slots = max(1,int(slots))
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            if self.used >= self.slots:
+                return False
+            self.used += 1
+            return True
+
+    def give_back(self):
+        with self.lock:
+            self.used -= 1
+
+def heavy_slots():
+    if os.environ.get('ADMISSION_HEAVY_SLOTS'):
+        return int(os.environ['ADMISSION_HEAVY_SLOTS'])
+    threads = int(os.environ.get('GUNICORN_THREADS',4))
+    return max(1,threads - int(os.environ.get('ADMISSION_RESERVED_READS',1)))
+
+def build_lanes():
+    budget = Budget(heavy_slots())
+    lanes = {}
+    for name,(limit,queue,wait) in LANE_DEFAULTS.items():
+        lanes[name] = Lane(name,_setting(name,"LIMIT",limit()),_setting(name,"QUEUE",queue),_setting(name,"WAIT",wait),
+                           budget=budget if name in HEAVY_LANES else None)
+    return lanes,budget
+
+def rejected_response(error):
+    response = jsonify(response={"Error":f"Too many requests: the {error.lane} lane is at capacity, retry later."})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def init_app(app,classes):
+    # classes: endpoint name -> lane. Unlisted endpoints use the read lane
+    if os.environ.get('ADMISSION','1') == '0':
+        return
+    lanes,budget = build_lanes()
+    app.extensions['visionextract']["admission"] = {"lanes":lanes,"budget":budget}
+
+    @app.before_request
+    def admit():
+        endpoint = request.endpoint or "none"
+        if endpoint in EXEMPT:
+            return
+        lane = classes.get(endpoint,"read")
+        if lane in PROCESSING_LANES and request.method in ('GET','HEAD'):
+            lane = "read"
+        try:
+            request.environ['admission.slot'] = Slot(lanes[lane],lanes[lane].acquire())
+        except Rejected as e:
+            return rejected_response(e)
+
+    @app.after_request
+    def leave_when_sent(response):
+        # A streamed response (an export, an archive, a file) holds its slot until it has been sent, which is long after
+        # the view returns. Servers close every response once it is sent; one that is dropped without being closed
+        # gives the slot back when it is garbage collected
+        if response.is_streamed:
+            slot = request.environ.pop('admission.slot',None)
+            if slot is not None:
+                response.call_on_close(slot.release)
+                weakref.finalize(response,slot.release)
+        return response
+
+    @app.teardown_request
+    def leave(error=None):
+        # Responses that were built in full, and requests that failed before a response was built
+        slot = request.environ.pop('admission.slot',None)
+        if slot is not None:
+            slot.release()
+
+def describe(app):
+    state = app.extensions['visionextract'].get("admission")
+    if state is None:
+        return None
+    budget = state["budget"]
+    return {"heavy_slots":{"slots":budget.slots,"used":budget.used},
+            "lanes":{name:lane.describe() for name,lane in state["lanes"].items()}}
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -1,50 +1,145 @@
-import requests
 from datetime import date
 import datetime
-from flask import Flask,jsonify,render_template,request
-
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, String, Boolean, Date, JSON
+from flask import Flask,Response,jsonify,render_template,request,stream_with_context,url_for
 
 import shutil
-from methods import upscale_images, extract_table, extract_text
+from methods import upscale_images, output_settings, extract_table, extract_text, gateway_status
+from jobs import JobQueue, QueueFull, describe
+from ingest import ingest_upload, UploadTooLarge
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from dotenv import load_dotenv
+from models import database, Extract, Job, db_names
+from factory import create_app, when_ready, when_stopping, warm_up
+from schema import reset_table
+import metrics
+import admission
+from search import ensure_fts, search
+from stats import usage_stats, GROUPS
+from tables import catalog, query_tables, read_grid, replace_table
+from textract_gateway import TextractUnavailable
+from reprocess import reprocess, REPROCESSABLE
+import export
+from upscale_cache import get_upscale_cache
 import os
 
-import pd
 from functools import wraps
+from sqlalchemy import and_
+
+app = create_app(__name__,'FLASK_KEY_V1')
+
+# !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! NOTE: BACKGROUND JOB HANDLERS (run by the job queue, outside of the request) !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+
+def staging_directory(job_id):
+    path = os.path.join('input','jobs',job_id)
+    os.makedirs(path,exist_ok=True)
+    return path
+
+def run_image_job(payload):
+    staged = [os.path.join(payload['staging'],filename) for filename in payload['files']]
+    output_path,input_path,encodings = upscale_images(staged,payload.get('output_format'),payload.get('quality'))
+    # The outputs come back sorted by name, not in upload order; each is named <stem>_out.<ext> after its input
+    input_file_paths = {os.path.splitext(filename)[0]:os.path.join(input_path,filename) for filename in payload['files']}
+    new_ids = []
+    for images in output_path:
+        filename = os.path.basename(images)
+        input_file_path = input_file_paths[os.path.splitext(filename)[0].removesuffix('_out')]
+        new_image=Extract(
+            name=filename,
+            date=date.today(),
+            filetype="image",
+            file_location=input_file_path,
+            output_location=images,
+            input_size = os.path.getsize(input_file_path)/1024,
+            output_size = encodings[images]['output_bytes']/1024,
+            output_format = encodings[images]['output_format'],
+            encode_seconds = encodings[images]['encode_seconds'],
+            duration_seconds = encodings[images]['seconds'],
+        )
+        database.session.add(new_image)
+        database.session.flush()
+        new_ids.append(new_image.id)
+    shutil.rmtree(payload['staging'],ignore_errors=True)
+    return {"ids":new_ids,"outputs":output_path,"encodings":[encodings[images] for images in output_path]}
+
+def build_table_row(image_path,static_path,document_bytes=None,digest=None):
+    # Runs the extraction and builds the (unsaved) Extract row, so it is safe to call from worker threads
+    tables,info = extract_table(image_path,document_bytes=document_bytes,digest=digest)
+    if not tables:
+        raise ValueError("No data table was found in the image")
+    image_name = os.path.splitext(os.path.basename(image_path))[0]
+    output_path = tables[0]['output_location']
+
+    new_table = Extract(
+        name=image_name,
+        date=date.today(),
+        filetype = 'datatable',
+        file_location = static_path,
+        output_location = output_path,
+        input_size = os.path.getsize(image_path)/1024,
+        output_size = os.path.getsize(output_path)/1024,
+        data_output = tables[0]['data'],
+        table_files = catalog(tables),
+        response_sha = info['response_sha'],
+        duration_seconds = info['seconds'],
+    )
+    tables_found = [{key:value for key,value in table.items() if key != 'data'} for table in tables]
+    return new_table,{"output_location":output_path,**info,"tables":tables_found}
 
-load_dotenv(override=True)
-app=Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('FLASK_KEY_V1')
-
-# Create DataBase
-class Base(DeclarativeBase):
-    pass
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///textract.db'
-database = SQLAlchemy(model_class=Base)
-database.init_app(app)
-                    
-# Textract Table Configuration
-            
-class Extract(database.Model):
-    id: Mapped[int] = mapped_column(Integer, primary_key = True)
-    name: Mapped[str] = mapped_column(String(250),unique = False, nullable=False)
-    filetype: Mapped[str] = mapped_column(String(100),nullable=False)
-    date: Mapped[Date] = mapped_column(Date,nullable=False)
-    file_location : Mapped[str] = mapped_column(String(250), nullable = False)
-    output_location : Mapped[str] = mapped_column(String(250),nullable=False)
-    input_size : Mapped[str] = mapped_column(String(100),unique=False,nullable=False)
-    output_size : Mapped[str] = mapped_column(String(100),unique=False,nullable=False)
-    text_output : Mapped[str] = mapped_column(String,nullable=True)
-    data_output : Mapped[dict] = mapped_column(JSON,nullable=True)
-    edit_date: Mapped[Date] = mapped_column(Date,nullable=True)
-
-with app.app_context():
-    database.create_all()
-    db_names = Extract.__table__.columns.keys()
+def build_text_row(image_path,static_path,document_bytes=None,digest=None):
+    text,image_name,info = extract_text(image_path,document_bytes=document_bytes,digest=digest)
+    output_path = os.path.join('output',f'{image_name}.txt')
+
+    new_text = Extract(
+        name=image_name,
+        date=date.today(),
+        filetype = 'text',
+        file_location = static_path,
+        output_location = output_path,
+        input_size = os.path.getsize(image_path)/1024,
+        output_size = os.path.getsize(output_path)/1024,
+        data_output = text,
+        response_sha = info['response_sha'],
+        duration_seconds = info['seconds'],
+    )
+    return new_text,{"output_location":output_path,**info}
+
+def run_table_job(payload):
+    new_table,details = build_table_row(payload['image_path'],payload['static_path'],digest=payload.get('sha256'))
+    database.session.add(new_table)
+    database.session.flush()
+    return {"id":new_table.id,**details}
+
+def run_text_job(payload):
+    new_text,details = build_text_row(payload['image_path'],payload['static_path'],digest=payload.get('sha256'))
+    database.session.add(new_text)
+    database.session.flush()
+    return {"id":new_text.id,**details}
+
+def run_reprocess_job(payload):
+    return reprocess(database.engine,Extract.__table__,ids=payload.get('ids'),filetype=payload.get('filetype'),
+                     workers=payload.get('workers'))
+
+job_queue = JobQueue(
+    app,database,Job,
+    handlers={"image":run_image_job,"datatable":run_table_job,"text":run_text_job,"reprocess":run_reprocess_job},
+    max_workers=int(os.environ.get('JOB_WORKERS',2)),
+    max_queued=int(os.environ.get('JOB_QUEUE_MAX',64)),
+)
+# Jobs left queued (or running in a worker that died) are picked up again once the app is ready
+when_ready(app,job_queue.resume)
+when_stopping(app,job_queue.drain)
+
+# Concurrency limits and wait queues per class of endpoint, with a lane kept free for the cheap reads (see admission.py)
+admission.init_app(app,{
+    "V1_add_image":"upload","V1_add_table":"upload","V1_add_text":"upload","V1_reprocess":"upload",
+    "V1_add_table_batch":"textract","V1_add_text_batch":"textract",
+    "V1_export":"bulk","V1_query_tables":"bulk","V1_stats":"bulk",
+})
+
+# Shared by the batch endpoints so the number of Textract calls in flight stays bounded across concurrent requests
+textract_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('TEXTRACT_BATCH_WORKERS',8)),thread_name_prefix="textract")
 
 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! NOTE: START OF RESTful API REQUESTS INSTEAD OF ONLINE DEMO !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
@@ -72,45 +167,109 @@ def authentication_required(function):
         return function(*args,**kwargs)
     return decorator
 
+@app.errorhandler(413)
+@app.errorhandler(UploadTooLarge)
+def upload_too_large(error):
+    return jsonify(response={"Error":"Upload is larger than the configured maximum size."}),413
+
+@app.errorhandler(TextractUnavailable)
+def textract_unavailable(error):
+    # The Textract gateway refused the call (rate limit, outage, retries used up): the client should come back later
+    response = jsonify(response={"Error":str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+@app.errorhandler(QueueFull)
+def job_queue_full(error):
+    response = jsonify(response={"Error":"Too many queued jobs, retry later."})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 @app.route('/v1/')
 def V1_home():
     return render_template("index_v1.html")
 
+# The large extraction payloads are left out of history listings unless explicitly asked for with ?fields=
+HISTORY_FIELDS = [column for column in db_names if column not in ('text_output','data_output','table_files')]
+HISTORY_PAGE_SIZE = 100
+HISTORY_MAX_PAGE_SIZE = 1000
+
+def history(filetype,label):
+    # Keyset pagination: pass the returned next_after_id back as ?after_id= to get the following page
+    try:
+        after_id = int(request.args.get('after_id',0))
+        limit = max(1,min(int(request.args.get('limit',HISTORY_PAGE_SIZE)),HISTORY_MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify(response={"Error":"after_id and limit must be integers."}),400
+    fields = request.args.get('fields')
+    if not fields:
+        columns = HISTORY_FIELDS
+    elif fields == 'all':
+        columns = db_names
+    else:
+        columns = [field.strip() for field in fields.split(',')]
+        unknown = [column for column in columns if column not in db_names]
+        if unknown:
+            return jsonify(response={"Error":f"Unknown fields: {', '.join(unknown)}"}),400
+        if 'id' not in columns:
+            columns = ['id',*columns]
+
+    rows = database.session.execute(
+        database.select(*[getattr(Extract,column) for column in columns])
+        .where(Extract.filetype == filetype, Extract.id > after_id)
+        .order_by(Extract.id)
+        .limit(limit)
+    ).mappings().all()
+    list_of_files = [dict(row) for row in rows]
+    next_after_id = list_of_files[-1]['id'] if len(list_of_files) == limit else None
+    return jsonify({label:list_of_files,"next_after_id":next_after_id})
+
 @app.route('/v1/history_images',methods=['GET'])
 @token_required
 def v1_history_images():
-    result = database.session.execute(database.select(Extract).where(Extract.filetype == "image")).scalars().all()
-    list_of_files = []
-    for file in result:
-        db_values = [getattr(file,column) for column in db_names]
-        dictionary = {key:value for key,value in zip(db_names,db_values)}
-        list_of_files.append(dictionary)
-    print(list_of_files)
-    return jsonify({"All image files":list_of_files})
+    return history("image","All image files")
 
 @app.route('/v1/history_text',methods=['GET'])
 @token_required
 def v1_history_text():
-    result = database.session.execute(database.select(Extract).where(Extract.filetype == "text")).scalars().all()
-    list_of_files = []
-    for file in result:
-        db_values = [getattr(file,column) for column in db_names]
-        dictionary = {key:value for key,value in zip(db_names,db_values)}
-        list_of_files.append(dictionary)
-    print(list_of_files)
-    return jsonify({"All text files":list_of_files})
+    return history("text","All text files")
 
 @app.route('/v1/history_tables',methods=['GET'])
 @token_required
 def v1_history_tables():
-    result = database.session.execute(database.select(Extract).where(Extract.filetype == "datatable")).scalars().all()
-    list_of_files = []
-    for file in result:
-        db_values = [getattr(file,column) for column in db_names]
-        dictionary = {key:value for key,value in zip(db_names,db_values)}
-        list_of_files.append(dictionary)
-    print(list_of_files)
-    return jsonify({"All datatable files":list_of_files})
+    return history("datatable","All datatable files")
+
+@app.route('/v1/export',methods=['GET'])
+@token_required
+def V1_export():
+    # Every row (or only the new and edited ones) as a streamed NDJSON download for downstream syncs (see export.py)
+    try:
+        since_id = int(request.args['since_id']) if request.args.get('since_id') else None
+        since_edit_date = date.fromisoformat(request.args['since_edit_date']) if request.args.get('since_edit_date') else None
+    except ValueError:
+        return jsonify(response={"Error":"since_id must be an integer and since_edit_date a date given as YYYY-MM-DD."}),400
+    include = [field.strip() for field in request.args.get('include','').split(',') if field.strip()]
+    if 'all' in include:
+        include = list(export.OUTPUT_FIELDS)
+    unknown = [field for field in include if field not in export.OUTPUT_FIELDS]
+    if unknown:
+        return jsonify(response={"Error":f"Unknown include fields: {', '.join(unknown)}; use {', '.join(export.OUTPUT_FIELDS)} or all."}),400
+    filetype = request.args.get('filetype')
+    if filetype:
+        metrics.set_filetype(filetype)
+
+    upper_id = export.max_id(database)
+    statement = export.export_statement(database,[*export.BASE_FIELDS,*include],upper_id,filetype=filetype,
+                                        since_id=since_id,since_edit_date=since_edit_date)
+    chunks = export.ndjson_chunks(database,statement)
+    headers = {"X-Export-Max-Id":str(upper_id),"Vary":"Accept-Encoding",
+               "Content-Disposition":"attachment; filename=visionextract-export.ndjson"}
+    if request.accept_encodings['gzip']:
+        chunks = export.gzipped(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return Response(stream_with_context(chunks),mimetype='application/x-ndjson',headers=headers)
 
 @app.route('/v1/find_file',methods=['GET'])
 @token_required
@@ -127,6 +286,80 @@ def v1_find_file():
         print(dictionary)
         return jsonify({f"File found":dictionary}),200
     
+@app.route('/v1/search',methods=['GET'])
+@token_required
+def V1_search():
+    # Ranked full-text search over file names and extracted text/table content
+    query = request.args.get('q','')
+    filetype = request.args.get('filetype')
+    try:
+        limit = max(1,min(int(request.args.get('limit',20)),100))
+        offset = max(0,int(request.args.get('offset',0)))
+    except ValueError:
+        return jsonify(response={"Error":"limit and offset must be integers."}),400
+    if not query.strip():
+        return jsonify(response={"Error":"A search query must be given with ?q="}),400
+    results = search(database,query,filetype=filetype,limit=limit,offset=offset)
+    next_offset = offset + limit if len(results) == limit else None
+    return jsonify({"Results":results,"next_offset":next_offset}),200
+
+@app.route('/v1/tables/query',methods=['POST'])
+@token_required
+def V1_query_tables():
+    # Projection, filters and aggregates over the stored tables of one, some or all data table files (see tables.py)
+    metrics.set_filetype("datatable")
+    body = request.get_json(silent=True) or {}
+    statement = database.select(Extract.id,Extract.table_files).where(Extract.filetype == 'datatable')
+    if body.get('ids'):
+        statement = statement.where(Extract.id.in_(body['ids']))
+    table_index = body.get('table')
+
+    def sources():
+        # Streamed, so only the table list of a few hundred rows is held at a time
+        for row in database.session.execute(statement.order_by(Extract.id).execution_options(yield_per=500)):
+            for table in row.table_files or []:
+                if table_index is None or table['index'] == table_index:
+                    yield row.id,table
+
+    try:
+        limit = max(1,min(int(body.get('limit',100)),10000))
+        result = query_tables(sources(),columns=body.get('columns'),where=body.get('where'),
+                              group_by=body.get('group_by'),aggregate=body.get('aggregate'),limit=limit)
+    except (ValueError,TypeError) as e:
+        return jsonify(response={"Error":str(e)}),400
+    return jsonify(result),200
+
+@app.route('/v1/stats',methods=['GET'])
+@token_required
+def V1_stats():
+    # Storage and processing totals, averages and p50/p95/p99, overall, per file type and per day
+    try:
+        since = date.fromisoformat(request.args['since']) if request.args.get('since') else None
+        until = date.fromisoformat(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify(response={"Error":"since and until must be dates given as YYYY-MM-DD."}),400
+    # Each grouping costs a sorted pass per metric, so callers can ask for only the ones they need
+    groups = [group.strip() for group in request.args.get('group',','.join(GROUPS)).split(',') if group.strip()]
+    unknown = [group for group in groups if group not in GROUPS]
+    if unknown:
+        return jsonify(response={"Error":f"Unknown groups: {', '.join(unknown)}"}),400
+    return jsonify(usage_stats(database,filetype=request.args.get('filetype'),since=since,until=until,groups=groups)),200
+
+@app.route('/v1/admission',methods=['GET'])
+@token_required
+def V1_admission():
+    # Per-process view of the admission lanes and the job queue, for capacity planning
+    return jsonify({"Admission":admission.describe(app),"Job queue":job_queue.describe(),"Textract":gateway_status()}),200
+
+@app.route('/v1/upscale_cache',methods=['GET'])
+@token_required
+def V1_upscale_cache():
+    # Size of the upscale cache and how often uploads were served from it instead of the model
+    upscale_cache = get_upscale_cache()
+    if upscale_cache is None:
+        return jsonify(response={"Error":"The upscale cache is turned off (UPSCALE_CACHE=0)."}),404
+    return jsonify({"Upscale cache":upscale_cache.stats()}),200
+
 # In python, the decorator closest to the function is used first, and the order goes out from there, so second decorator is 
 # the top one, but these two don't conflict anyways so there should be no issues   
 @app.route('/v1/query_image',methods=['GET'])
@@ -145,7 +378,7 @@ def v1_query_image():
         files_match = database.session.execute(database.select(Extract).where(
             and_(
                 Extract.name.ilike(keyword),
-                Extract.date == datetime.strptime(date,"%Y-%m-%d"),
+                Extract.date == datetime.datetime.strptime(date,"%Y-%m-%d").date(),
                 Extract.filetype == "image"
             )
         )).scalars().all()
@@ -175,7 +408,7 @@ def V1_query_text():
         files_match = database.session.execute(database.select(Extract).where(
             and_(
                 Extract.name.ilike(keyword),
-                Extract.date == datetime.strptime(date,"%Y-%m-%d"),
+                Extract.date == datetime.datetime.strptime(date,"%Y-%m-%d").date(),
                 Extract.filetype == "text"
             )
         )).scalars().all()
@@ -205,7 +438,7 @@ def V1_query_table():
         files_match = database.session.execute(database.select(Extract).where(
             and_(
                 Extract.name.ilike(keyword),
-                Extract.date == datetime.strptime(date,"%Y-%m-%d"),
+                Extract.date == datetime.datetime.strptime(date,"%Y-%m-%d").date(),
                 Extract.filetype == "datatable"
             )
         )).scalars().all()
@@ -219,85 +452,145 @@ def V1_query_table():
     else:
         return jsonify({"Error":"No table files found with specified parameters"}),403
     
+def save_upload(upload,keep_bytes=True):
+    # Written once to static/Source/inputs; input/ gets a hardlink to the same file instead of a second copy
+    image_path = os.path.join('input',upload.filename)
+    static_path = os.path.join('static',"Source","inputs",upload.filename)
+    ingested = ingest_upload(upload,static_path,links=[image_path],keep_bytes=keep_bytes)
+    return image_path,static_path,ingested
+
 @app.route('/v1/add_image', methods=['POST'])
 @token_required
 def V1_add_image():
+    metrics.set_filetype("image")
+    job_queue.ensure_room()
     source_images = request.files.getlist('images[]')
-    output_path,input_path = upscale_images(source_images)
-    input_file_paths = [os.path.join(input_path,origin.filename) for origin in source_images]
-    for images,input_file_path in zip(output_path,input_file_paths):
-        filename = os.path.basename(images)
-        new_image=Extract(
-            name=filename,
-            filetype="image",
-            file_location=input_file_path,
-            output_location=images,
-            input_size = os.path.getsize(input_file_path)/1024,
-            output_size = os.path.getsize(images)/1024
-        )
-        database.session.add(new_image)
-        database.session.commit()
-    return jsonify(response={"Success":"New image files have been upscaled 4x and stored in the database."}),200
+    # Checked up front so a bad format is a 400 now rather than a failed job later
+    try:
+        output_format,quality = output_settings(request.form.get('output_format'),request.form.get('quality'))
+    except ValueError as e:
+        return jsonify(response={"Failure":str(e)}),400
+    job_id = uuid.uuid4().hex
+    staging = staging_directory(job_id)
+    try:
+        for image in source_images:
+            ingest_upload(image,os.path.join(staging,image.filename),keep_bytes=False)
+    except UploadTooLarge:
+        shutil.rmtree(staging,ignore_errors=True)
+        raise
+    job_queue.enqueue("image",{"staging":staging,"files":[image.filename for image in source_images],
+                               "output_format":output_format,"quality":quality},job_id=job_id)
+    return jsonify(response={"Success":"Image files have been queued for 4x upscaling.","job_id":job_id,
+                             "status_url":url_for('V1_job',job_id=job_id)}),202
 
 @app.route('/v1/add_table',methods=['POST'])
 @token_required
 def V1_add_table():
+    metrics.set_filetype("datatable")
+    job_queue.ensure_room()
     extract_image = request.files.get('dataextract')
-    image_name = extract_image.filename
-    image_path = os.path.join('input',image_name)
-    static_path = os.path.join('static','Source',"inputs",image_name)
-    extract_image.save(image_path)
-    shutil.copy(image_path,static_path)
-    input_size_kbytes = os.path.getsize(image_path)/1024
-    try:
-        datatable_list = extract_table(image_path)
-    except Exception as e:
-        return jsonify(response={"Failure":"Image could not be processed and data was not extracted"}),400
-    image_name = os.path.splitext(image_name)[0]
-    output_path = os.path.join('output',image_name,f'{image_name}_1.csv')
-    output_size_kbytes = os.path.getsize(output_path)/1024
-
-    new_table = Extract(
-        name=image_name,
-        date=date.today(),
-        filetype = 'datatable',
-        file_location = static_path,
-        output_location = output_path,
-        input_size = input_size_kbytes,
-        output_size = output_size_kbytes,
-        data_output = datatable_list,
-    )
-    database.session.add(new_table)
-    database.session.commit()
-    return jsonify(response={"Success":"New .csv file has been made with the image of the data table provided."}),200
+    image_path,static_path,ingested = save_upload(extract_image,keep_bytes=False)
+    job_id = job_queue.enqueue("datatable",{"image_path":image_path,"static_path":static_path,"sha256":ingested['sha256']})
+    return jsonify(response={"Success":"Image has been queued for data table extraction.","job_id":job_id,
+                             "status_url":url_for('V1_job',job_id=job_id)}),202
 
 @app.route('/v1/add_text',methods=['POST'])
 @token_required
 def V1_add_text():
+    metrics.set_filetype("text")
+    job_queue.ensure_room()
     extract_image = request.files.get('textract')
-    image_name = extract_image.filename
-    image_path = os.path.join('input',image_name)
-    static_path = os.path.join('static',"Source","inputs",image_name)
-    extract_image.save(static_path)
-    shutil.copy(static_path,image_path)
-    input_size_kbytes = os.path.getsize(image_path)/1024
-    text,image_name = extract_text(image_path)
-    output_path = os.path.join('output',f'{image_name}.txt')
-    output_size_kbytes = os.path.getsize(output_path)/1024
+    image_path,static_path,ingested = save_upload(extract_image,keep_bytes=False)
+    job_id = job_queue.enqueue("text",{"image_path":image_path,"static_path":static_path,"sha256":ingested['sha256']})
+    return jsonify(response={"Success":"Image has been queued for text extraction.","job_id":job_id,
+                             "status_url":url_for('V1_job',job_id=job_id)}),202
 
-    new_text = Extract(
-        name=image_name,
-        date=date.today(),
-        filetype = 'text',
-        file_location = static_path,
-        output_location = os.path.join('output',f'{image_name}.txt'),
-        input_size = input_size_kbytes,
-        output_size = output_size_kbytes,
-        data_output = text,
-    )
-    database.session.add(new_text)
-    database.session.commit()
-    return jsonify(response={"Success":"New .txt file has been made with the image of the text provided."}),200
+def timed_build(build_row,image_path,static_path,ingested):
+    start = time.perf_counter()
+    try:
+        row,details = build_row(image_path,static_path,document_bytes=ingested['bytes'],digest=ingested['sha256'])
+    except TextractUnavailable as e:
+        return None,{"error":str(e),"retry_after":e.retry_after,"seconds":round(time.perf_counter() - start,3)}
+    except Exception as e:
+        return None,{"error":f"{type(e).__name__}: {e}","seconds":round(time.perf_counter() - start,3)}
+    details["seconds"] = round(time.perf_counter() - start,3)
+    return row,details
+
+def add_batch(uploads,build_row):
+    # Textract calls for every file run concurrently on the shared pool; rows are written in a single transaction
+    start = time.perf_counter()
+    filenames,pending = [],[]
+    for upload in uploads:
+        filenames.append(upload.filename)
+        try:
+            pending.append(textract_pool.submit(metrics.bind(timed_build),build_row,*save_upload(upload)))
+        except UploadTooLarge as e:
+            pending.append((None,{"error":str(e),"seconds":0.0}))
+    outcomes = [outcome.result() if hasattr(outcome,'result') else outcome for outcome in pending]
+    rows = [row for row,_ in outcomes if row is not None]
+    database.session.add_all(rows)
+    try:
+        database.session.commit()
+    except Exception:
+        # One transaction for the batch: if any row can't be written, none of them are
+        database.session.rollback()
+        raise
+    results = []
+    for filename,(row,details) in zip(filenames,outcomes):
+        if row is not None:
+            details["id"] = row.id
+        results.append({"file":filename,**details})
+    return results,round(time.perf_counter() - start,3)
+
+@app.route('/v1/add_table_batch',methods=['POST'])
+@token_required
+def V1_add_table_batch():
+    metrics.set_filetype("datatable")
+    uploads = request.files.getlist('dataextract[]')
+    if not uploads:
+        return jsonify(response={"Error":"No files were provided in dataextract[]."}),400
+    results,seconds = add_batch(uploads,build_table_row)
+    status = 200 if any("id" in result for result in results) else 400
+    return jsonify(response={"Success":f"Processed {len(results)} data table images.","seconds":seconds,"files":results}),status
+
+@app.route('/v1/add_text_batch',methods=['POST'])
+@token_required
+def V1_add_text_batch():
+    metrics.set_filetype("text")
+    uploads = request.files.getlist('textract[]')
+    if not uploads:
+        return jsonify(response={"Error":"No files were provided in textract[]."}),400
+    results,seconds = add_batch(uploads,build_text_row)
+    status = 200 if any("id" in result for result in results) else 400
+    return jsonify(response={"Success":f"Processed {len(results)} text images.","seconds":seconds,"files":results}),status
+
+@app.route('/v1/reprocess',methods=['POST'])
+@token_required
+def V1_reprocess():
+    # Rebuilds outputs from the stored Textract responses; {"ids": [...]} for selected rows or {"all": true}
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    filetype = data.get('filetype')
+    if not ids and not data.get('all'):
+        return jsonify(response={"Error":"Provide a list of ids, or all: true to reprocess every row."}),400
+    if ids and not (isinstance(ids,list) and all(isinstance(row_id,int) for row_id in ids)):
+        return jsonify(response={"Error":"ids must be a list of integers."}),400
+    if filetype and filetype not in REPROCESSABLE:
+        return jsonify(response={"Error":f"filetype must be one of: {', '.join(REPROCESSABLE)}."}),400
+    workers = data.get('workers')
+    if workers is not None and not (isinstance(workers,int) and workers > 0):
+        return jsonify(response={"Error":"workers must be a positive integer."}),400
+    job_id = job_queue.enqueue("reprocess",{"ids":ids,"filetype":filetype,"workers":workers})
+    return jsonify(response={"Success":"Rows have been queued for reprocessing.","job_id":job_id,
+                             "status_url":url_for('V1_job',job_id=job_id)}),202
+
+@app.route('/v1/jobs/<string:job_id>',methods=['GET'])
+@token_required
+def V1_job(job_id):
+    job = database.session.get(Job,job_id)
+    if job is None:
+        return jsonify(response={"Error":"No job found with that id."}),404
+    return jsonify({"Job":describe(job)}),200
 
 @app.route('/v1/fix/<string:filetype>',methods=['PATCH'])
 @token_required
@@ -321,34 +614,31 @@ def V1_fix(filetype):
 def V1_replace(filetype):
     if filetype == "datatable":
         datatable_replace = request.files.get('file')
-        data = request.get_json()
-        file_id = data.get('id')
+        # The id comes with the multipart upload (a JSON body can't be sent alongside the file)
+        file_id = request.form.get('id') or (request.get_json(silent=True) or {}).get('id')
+        if datatable_replace is None or not file_id:
+            return jsonify(response={"Error":"Send the replacement as 'file' (.csv or .json) together with the 'id'."}),400
 
-        data_to_replace = database.get_or_404(Extract,file_id)
+        data_to_replace = database.get_or_404(Extract,int(file_id))
 
         if data_to_replace.filetype == "datatable":
-            new_save_path = os.path.join(data_to_replace.output_location,"replace_file.csv")
+            extension = '.json' if datatable_replace.filename.lower().endswith('.json') else '.csv'
+            new_save_path = os.path.join(os.path.dirname(data_to_replace.output_location),f"replace_file{extension}")
             datatable_replace.save(new_save_path)
-            new_datatable = Extract(
-                id = data_to_replace.id,
-                name = data_to_replace.name,
-                date = data_to_replace.date,
-                filetype = 'datatable',
-                file_location = data_to_replace.file_location,
-                output_location = data_to_replace.output_location,
-                input_size = data_to_replace.input_size,
-                output_size = os.path.getsize(data_to_replace.output_location)/1024,
-                data_output = (pd.read_csv(new_save_path)).to_json(orient="records"),
-                edit_date = date.today()
-            )
-            # DELETING OLD ENTRY
-            database.session.delete(data_to_replace)
-            database.session.commit()
-            # CREATING NEW ENTRY WITH THE SAME ID
-            database.session.add(new_datatable)
+            try:
+                table_files,data_output = replace_table(read_grid(new_save_path),data_to_replace.output_location,
+                                                        data_to_replace.table_files)
+            except (ValueError,KeyError,TypeError,UnicodeDecodeError) as e:
+                return jsonify(response={"Error":f"The replacement table could not be read: {e}"}),400
+            # The row keeps its id and history; only the table and its derived fields change
+            data_to_replace.table_files = table_files
+            data_to_replace.data_output = data_output
+            data_to_replace.output_size = os.path.getsize(data_to_replace.output_location)/1024
+            data_to_replace.edit_date = date.today()
             database.session.commit()
 
             return jsonify(response={"Success":"Datatable replace successful."}),200
+    return jsonify(response={"Error":"Only datatable files can be replaced."}),400
 
 # FOR DELETE METHODS, INFORMATION IS PASSED THROUGH THE URL    
 @app.route('/v1/delete/<int:id>',methods=['DELETE'])
@@ -362,11 +652,12 @@ def V1_delete(id):
 @app.route('/v1/clear',methods=['DELETE'])
 @authentication_required
 def V1_clear():
-    database.drop_all()
-    database.create_all()
+    reset_table(database,Extract)
+    ensure_fts(database,rebuild=True)
     return jsonify(response={"Success":"Database cleared and reset."}),200
 
 # !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! NOTE: END OF RESTful API REQUESTS INSTEAD OF ONLINE DEMO !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
 
 if __name__ == "__main__":
-    app.run(debug=True,host='0.0.0.0',port=4000)
\ No newline at end of file
+    warm_up(app)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1',host='0.0.0.0',port=4000)
\ No newline at end of file
@@ -0,0 +1,98 @@
+import os
+import hashlib
+import zipfile
+
+from flask import Response, send_file
+from cache import directory_budget, store_file
+from metrics import cache_lookup
+
+# *************************************!!!!!!!!!!!!! ARCHIVE DOWNLOADS !!!!!!!!!!!!!!!!!!!********************************
+# Streams a ZIP of an output folder to the client entry by entry instead of building it in memory first. The archive is
+# written to the on-disk cache at the same time, keyed by the folder's contents (names, sizes and mtimes), so repeat
+# downloads of an unchanged folder are served straight from disk.
+
+CHUNK_SIZE = 256 * 1024
+# Already compressed formats gain nothing from deflate, so they are stored as-is
+STORED_EXTENSIONS = {'.png','.jpg','.jpeg','.gif','.webp','.zip','.gz','.bz2','.xz','.parquet','.mp4'}
+
+def archive_cache_dir():
+    return os.environ.get('ARCHIVE_CACHE_DIR',os.path.join('cache','archives'))
+
+def folder_files(folder):
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        dirs.sort()
+        for filename in sorted(filenames):
+            full_path = os.path.join(root,filename)
+            files.append((full_path,os.path.relpath(full_path,folder)))
+    return files
+
+def folder_signature(files):
+    digest = hashlib.sha256()
+    for full_path,arcname in files:
+        stat = os.stat(full_path)
+        digest.update(f"{arcname}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+class _StreamWriter:
+    # Unseekable file object for ZipFile: collects what it writes for the response and tees it into the cache file
+    def __init__(self,cache_file):
+        self.cache_file = cache_file
+        self.pending = []
+
+    def write(self,data):
+        self.pending.append(bytes(data))
+        self.cache_file.write(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self.pending:
+            data = b''.join(self.pending)
+            self.pending = []
+            yield data
+
+def _stream(files,cache_path):
+    temp_path = f"{cache_path}.{os.getpid()}.{id(files)}.tmp"
+    completed = False
+    try:
+        with open(temp_path,'wb') as cache_file:
+            writer = _StreamWriter(cache_file)
+            with zipfile.ZipFile(writer,'w') as zipf:
+                for full_path,arcname in files:
+                    entry = zipfile.ZipInfo.from_file(full_path,arcname=arcname)
+                    stored = os.path.splitext(full_path)[1].lower() in STORED_EXTENSIONS
+                    entry.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+                    with open(full_path,'rb') as source, zipf.open(entry,'w') as destination:
+                        while chunk := source.read(CHUNK_SIZE):
+                            destination.write(chunk)
+                            yield from writer.drain()
+                    yield from writer.drain()
+            # Closing the archive writes the central directory
+            yield from writer.drain()
+        store_file(temp_path,cache_path,directory_budget(os.path.dirname(cache_path),
+                                                         int(float(os.environ.get('ARCHIVE_CACHE_MAX_MB',512))*1024*1024)))
+        completed = True
+    finally:
+        # A client that disconnects part way leaves no half written archive behind
+        if not completed and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def archive_response(folder,download_name):
+    files = folder_files(folder)
+    cache_dir = archive_cache_dir()
+    os.makedirs(cache_dir,exist_ok=True)
+    cache_path = os.path.abspath(os.path.join(cache_dir,f"{folder_signature(files)}.zip"))
+    cache_lookup('archive',os.path.exists(cache_path))
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+        return send_file(cache_path,mimetype='application/zip',as_attachment=True,download_name=download_name)
+    return Response(
+        _stream(files,cache_path),
+        mimetype='application/zip',
+        headers={"Content-Disposition":f'attachment; filename="{download_name}"'},
+    )
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
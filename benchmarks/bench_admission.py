@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import http.client
+import multiprocessing
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+from bench_serving import API_KEY, seed, free_port, start_server, drive
+
+# *************************************!!!!!!!!!!!!! ADMISSION CONTROL BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Latency of the cheap reads (GET /v1/find_file and /v1/history_images) while other clients flood the API with full
+# exports (GET /v1/export?include=all), with admission control on and off. One gunicorn worker with 4 threads: without
+# admission the exports take every thread and the reads queue behind them; with it, the bulk lane turns the excess away
+# with 429 and the reserved thread keeps serving reads. Reports the reads' p50/p95 and what the flooding clients got.
+# Run from the repository root: python benchmarks/bench_admission.py
+
+READS = ["/v1/find_file?id=1","/v1/history_images?limit=20"]
+FLOOD = "/v1/export?include=all"
+
+def flood(port,duration,results):
+    headers = {"Authorization":f"Bearer {API_KEY}"}
+    statuses = {}
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        connection = http.client.HTTPConnection("127.0.0.1",port,timeout=120)
+        try:
+            connection.request("GET",FLOOD,headers=headers)
+            response = connection.getresponse()
+            response.read()
+            statuses[response.status] = statuses.get(response.status,0) + 1
+            if response.status == 429:
+                time.sleep(0.05) # a well-behaved client would wait Retry-After; keep the pressure on instead
+        except (OSError,http.client.HTTPException):
+            statuses["error"] = statuses.get("error",0) + 1
+        finally:
+            connection.close()
+    results.put(statuses)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--flooders',type=int,default=6,help="client processes requesting exports")
+    parser.add_argument('--duration',type=float,default=8.0)
+    parser.add_argument('--rows',type=int,default=20000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-admission-")
+    try:
+        database_path = os.path.join(workdir,"textract.db")
+        seed(database_path,args.rows)
+        for mode in ("off","on"):
+            os.environ['ADMISSION'] = "1" if mode == "on" else "0"
+            port = free_port()
+            server = start_server(port,1,4,workdir,database_path)
+            try:
+                results = multiprocessing.Queue()
+                flooders = [multiprocessing.Process(target=flood,args=(port,args.duration,results)) for _ in range(args.flooders)]
+                for process in flooders:
+                    process.start()
+                time.sleep(0.5) # let the exports take the threads first
+                reads = drive(port,READS,1,args.duration - 1)
+                statuses = {}
+                for _ in flooders:
+                    for status,count in results.get().items():
+                        statuses[str(status)] = statuses.get(str(status),0) + count
+                for process in flooders:
+                    process.join()
+                print(json.dumps({"admission":mode,"reads":reads,"export_statuses":statuses}),flush=True)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=120)
+    finally:
+        os.environ.pop('ADMISSION',None)
+        shutil.rmtree(workdir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
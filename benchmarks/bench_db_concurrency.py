@@ -0,0 +1,144 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from datetime import date
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import Column, Date, Float, Integer, MetaData, String, Table, create_engine, insert, select
+from db_config import configure_sqlite, engine_options
+
+# *************************************!!!!!!!!!!!!! DATABASE CONCURRENCY BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Mixed workload on an on-disk SQLite file: reader threads page through the image history (the query behind
+# /v1/history_images) while writer threads ingest uploads of several images each. Three setups are compared:
+#   baseline  default journal/synchronous settings, one commit per image (how /add_image used to write)
+#   batched   default settings, one transaction per upload
+#   tuned     one transaction per upload, plus the db_config.py pragmas (WAL, synchronous=NORMAL, busy timeout)
+# Run from the repository root: python benchmarks/bench_db_concurrency.py
+
+metadata = MetaData()
+# The columns of the app's Extract table that this workload touches
+extract = Table(
+    'extract',metadata,
+    Column('id',Integer,primary_key=True),
+    Column('name',String(250),nullable=False,index=True),
+    Column('filetype',String(100),nullable=False,index=True),
+    Column('date',Date,nullable=False,index=True),
+    Column('file_location',String(250),nullable=False),
+    Column('output_location',String(250),nullable=False),
+    Column('input_size',Float,nullable=False),
+    Column('output_size',Float,nullable=False),
+)
+
+def image_row(index):
+    return {"name":f"image_{index}_out.png","filetype":"image","date":date.today(),
+            "file_location":f"static/Source/inputs/image_{index}.png","output_location":f"static/Source/outputs/image_{index}_out.png",
+            "input_size":120.5,"output_size":1480.25}
+
+def make_engine(path,tuned):
+    if tuned:
+        engine = create_engine(f"sqlite:///{path}",**engine_options())
+        configure_sqlite(engine)
+    else:
+        engine = create_engine(f"sqlite:///{path}")
+    return engine
+
+def run(setup,seed_rows,readers,writers,images_per_upload,duration):
+    workdir = tempfile.mkdtemp(prefix="bench-db-")
+    path = os.path.join(workdir,"textract.db")
+    engine = make_engine(path,tuned=(setup == "tuned"))
+    metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(insert(extract),[image_row(index) for index in range(seed_rows)])
+
+    history = (select(extract.c.id,extract.c.name,extract.c.date,extract.c.output_location)
+               .where(extract.c.filetype == 'image').order_by(extract.c.id.desc()).limit(100))
+    stop = threading.Event()
+    lock = threading.Lock()
+    counts = {"reads":0,"uploads":0,"errors":0}
+    read_latencies, write_latencies = [], []
+
+    def reader():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(history).all()
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+                continue
+            with lock:
+                counts["reads"] += 1
+                read_latencies.append(time.perf_counter() - start)
+
+    def writer(offset):
+        index = seed_rows + offset * 1_000_000
+        while not stop.is_set():
+            rows = [image_row(index + n) for n in range(images_per_upload)]
+            index += images_per_upload
+            start = time.perf_counter()
+            try:
+                if setup == "baseline":
+                    for row in rows:
+                        with engine.begin() as connection:
+                            connection.execute(insert(extract),[row])
+                else:
+                    with engine.begin() as connection:
+                        connection.execute(insert(extract),rows)
+            except Exception:
+                with lock:
+                    counts["errors"] += 1
+                continue
+            with lock:
+                counts["uploads"] += 1
+                write_latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer,args=(offset,)) for offset in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    shutil.rmtree(workdir,ignore_errors=True)
+
+    def p95(values):
+        ordered = sorted(values)
+        return round(ordered[int(0.95 * (len(ordered) - 1))] * 1000,3) if ordered else None
+
+    return {
+        "setup":setup,
+        "readers":readers,
+        "writers":writers,
+        "images_per_upload":images_per_upload,
+        "reads_per_second":round(counts["reads"] / duration,1),
+        "uploads_per_second":round(counts["uploads"] / duration,1),
+        "read_p95_ms":p95(read_latencies),
+        "upload_p95_ms":p95(write_latencies),
+        "errors":counts["errors"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seed-rows',type=int,default=20000)
+    parser.add_argument('--readers',type=int,default=4)
+    parser.add_argument('--writers',type=int,default=2)
+    parser.add_argument('--images-per-upload',type=int,default=4)
+    parser.add_argument('--duration',type=float,default=5.0,help="seconds per setup")
+    args = parser.parse_args()
+
+    for setup in ("baseline","batched","tuned"):
+        print(json.dumps(run(setup,args.seed_rows,args.readers,args.writers,args.images_per_upload,args.duration)),flush=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
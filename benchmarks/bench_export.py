@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, jsonify
+from sqlalchemy import insert
+from models import database, Extract, db_names
+import export
+
+# *************************************!!!!!!!!!!!!! BULK EXPORT BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Time, Python peak memory and bytes sent for exporting every row with its text/table output: the /v1/export stream
+# (plain NDJSON and gzipped) against the whole history materialized and sent as one jsonify response, as a sync had to
+# do with the history endpoints. Run for growing history sizes, from the repository root:
+# python benchmarks/bench_export.py --rows 10000 50000
+
+WORDS = ["invoice","total","receipt","amount","patient","report","quarterly","summary","balance","order","tax","date"]
+
+def seed(rows):
+    generator = random.Random(5)
+    start = date(2025,1,1)
+    for offset in range(0,rows,5000):
+        batch = []
+        for index in range(offset,min(rows,offset + 5000)):
+            filetype = ("text","datatable")[index % 2]
+            content = " ".join(generator.choice(WORDS) for _ in range(150))
+            batch.append({"name":f"file_{index}","filetype":filetype,"date":start + timedelta(days=index % 365),
+                          "file_location":"in","output_location":"out","input_size":120.5,"output_size":14.25,
+                          "duration_seconds":0.8,"text_output":content if filetype == "text" else None,
+                          "data_output":[{"Item":word,"Amount":generator.randint(1,900)} for word in content.split()[:40]]
+                                        if filetype == "datatable" else content})
+        database.session.execute(insert(Extract),batch)
+    database.session.commit()
+
+def materialized():
+    # The old way: every row in one list, then one JSON document
+    rows = database.session.execute(database.select(*[getattr(Extract,column) for column in db_names])).mappings().all()
+    return len(jsonify([dict(row) for row in rows]).get_data())
+
+def streamed(compress):
+    def run():
+        columns = [*export.BASE_FIELDS,*export.OUTPUT_FIELDS]
+        chunks = export.ndjson_chunks(database,export.export_statement(database,columns,export.max_id(database)))
+        if compress:
+            chunks = export.gzipped(chunks)
+        return sum(len(chunk) for chunk in chunks)
+    return run
+
+def measure(function):
+    database.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    sent = function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    database.session.rollback()
+    return round(seconds * 1000,1),round(peak / 1024 / 1024,2),round(sent / 1024 / 1024,2)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows',type=int,nargs='+',default=[10000,50000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        workdir = tempfile.mkdtemp(prefix="bench-export-")
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir,'textract.db')}"
+        database.init_app(app)
+        with app.test_request_context():
+            database.create_all()
+            seed(rows)
+            for method,function in (("ndjson",streamed(False)),("ndjson_gzip",streamed(True)),("jsonify_all",materialized)):
+                milliseconds,peak_mb,sent_mb = measure(function)
+                print(json.dumps({"rows":rows,"method":method,"ms":milliseconds,"peak_memory_mb":peak_mb,"sent_mb":sent_mb}),flush=True)
+            database.engine.dispose()
+        shutil.rmtree(workdir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,106 @@
+import io
+import os
+import sys
+import contextlib
+import json
+import time
+import shutil
+import argparse
+import tempfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION','us-east-1')
+# The stub has no quota to respect, so the gateway's rate limits would only measure themselves
+os.environ.setdefault('TEXTRACT_ANALYZE_TPS','0')
+os.environ.setdefault('TEXTRACT_DETECT_TPS','0')
+
+# *************************************!!!!!!!!!!!!! PRE-PROCESSING BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Runs extract_text over the sample images in input/ with the pre-processing stage on and off, against a stubbed
+# Textract client that charges for upload time, and reports payload size and end-to-end latency for both.
+# Run from the repository root: python benchmarks/bench_preprocess.py
+
+def run(images,enabled,client):
+    import cache
+    import methods
+
+    os.environ['TEXTRACT_PREPROCESS'] = '1' if enabled else '0'
+    # A fresh, empty result cache so every document really goes to the (stub) client
+    os.environ['TEXTRACT_CACHE_DIR'] = tempfile.mkdtemp(prefix="bench-cache-")
+    cache._result_cache = None
+    methods.textract = client
+
+    rows = []
+    for path in images:
+        start = time.perf_counter()
+        try:
+            # extract_text prints every document it reads; keep that out of the benchmark output
+            with contextlib.redirect_stdout(io.StringIO()):
+                _,_,info = methods.extract_text(path)
+            error = None
+        except Exception as e:
+            info,error = {"preprocess":None},f"{type(e).__name__}: {e}"
+        rows.append({
+            "image":os.path.basename(path),
+            "seconds":round(time.perf_counter() - start,4),
+            "payload_bytes":info["preprocess"]["bytes"] if info["preprocess"] else os.path.getsize(path),
+            "preprocess_seconds":info["preprocess"]["seconds"] if info["preprocess"] else 0.0,
+            "error":error,
+        })
+    shutil.rmtree(os.environ['TEXTRACT_CACHE_DIR'],ignore_errors=True)
+    return rows
+
+def synthetic_photos(directory,count):
+    # Phone-camera sized images (12MP): noisy photos as JPEG, and one lossless capture that is over Textract's limit
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(0)
+    paths = []
+    for index in range(count):
+        gradient = np.linspace(60,220,4000,dtype=np.float32)[None,:,None]
+        noise = rng.normal(0,18,(3000,4000,3)).astype(np.float32)
+        pixels = np.clip(gradient + noise,0,255).astype(np.uint8)
+        path = os.path.join(directory,f"synthetic_photo_{index}.{'png' if index == 0 else 'jpg'}")
+        Image.fromarray(pixels).save(path,**({} if index == 0 else {"quality":95}))
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency',type=float,default=0.3,help="simulated Textract processing time per call (s)")
+    parser.add_argument('--bandwidth-mbps',type=float,default=20.0,help="simulated upload bandwidth")
+    parser.add_argument('--photos',type=int,default=3,help="synthetic 12MP photos added to the sample images")
+    args = parser.parse_args()
+
+    from stub_textract import StubTextract
+
+    images = sorted(
+        os.path.join(REPO_DIR,'input',name) for name in os.listdir(os.path.join(REPO_DIR,'input'))
+        if name.lower().endswith(('.png','.jpg','.jpeg'))
+    )
+    # methods writes its .txt outputs relative to the working directory, so keep them out of the repository
+    workdir = tempfile.mkdtemp(prefix="bench-preprocess-")
+    os.chdir(workdir)
+    images += synthetic_photos(workdir,args.photos)
+    try:
+        for enabled in (False,True):
+            rows = run(images,enabled,StubTextract(latency=args.latency,bandwidth_mbps=args.bandwidth_mbps))
+            ok = [row for row in rows if row["error"] is None]
+            print(json.dumps({
+                "preprocess":enabled,
+                "images":len(rows),
+                "failed":len(rows) - len(ok),
+                "payload_bytes":sum(row["payload_bytes"] for row in rows),
+                "total_seconds":round(sum(row["seconds"] for row in ok),3),
+                "mean_seconds":round(sum(row["seconds"] for row in ok) / max(1,len(ok)),4),
+                "preprocess_seconds":round(sum(row["preprocess_seconds"] for row in rows),3),
+            }))
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
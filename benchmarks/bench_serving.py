@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import random
+import argparse
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+from datetime import date
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO_DIR)
+
+# *************************************!!!!!!!!!!!!! SERVING LOAD TEST !!!!!!!!!!!!!!!!!!!********************************
+# Starts the API under gunicorn (gunicorn.conf.py / wsgi.py) against a seeded SQLite database and drives it with
+# closed-loop client processes, each on its own keep-alive connection, for every worker count given. Two workloads:
+#   history  GET /v1/history_images, /v1/history_text and /v1/history_tables (keyset pages of 50)
+#   query    GET /v1/search and /v1/query_text
+# Reports requests per second and p50/p95 latency as JSON lines. The client processes share the machine with the
+# server, so keep --clients well below the core count to measure the server rather than the load generator.
+# Run from the repository root: python benchmarks/bench_serving.py --workers 1 2 4
+
+API_KEY = "bench"
+WORDS = ["invoice","total","receipt","amount","patient","report","quarterly","summary","balance","order","tax","date"]
+
+WORKLOADS = {
+    "history":["/v1/history_images?limit=50","/v1/history_text?limit=50","/v1/history_tables?limit=50"],
+    "query":["/v1/search?q=invoice","/v1/search?q=total+amount","/v1/query_text?keyword=%25report%25"],
+}
+
+def seed(path,rows):
+    from sqlalchemy import create_engine, insert
+    from models import database, Extract
+
+    engine = create_engine(f"sqlite:///{path}")
+    database.Model.metadata.create_all(engine)
+    generator = random.Random(7)
+    batch = []
+    for index in range(rows):
+        filetype = ("image","text","datatable")[index % 3]
+        content = " ".join(generator.choice(WORDS) for _ in range(40))
+        batch.append({"name":f"{filetype}_{index}_{generator.choice(WORDS)}","filetype":filetype,"date":date.today(),
+                      "file_location":f"static/Source/inputs/{filetype}_{index}.png",
+                      "output_location":f"static/Source/outputs/{filetype}_{index}.txt",
+                      "input_size":120.5,"output_size":14.25,"duration_seconds":0.8,
+                      "text_output":content if filetype == "text" else None,
+                      "data_output":[[content]] if filetype == "datatable" else content if filetype == "text" else None})
+    with engine.begin() as connection:
+        connection.execute(insert(Extract.__table__),batch)
+    engine.dispose()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1",0))
+        return sock.getsockname()[1]
+
+def start_server(port,workers,threads,workdir,database_path):
+    env = dict(os.environ,PYTHONPATH=REPO_DIR,API_KEY=API_KEY,VISIONEXTRACT_APP="api",
+               GUNICORN_BIND=f"127.0.0.1:{port}",WEB_CONCURRENCY=str(workers),GUNICORN_THREADS=str(threads),
+               DATABASE_URL=f"sqlite:///{database_path}",AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION','us-east-1'))
+    env.pop('GUNICORN_ACCESS_LOG',None)
+    server = subprocess.Popen([sys.executable,"-m","gunicorn","-c",os.path.join(REPO_DIR,"gunicorn.conf.py")],
+                              cwd=workdir,env=env,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1",port,timeout=5)
+            connection.request("GET","/v1/")
+            if connection.getresponse().status == 200:
+                connection.close()
+                return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("gunicorn did not come up")
+
+def client(port,paths,duration,results):
+    headers = {"Authorization":f"Bearer {API_KEY}"}
+    connection = http.client.HTTPConnection("127.0.0.1",port,timeout=30)
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + duration
+    index = 0
+    while time.perf_counter() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            connection.request("GET",path,headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+                continue
+        except (OSError,http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1",port,timeout=30)
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+    results.put((latencies,errors))
+
+def drive(port,paths,clients,duration):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=client,args=(port,paths,duration,results)) for _ in range(clients)]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        client_latencies,client_errors = results.get()
+        latencies += client_latencies
+        errors += client_errors
+    for process in processes:
+        process.join()
+    latencies.sort()
+
+    def percentile(fraction):
+        return round(latencies[int(fraction * (len(latencies) - 1))] * 1000,2) if latencies else None
+
+    return {"requests_per_second":round(len(latencies) / duration,1),"p50_ms":percentile(0.50),"p95_ms":percentile(0.95),"errors":errors}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers',type=int,nargs='+',default=[1,2,4])
+    parser.add_argument('--threads',type=int,default=4,help="threads per worker")
+    parser.add_argument('--clients',type=int,default=4,help="concurrent client processes")
+    parser.add_argument('--duration',type=float,default=5.0,help="seconds per workload")
+    parser.add_argument('--rows',type=int,default=30000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-serving-")
+    try:
+        database_path = os.path.join(workdir,"textract.db")
+        seed(database_path,args.rows)
+        for workers in args.workers:
+            port = free_port()
+            server = start_server(port,workers,args.threads,workdir,database_path)
+            try:
+                for workload,paths in WORKLOADS.items():
+                    drive(port,paths,args.clients,min(1.0,args.duration)) # warm every worker's connections and caches
+                    print(json.dumps({"workers":workers,"threads":args.threads,"clients":args.clients,"workload":workload,
+                                      **drive(port,paths,args.clients,args.duration)}),flush=True)
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=120)
+    finally:
+        shutil.rmtree(workdir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
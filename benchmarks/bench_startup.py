@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# *************************************!!!!!!!!!!!!! START-UP BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Cold start of the app processes: each run is a fresh interpreter that imports main.py or api.py, then serves its
+# first request through the test client (which includes the once-per-process database set-up). Reports the median
+# import time and time to first response, the peak RSS, and which heavy libraries ended up loaded.
+# Run from the repository root: python benchmarks/bench_startup.py   (--repo points it at another checkout)
+
+CHILD = r"""
+import os, sys, time, json, resource
+start = time.perf_counter()
+module = __import__(sys.argv[1])
+imported = time.perf_counter()
+client = module.app.test_client()
+response = client.get(sys.argv[2])
+responded = time.perf_counter()
+print(json.dumps({
+    "import_seconds":imported - start,
+    "first_response_seconds":responded - imported,
+    "status":response.status_code,
+    "max_rss_mb":resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "heavy_modules":[name for name in ("boto3","pandas","numpy","PIL") if name in sys.modules],
+}))
+"""
+
+APPS = [("main","/"),("api","/v1/")]
+
+def run_once(repo,module,path,workdir):
+    env = dict(os.environ,PYTHONPATH=repo,AWS_DEFAULT_REGION=os.environ.get('AWS_DEFAULT_REGION','us-east-1'),
+               DATABASE_URL=f"sqlite:///{os.path.join(workdir,'startup.db')}")
+    result = subprocess.run([sys.executable,"-c",CHILD,module,path],cwd=workdir,env=env,capture_output=True,text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "child failed")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs',type=int,default=5)
+    parser.add_argument('--repo',default=REPO_DIR,help="checkout to measure (e.g. a worktree of an older commit)")
+    args = parser.parse_args()
+
+    for module,path in APPS:
+        runs = []
+        for _ in range(args.runs):
+            # Fresh working directory and database each time, like a newly started worker on a new machine
+            workdir = tempfile.mkdtemp(prefix="bench-startup-")
+            try:
+                runs.append(run_once(os.path.abspath(args.repo),module,path,workdir))
+            finally:
+                shutil.rmtree(workdir,ignore_errors=True)
+        print(json.dumps({
+            "app":module,
+            "runs":len(runs),
+            "import_ms":round(statistics.median(run["import_seconds"] for run in runs) * 1000,1),
+            "first_response_ms":round(statistics.median(run["first_response_seconds"] for run in runs) * 1000,1),
+            "total_ms":round(statistics.median(run["import_seconds"] + run["first_response_seconds"] for run in runs) * 1000,1),
+            "max_rss_mb":round(statistics.median(run["max_rss_mb"] for run in runs),1),
+            "status":runs[-1]["status"],
+            "heavy_modules":runs[-1]["heavy_modules"],
+        }),flush=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
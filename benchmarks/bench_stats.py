@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from datetime import date, timedelta
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import insert
+from models import database, Extract
+from stats import usage_stats
+
+# *************************************!!!!!!!!!!!!! USAGE STATISTICS BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Time and Python peak memory of stats.usage_stats() (everything aggregated by SQLite) against the report done the old
+# way: load every row and sum/sort the sizes in Python. Run for growing history sizes, from the repository root:
+# python benchmarks/bench_stats.py --rows 10000 100000 500000
+
+def seed(rows):
+    generator = random.Random(3)
+    start = date(2025,1,1)
+    for offset in range(0,rows,10000):
+        batch = []
+        for index in range(offset,min(rows,offset + 10000)):
+            batch.append({"name":f"file_{index}","filetype":("image","text","datatable")[index % 3],
+                          "date":start + timedelta(days=index % 365),"file_location":"in","output_location":"out",
+                          "input_size":generator.uniform(10,4000),"output_size":generator.uniform(1,16000),
+                          "duration_seconds":generator.uniform(0.1,30)})
+        database.session.execute(insert(Extract),batch)
+    database.session.commit()
+
+def python_side():
+    # What a report had to do with string sizes: every row into Python, converted and sorted there
+    groups = {}
+    for row in database.session.execute(database.select(Extract)).scalars():
+        groups.setdefault(row.filetype,[]).append(float(row.output_size))
+    return {filetype:{"total":sum(values),"p95":sorted(values)[int(0.95 * (len(values) - 1))]} for filetype,values in groups.items()}
+
+def measure(function):
+    database.session.expunge_all()
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return round(seconds * 1000,1),round(peak / 1024,1)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows',type=int,nargs='+',default=[10000,100000])
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        workdir = tempfile.mkdtemp(prefix="bench-stats-")
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(workdir,'textract.db')}"
+        database.init_app(app)
+        with app.app_context():
+            database.create_all()
+            seed(rows)
+            for method,function in (("sql",lambda: usage_stats(database)),("python",python_side)):
+                milliseconds,peak_kb = measure(function)
+                print(json.dumps({"rows":rows,"method":method,"ms":milliseconds,"peak_memory_kb":peak_kb}),flush=True)
+            database.engine.dispose()
+        shutil.rmtree(workdir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
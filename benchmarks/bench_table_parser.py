@@ -0,0 +1,100 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('AWS_DEFAULT_REGION','us-east-1')
+
+import pandas as pd
+from methods import parse_tables, grid_to_frame
+from synthetic import table_response
+
+# *************************************!!!!!!!!!!!!! TABLE PARSER MICRO-BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Compares the single-pass grid parser in methods.py with the previous dict-of-dicts parser on synthetic AnalyzeDocument
+# responses of growing size. Run from the repository root: python benchmarks/bench_table_parser.py
+
+SIZES = [(1,10,5),(1,50,10),(1,200,20),(4,500,20),(8,1000,25)]
+
+def legacy_parse(response):
+    # The parser extract_table used before the grid rewrite, kept here as the baseline
+    blocks_map = {block['Id']: block for block in response['Blocks']}
+    tables = []
+    for block in response['Blocks']:
+        if block['BlockType'] == 'TABLE':
+            table = []
+            for relationship in block.get('Relationships', []):
+                if relationship['Type'] == 'CHILD':
+                    for cell_id in relationship['Ids']:
+                        cell = blocks_map[cell_id]
+                        if cell['BlockType'] == 'CELL':
+                            row_index = cell['RowIndex']
+                            column_index = cell['ColumnIndex']
+                            cell_text = ''
+                            for rel in cell.get('Relationships', []):
+                                if rel['Type'] == 'CHILD':
+                                    words = [blocks_map[word_id]['Text'] for word_id in rel['Ids'] if blocks_map[word_id]['BlockType'] == 'WORD']
+                                    cell_text = ' '.join(words)
+                            while len(table) < row_index:
+                                table.append({})
+                            table[row_index - 1][column_index] = cell_text
+            tables.append(table)
+    frames = []
+    for table in tables:
+        df_rows = [[row.get(i, '') for i in sorted(row)] for row in table]
+        df = pd.DataFrame(df_rows)
+        df.columns = df.iloc[0]
+        df = df[1:]
+        df.set_index(df.columns[0], inplace=True)
+        frames.append(df)
+    return frames
+
+def grid_parse(response):
+    return [grid_to_frame(grid) for grid in parse_tables(response['Blocks'])]
+
+def best_of(function,response,repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(response)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def peak_memory(function,response):
+    tracemalloc.start()
+    function(response)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat',type=int,default=5)
+    args = parser.parse_args()
+
+    results = []
+    for tables,rows,columns in SIZES:
+        response = table_response(tables=tables,rows=rows,columns=columns)
+        # Both parsers must agree before their timings mean anything
+        for old,new in zip(legacy_parse(response),grid_parse(response)):
+            assert old.to_csv() == new.to_csv()
+        legacy = best_of(legacy_parse,response,args.repeat)
+        grid = best_of(grid_parse,response,args.repeat)
+        results.append({
+            "tables":tables,
+            "cells":tables * rows * columns,
+            "blocks":len(response['Blocks']),
+            "legacy_seconds":round(legacy,6),
+            "grid_seconds":round(grid,6),
+            "speedup":round(legacy / grid,2),
+            "legacy_peak_bytes":peak_memory(legacy_parse,response),
+            "grid_peak_bytes":peak_memory(grid_parse,response),
+        })
+        print(json.dumps(results[-1]))
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tables import store_table, query_tables
+
+# *************************************!!!!!!!!!!!!! STORED TABLE QUERY BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# A filtered count and a grouped sum over many stored tables, run with tables.query_tables() on the Parquet files and
+# by reading every CSV with pandas. Each method runs in a fresh process. Reports the time of a warm run and the peak
+# memory (Python allocations, Arrow's memory pool, process RSS).
+# Run from the repository root: python benchmarks/bench_table_query.py --tables 50 200
+
+ITEMS = ["paper","toner","chairs","desks","laptops","monitors","cables","coffee"]
+
+def make_grid(generator,rows):
+    grid = [["Date","Item","Amount","Qty","Notes"]]
+    for _ in range(rows):
+        grid.append([f"2025-{generator.randint(1,12):02d}-{generator.randint(1,28):02d}",generator.choice(ITEMS),
+                     f"${generator.uniform(1,5000):,.2f}",str(generator.randint(1,40)),"delivered to main office"])
+    return grid
+
+def with_pandas(csv_paths):
+    import pandas as pd
+    filtered, totals = 0, {}
+    for path in csv_paths:
+        frame = pd.read_csv(path)
+        filtered += int((frame["Amount"] > 1000).sum())
+        for item, amount in frame.groupby("Item")["Amount"].sum().items():
+            totals[item] = totals.get(item,0) + amount
+    return filtered, totals
+
+def with_store(sources):
+    filtered = query_tables(sources,where=[["Amount",">",1000]],aggregate={"Amount":["count"]})
+    grouped = query_tables(sources,group_by=["Item"],aggregate={"Amount":["sum"]})
+    return filtered["groups"], grouped["groups"]
+
+def run_method(method,sources,csv_paths,results):
+    # Runs in a fresh process, so the peak RSS and Arrow's pool statistics belong to this method alone
+    import resource
+    import pyarrow as pa
+    function = (lambda: with_store(sources)) if method == "store" else (lambda: with_pandas(csv_paths))
+    function() # warm-up: imports and first file opens
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    function()
+    python_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results.put({"ms":round(seconds * 1000,1),"python_peak_kb":round(python_peak / 1024,1),
+                 "arrow_peak_kb":round(pa.default_memory_pool().max_memory() / 1024,1),
+                 "max_rss_mb":round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,1)})
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tables',type=int,nargs='+',default=[50,200])
+    parser.add_argument('--rows',type=int,default=2000,help="rows per table")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    generator = random.Random(11)
+    for count in args.tables:
+        workdir = tempfile.mkdtemp(prefix="bench-tables-")
+        sources, csv_paths = [], []
+        for index in range(count):
+            csv_path = os.path.join(workdir,f"table_{index}.csv")
+            stored = store_table(make_grid(generator,args.rows),os.path.join(workdir,f"table_{index}.parquet"),csv_path)
+            sources.append((index,{"index":1,**stored}))
+            csv_paths.append(csv_path)
+        for method in ("store","pandas_csv"):
+            results = context.Queue()
+            process = context.Process(target=run_method,args=(method,sources,csv_paths,results))
+            process.start()
+            measured = results.get()
+            process.join()
+            print(json.dumps({"tables":count,"rows_per_table":args.rows,"method":method,**measured}),flush=True)
+        shutil.rmtree(workdir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
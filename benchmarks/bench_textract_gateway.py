@@ -0,0 +1,78 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO_DIR)
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault('AWS_DEFAULT_REGION','us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID','stub')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY','stub')
+
+import stub_textract_server
+
+# *************************************!!!!!!!!!!!!! TEXTRACT GATEWAY BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# Concurrent AnalyzeDocument calls against the local stub server (stub_textract_server.py) through a bare boto3 client
+# with default settings and through textract_gateway.TextractGateway, in two situations:
+#   quota   the stub allows --tps calls per second and throttles the rest
+#   outage  every call fails with InternalServerError
+# Reports calls that succeeded/failed, the throttling responses the server sent, total time and per-call p50/p95.
+# Run from the repository root: python benchmarks/bench_textract_gateway.py
+
+def bare_client(url):
+    import boto3
+    return boto3.client('textract',endpoint_url=url)
+
+def gateway_client(url,tps):
+    os.environ['TEXTRACT_ENDPOINT_URL'] = url
+    os.environ['TEXTRACT_ANALYZE_TPS'] = str(tps)
+    from textract_gateway import TextractGateway, make_client
+    client = make_client()
+    return TextractGateway(lambda: client)
+
+def drive(client,calls,threads):
+    latencies, failures = [], {}
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            client.analyze_document(Document={'Bytes':b'stub document'},FeatureTypes=['TABLES'])
+            return time.perf_counter() - start,None
+        except Exception as e:
+            return time.perf_counter() - start,type(e).__name__
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        for seconds,error in pool.map(one,range(calls)):
+            latencies.append(seconds)
+            if error:
+                failures[error] = failures.get(error,0) + 1
+    total = time.perf_counter() - start
+    latencies.sort()
+    return {"succeeded":calls - sum(failures.values()),"failures":failures,"total_s":round(total,2),
+            "p50_ms":round(latencies[len(latencies) // 2] * 1000,1),"p95_ms":round(latencies[int(0.95 * (len(latencies) - 1))] * 1000,1)}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tps',type=float,default=5)
+    parser.add_argument('--calls',type=int,default=60)
+    parser.add_argument('--threads',type=int,default=12)
+    parser.add_argument('--situations',nargs="+",default=['quota','outage'])
+    args = parser.parse_args()
+
+    for situation in args.situations:
+        for method in ("bare_boto3","gateway"):
+            server,url = stub_textract_server.start(tps=args.tps)
+            server.state.outage = situation == "outage"
+            client = bare_client(url) if method == "bare_boto3" else gateway_client(url,args.tps)
+            result = drive(client,args.calls,args.threads)
+            print(json.dumps({"situation":situation,"method":method,**result,"server":server.state.counts}),flush=True)
+            server.shutdown()
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
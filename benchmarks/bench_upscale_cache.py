@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image
+import upscale_cache
+from upscale_cache import UpscaleCache
+
+# *************************************!!!!!!!!!!!!! UPSCALE CACHE BENCHMARK !!!!!!!!!!!!!!!!!!!********************************
+# What the upscale cache costs per upload, for growing numbers of cached entries: an exact hit (SHA-256 + index
+# lookup), a near-duplicate hit (a JPEG re-saved at another quality, found through the dHash bands) and a miss with
+# similar lookups on. Compare with the seconds a Real-ESRGAN run takes for the same image on your machine.
+# Run from the repository root: python benchmarks/bench_upscale_cache.py --entries 1000 20000
+
+def make_image(generator,path,quality=None):
+    image = Image.new('L',(48,32))
+    image.putdata([generator.randint(0,255) for _ in range(48 * 32)])
+    image = image.resize((960,640),Image.Resampling.BILINEAR).convert('RGB')
+    image.save(path,**({"quality":quality} if quality else {}))
+
+def seed(cache,workdir,entries):
+    # Index rows for random images; they all point at one output file, the lookups never open it
+    generator = random.Random(9)
+    output_path = os.path.join(workdir,"output.png")
+    Image.new('RGB',(8,8)).save(output_path)
+    rows = []
+    for index in range(entries):
+        value = generator.getrandbits(64)
+        rows.append((f"sig-{index:064x}","sig",upscale_cache._signed(value),*upscale_cache._bands(value),960,640,output_path,
+                     os.path.getsize(output_path),0,0))
+    with cache._connect() as connection:
+        connection.executemany("INSERT INTO entries (key, signature, dhash, band0, band1, band2, band3, width, height, path, "
+                               "bytes, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",rows)
+
+def timed(function,runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        result = function()
+    return round((time.perf_counter() - start) / runs * 1000,3),result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--entries',type=int,nargs='+',default=[1000,20000])
+    parser.add_argument('--runs',type=int,default=50)
+    args = parser.parse_args()
+
+    for entries in args.entries:
+        workdir = tempfile.mkdtemp(prefix="bench-upscale-cache-")
+        cache = UpscaleCache(os.path.join(workdir,"cache"),max_bytes=1 << 40,similar=True)
+        seed(cache,workdir,entries)
+        generator = random.Random(entries)
+        original, resaved, unseen = (os.path.join(workdir,name) for name in ("original.jpg","resaved.jpg","unseen.jpg"))
+        make_image(generator,original,quality=95)
+        shutil.copyfile(original,os.path.join(workdir,"copy.jpg"))
+        with Image.open(original) as image:
+            image.save(resaved,quality=75)
+        make_image(generator,unseen,quality=95)
+        cache.store(original,os.path.join(workdir,"output.png"),"sig")
+
+        for lookup,path in (("exact_hit",original),("similar_hit",resaved),("miss",unseen)):
+            milliseconds,(_,result) = timed(lambda: cache.lookup(path,"sig"),args.runs)
+            print(json.dumps({"entries":entries,"lookup":lookup,"result":result,"ms":milliseconds}),flush=True)
+        shutil.rmtree(workdir,ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,150 @@
+import os
+import sys
+import csv
+import gzip
+import json
+import argparse
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION','us-east-1')
+
+from synthetic import _Ids
+
+# *************************************!!!!!!!!!!!!! TEXTRACT RESPONSE FIXTURES !!!!!!!!!!!!!!!!!!!********************************
+# Recorded Textract responses for the sample images in input/, stored as benchmarks/fixtures/<image>.<operation>.json.gz
+# where <operation> is analyze_document (TABLES) or detect_document_text.
+#
+#   python benchmarks/fixtures.py build             rebuilds the fixtures from the results kept in output/ (the CSVs
+#                                                   and .txt files the app wrote for these images), so no AWS account
+#                                                   is needed
+#   python benchmarks/fixtures.py record <image>... calls Textract for real and stores the raw responses instead
+#
+# Rebuilt fixtures have the same block graph Textract returns (PAGE, LINE/WORD, TABLE/CELL/WORD with CHILD
+# relationships); recorded ones are the responses exactly as returned.
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),'fixtures')
+OPERATIONS = ('analyze_document','detect_document_text')
+WORDS_PER_LINE = 8
+
+def fixture_path(image_name,operation):
+    return os.path.join(FIXTURE_DIR,f"{image_name}.{operation}.json.gz")
+
+def save_fixture(image_name,operation,response):
+    os.makedirs(FIXTURE_DIR,exist_ok=True)
+    # mtime=0 keeps the files byte-identical between rebuilds
+    with open(fixture_path(image_name,operation),'wb') as raw, gzip.GzipFile(fileobj=raw,mode='wb',mtime=0) as newfile:
+        newfile.write(json.dumps(response,separators=(',',':')).encode())
+
+def load_fixtures(input_dir=os.path.join(REPO_DIR,'input')):
+    # [{"image": path in input/, "operation": ..., "response": ...}] for every fixture whose image exists
+    fixtures = []
+    for filename in sorted(os.listdir(FIXTURE_DIR)) if os.path.isdir(FIXTURE_DIR) else []:
+        if not filename.endswith('.json.gz'):
+            continue
+        image_name,operation = filename[:-len('.json.gz')].rsplit('.',1)
+        image_path = os.path.join(input_dir,image_name)
+        if operation not in OPERATIONS or not os.path.isfile(image_path):
+            continue
+        with gzip.open(os.path.join(FIXTURE_DIR,filename),'rb') as newfile:
+            fixtures.append({"image":image_path,"operation":operation,"response":json.loads(newfile.read())})
+    return fixtures
+
+def table_response_from_grids(grids):
+    new_id = _Ids()
+    blocks = [{"Id":new_id("page"),"BlockType":"PAGE"}]
+    for grid in grids:
+        cell_ids = []
+        cell_blocks = []
+        for row_index,row in enumerate(grid,start=1):
+            for column_index,value in enumerate(row,start=1):
+                word_ids = []
+                for word in value.split():
+                    word_ids.append(new_id("word"))
+                    blocks.append({"Id":word_ids[-1],"BlockType":"WORD","Text":word,"Confidence":99.0})
+                cell_ids.append(new_id("cell"))
+                cell = {"Id":cell_ids[-1],"BlockType":"CELL","RowIndex":row_index,"ColumnIndex":column_index,
+                        "RowSpan":1,"ColumnSpan":1,"Confidence":95.0}
+                if word_ids:
+                    cell["Relationships"] = [{"Type":"CHILD","Ids":word_ids}]
+                cell_blocks.append(cell)
+        blocks.append({"Id":new_id("table"),"BlockType":"TABLE","Relationships":[{"Type":"CHILD","Ids":cell_ids}]})
+        blocks.extend(cell_blocks)
+    return {"Blocks":blocks}
+
+def text_response_from_text(text):
+    # The .txt outputs are the LINE texts joined by spaces, so the line breaks are gone; lines are re-cut every few words
+    new_id = _Ids()
+    blocks = [{"Id":new_id("page"),"BlockType":"PAGE"}]
+    words = text.split()
+    for start in range(0,len(words),WORDS_PER_LINE):
+        line = words[start:start + WORDS_PER_LINE]
+        word_ids = [new_id("word") for _ in line]
+        blocks.append({"Id":new_id("line"),"BlockType":"LINE","Text":" ".join(line),"Relationships":[{"Type":"CHILD","Ids":word_ids}]})
+        blocks.extend({"Id":word_id,"BlockType":"WORD","Text":word} for word_id,word in zip(word_ids,line))
+    return {"Blocks":blocks}
+
+def read_grid(csv_path):
+    with open(csv_path,newline='') as newfile:
+        rows = list(csv.reader(newfile))
+    width = max((len(row) for row in rows),default=0)
+    return [row + [''] * (width - len(row)) for row in rows]
+
+def build(input_dir,output_dir):
+    built = []
+    for image_name in sorted(os.listdir(input_dir)):
+        stem = os.path.splitext(image_name)[0]
+        table_dir = os.path.join(output_dir,stem)
+        if os.path.isdir(table_dir):
+            csv_files = sorted(
+                (name for name in os.listdir(table_dir) if name.endswith('.csv')),
+                key=lambda name: int(name.rsplit('_',1)[-1][:-4]) if name.rsplit('_',1)[-1][:-4].isdigit() else 0,
+            )
+            grids = [read_grid(os.path.join(table_dir,name)) for name in csv_files]
+            if grids:
+                save_fixture(image_name,'analyze_document',table_response_from_grids(grids))
+                built.append({"image":image_name,"operation":"analyze_document","tables":len(grids)})
+        text_path = os.path.join(output_dir,f"{stem}.txt")
+        if os.path.isfile(text_path):
+            with open(text_path) as newfile:
+                save_fixture(image_name,'detect_document_text',text_response_from_text(newfile.read()))
+            built.append({"image":image_name,"operation":"detect_document_text"})
+    return built
+
+def record(image_paths,operations):
+    import boto3
+
+    client = boto3.client('textract')
+    for image_path in image_paths:
+        with open(image_path,'rb') as newfile:
+            document = {'Bytes':newfile.read()}
+        for operation in operations:
+            if operation == 'analyze_document':
+                response = client.analyze_document(Document=document,FeatureTypes=['TABLES'])
+            else:
+                response = client.detect_document_text(Document=document)
+            response.pop('ResponseMetadata',None)
+            save_fixture(os.path.basename(image_path),operation,response)
+            print(json.dumps({"image":os.path.basename(image_path),"operation":operation,"blocks":len(response['Blocks'])}))
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command',required=True)
+    build_parser = commands.add_parser('build')
+    build_parser.add_argument('--input-dir',default=os.path.join(REPO_DIR,'input'))
+    build_parser.add_argument('--output-dir',default=os.path.join(REPO_DIR,'output'))
+    record_parser = commands.add_parser('record')
+    record_parser.add_argument('images',nargs='+')
+    record_parser.add_argument('--operation',choices=OPERATIONS,action='append')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        for row in build(args.input_dir,args.output_dir):
+            print(json.dumps(row))
+    else:
+        record(args.images,args.operation or OPERATIONS)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO_DIR)
+os.environ.setdefault('AWS_DEFAULT_REGION','us-east-1')
+# The stub has no quota to respect, so the gateway's rate limits would only measure themselves
+os.environ.setdefault('TEXTRACT_ANALYZE_TPS','0')
+os.environ.setdefault('TEXTRACT_DETECT_TPS','0')
+
+from fixtures import load_fixtures
+from stub_textract import StubTextract
+from synthetic import table_response, text_response
+
+# *************************************!!!!!!!!!!!!! OFFLINE BENCHMARK SUITE !!!!!!!!!!!!!!!!!!!********************************
+# Runs extract_table / extract_text end to end (pre-processing, result cache, block parsing, pandas, CSV and text
+# writes) against a stub Textract client. The stub answers with the recorded fixtures for the sample images in input/
+# (see fixtures.py) and with synthetic responses scaled well past them. Nothing leaves the machine.
+#
+# Every scenario reports documents/second, latency percentiles and the peak traced memory of a single pass, one JSON
+# object per line. --output saves the whole run; --compare checks it against a saved run and exits with status 1 when a
+# scenario got slower by more than --threshold.
+#
+#   python benchmarks/run.py --output before.json
+#   python benchmarks/run.py --compare before.json
+
+SYNTHETIC_TABLES = [(1,50,10),(4,500,20),(8,2000,25)]
+SYNTHETIC_TEXT = [200,5000]
+
+class _NoCache:
+    # Stands in for the result cache in "cold" runs so every document goes through Textract and the parser
+    def get(self,key):
+        return None
+
+    def set(self,key,value):
+        pass
+
+def percentile(values,fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1,max(0,round(fraction * len(ordered) + 0.5) - 1))]
+
+def scenarios(workdir):
+    # (name, operation, [(document path, response)]); synthetic documents are small placeholder files
+    recorded = load_fixtures()
+    found = []
+    for operation,name in (('analyze_document','recorded_tables'),('detect_document_text','recorded_text')):
+        documents = [(fixture["image"],fixture["response"]) for fixture in recorded if fixture["operation"] == operation]
+        if documents:
+            found.append((name,operation,documents))
+
+    def placeholder(name):
+        path = os.path.join(workdir,'documents',f"{name}.bin")
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'wb') as newfile:
+            newfile.write(name.encode())
+        return path
+
+    for tables,rows,columns in SYNTHETIC_TABLES:
+        name = f"synthetic_tables_{tables}x{rows}x{columns}"
+        found.append((name,'analyze_document',[(placeholder(name),table_response(tables,rows,columns))]))
+    for lines in SYNTHETIC_TEXT:
+        name = f"synthetic_text_{lines}_lines"
+        found.append((name,'detect_document_text',[(placeholder(name),text_response(lines))]))
+    return found
+
+def run_scenario(name,operation,documents,iterations,cached,latency):
+    import cache
+    import methods
+    from preprocess import preprocess_document
+
+    # The stub is keyed by the payload Textract would really receive, i.e. after pre-processing
+    responses = {}
+    for path,response in documents:
+        with open(path,'rb') as newfile:
+            responses[preprocess_document(newfile.read())[0]] = response
+    methods.textract = StubTextract(latency=latency,responses=responses,sleep=latency > 0)
+    extract = methods.extract_table if operation == 'analyze_document' else methods.extract_text
+
+    if cached:
+        os.environ['TEXTRACT_CACHE_DIR'] = tempfile.mkdtemp(prefix="bench-cache-",dir=os.getcwd())
+        cache._result_cache = None
+    else:
+        cache._result_cache = _NoCache()
+
+    errors = {}
+    def one_pass(latencies=None):
+        for path,_ in documents:
+            start = time.perf_counter()
+            try:
+                extract(path)
+            except Exception as e:
+                # A document the pipeline cannot handle is reported, not timed
+                errors[os.path.basename(path)] = f"{type(e).__name__}: {e}"
+                continue
+            if latencies is not None:
+                latencies.append(time.perf_counter() - start)
+
+    # extract_text prints every document it reads; keep that out of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        # Warm-up pass (imports, first allocations, and filling the cache for cached runs)
+        one_pass()
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(iterations):
+            one_pass(latencies)
+        elapsed = time.perf_counter() - start
+        # Memory is measured on a separate pass, since tracing slows everything down
+        tracemalloc.start()
+        one_pass()
+        _,peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    if not latencies:
+        return {"scenario":name,"cache":"warm" if cached else "cold","documents":len(documents),"errors":errors}
+    return {
+        "scenario":name,
+        "cache":"warm" if cached else "cold",
+        "documents":len(documents),
+        "iterations":iterations,
+        "docs_per_second":round(len(latencies) / elapsed,2),
+        "p50_ms":round(percentile(latencies,0.50) * 1000,3),
+        "p95_ms":round(percentile(latencies,0.95) * 1000,3),
+        "p99_ms":round(percentile(latencies,0.99) * 1000,3),
+        "max_ms":round(max(latencies) * 1000,3),
+        "peak_memory_kb":round(peak / 1024,1),
+        "textract_calls":methods.textract.calls,
+        "errors":errors,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(['git','rev-parse','--short','HEAD'],cwd=REPO_DIR,capture_output=True,text=True,check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results,baseline_path,threshold):
+    with open(baseline_path) as newfile:
+        baseline = {(row["scenario"],row["cache"]):row for row in json.load(newfile)["results"]}
+    regressions = 0
+    for row in results:
+        before = baseline.get((row["scenario"],row["cache"]))
+        if before is None or "p50_ms" not in row or "p50_ms" not in before:
+            continue
+        change = {
+            "p50":row["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0,
+            "p95":row["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0,
+            "peak_memory":row["peak_memory_kb"] / before["peak_memory_kb"] - 1 if before["peak_memory_kb"] else 0.0,
+        }
+        regressed = [metric for metric,value in change.items() if value > threshold]
+        regressions += bool(regressed)
+        print(json.dumps({"compare":row["scenario"],"cache":row["cache"],
+                          **{f"{metric}_change":round(value,3) for metric,value in change.items()},"regressed":regressed}))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--iterations',type=int,default=10,help="timed passes over each scenario's documents")
+    parser.add_argument('--latency',type=float,default=0.0,help="simulated Textract time per call (s); 0 measures local work only")
+    parser.add_argument('--only',help="run only the scenarios whose name contains this")
+    parser.add_argument('--output',help="write the full run as JSON to this file")
+    parser.add_argument('--compare',help="JSON file from an earlier --output run to compare against")
+    parser.add_argument('--threshold',type=float,default=0.2,help="relative slowdown (or memory growth) counted as a regression")
+    args = parser.parse_args()
+
+    # methods writes its CSV/text outputs relative to the working directory, so keep them out of the repository
+    workdir = tempfile.mkdtemp(prefix="bench-suite-")
+    os.chdir(workdir)
+    results = []
+    try:
+        for name,operation,documents in scenarios(workdir):
+            if args.only and args.only not in name:
+                continue
+            for cached in (False,True):
+                row = run_scenario(name,operation,documents,args.iterations,cached,args.latency)
+                results.append(row)
+                print(json.dumps(row),flush=True)
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir,ignore_errors=True)
+
+    if args.output:
+        with open(args.output,'w') as newfile:
+            json.dump({
+                "commit":git_commit(),
+                "python":platform.python_version(),
+                "platform":platform.platform(),
+                "iterations":args.iterations,
+                "latency":args.latency,
+                "results":results,
+            },newfile,indent=2)
+    if args.compare:
+        sys.exit(1 if compare(results,args.compare,args.threshold) else 0)
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,46 @@
+import time
+import threading
+
+from synthetic import table_response, text_response
+
+# *************************************!!!!!!!!!!!!! STUB TEXTRACT CLIENT !!!!!!!!!!!!!!!!!!!********************************
+# Stands in for boto3.client('textract') in benchmarks. It models the two costs that matter for a synchronous call,
+# uploading the payload and the service's own processing time, and enforces Textract's 10MB synchronous byte limit.
+
+SYNC_BYTES_LIMIT = 10 * 1024 * 1024
+
+class DocumentTooLarge(Exception):
+    pass
+
+class StubTextract:
+    def __init__(self,latency=0.3,bandwidth_mbps=20.0,responses=None,sleep=True):
+        self.latency = latency
+        self.bytes_per_second = bandwidth_mbps * 1_000_000 / 8
+        # responses maps the exact payload bytes to a recorded response; anything else gets a synthetic one
+        self.responses = responses or {}
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.payload_bytes = 0
+
+    def _call(self,document):
+        payload = document['Bytes']
+        with self.lock:
+            self.calls += 1
+            self.payload_bytes += len(payload)
+        if len(payload) > SYNC_BYTES_LIMIT:
+            raise DocumentTooLarge(f"Document of {len(payload)} bytes is over the synchronous limit")
+        simulated = self.latency + len(payload) / self.bytes_per_second
+        if self.sleep:
+            time.sleep(simulated)
+        return simulated
+
+    def detect_document_text(self,Document):
+        self._call(Document)
+        return self.responses.get(Document['Bytes']) or text_response()
+
+    def analyze_document(self,Document,FeatureTypes):
+        self._call(Document)
+        return self.responses.get(Document['Bytes']) or table_response()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
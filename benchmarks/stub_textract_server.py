@@ -0,0 +1,106 @@
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0,os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic import table_response, text_response
+
+# *************************************!!!!!!!!!!!!! STUB TEXTRACT SERVER !!!!!!!!!!!!!!!!!!!********************************
+# A local HTTP server that speaks Textract's JSON protocol for AnalyzeDocument and DetectDocumentText, so the real boto3
+# client (and the gateway in textract_gateway.py) can be exercised without AWS. Point the app at it with
+# TEXTRACT_ENDPOINT_URL=http://127.0.0.1:<port> and any AWS credentials. It enforces a per-operation TPS quota
+# (ProvisionedThroughputExceededException past it) and can simulate an outage (InternalServerError on every call).
+# Run on its own: python benchmarks/stub_textract_server.py --port 8900 --tps 5
+
+TARGETS = {"Textract.AnalyzeDocument":table_response,"Textract.DetectDocumentText":text_response}
+
+class StubState:
+    def __init__(self,tps,latency):
+        self.tps = tps
+        self.latency = latency
+        self.outage = False
+        self.lock = threading.Lock()
+        self.windows = {}
+        self.counts = {"ok":0,"throttled":0,"failed":0}
+
+    def admit(self,target):
+        # At most tps calls per operation in any one-second window, like the service quota
+        if not self.tps:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            window = [stamp for stamp in self.windows.get(target,[]) if now - stamp < 1]
+            allowed = len(window) < self.tps
+            if allowed:
+                window.append(now)
+            self.windows[target] = window
+            return allowed
+
+    def count(self,outcome):
+        with self.lock:
+            self.counts[outcome] += 1
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self,format,*args):
+        pass
+
+    def _send(self,status,body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type","application/x-amz-json-1.1")
+        self.send_header("Content-Length",str(len(data)))
+        self.send_header("x-amzn-RequestId","stub")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.server.state
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length",0))) or b"{}")
+        target = self.headers.get("X-Amz-Target","")
+        if target not in TARGETS:
+            return self._send(400,{"__type":"UnknownOperationException","message":target})
+        if state.outage:
+            state.count("failed")
+            return self._send(500,{"__type":"InternalServerError","message":"Simulated outage"})
+        if not state.admit(target):
+            state.count("throttled")
+            return self._send(400,{"__type":"ProvisionedThroughputExceededException","message":"Rate exceeded"})
+        base64.b64decode(body.get("Document",{}).get("Bytes",""))
+        time.sleep(state.latency)
+        state.count("ok")
+        self._send(200,TARGETS[target]())
+
+def start(port=0,tps=5,latency=0.05):
+    # Serves on a background thread; returns the server (server.state holds the counters and the outage switch) and its URL
+    server = ThreadingHTTPServer(("127.0.0.1",port),Handler)
+    server.daemon_threads = True
+    server.state = StubState(tps,latency)
+    threading.Thread(target=server.serve_forever,name="stub-textract",daemon=True).start()
+    return server,f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port',type=int,default=8900)
+    parser.add_argument('--tps',type=float,default=5,help="quota per operation, 0 for none")
+    parser.add_argument('--latency',type=float,default=0.05)
+    args = parser.parse_args()
+    server,url = start(args.port,args.tps,args.latency)
+    print(f"Stub Textract listening on {url}",flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,60 @@
+import random
+
+# *************************************!!!!!!!!!!!!! SYNTHETIC TEXTRACT RESPONSES !!!!!!!!!!!!!!!!!!!********************************
+# Builds Textract-shaped responses (the same block graph AnalyzeDocument / DetectDocumentText return) of any size,
+# so the parsing code can be benchmarked without an AWS account.
+
+WORDS = ["Patient","Score","Baseline","Week","Mean","SD","p-value","Group","Control","Total","0.05","12.4","n=30","Yes","No"]
+
+class _Ids:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self,prefix):
+        self.count += 1
+        return f"{prefix}-{self.count:08d}"
+
+def table_response(tables=1,rows=10,columns=5,words_per_cell=2,seed=0):
+    rng = random.Random(seed)
+    new_id = _Ids()
+    word_blocks, table_blocks = [], []
+    for _ in range(tables):
+        table_id = new_id("table")
+        cell_ids = []
+        cell_blocks = []
+        for row in range(1,rows + 1):
+            for column in range(1,columns + 1):
+                cell_id = new_id("cell")
+                word_ids = []
+                if row == 1:
+                    # Header cells are unique so the first row can be used as column labels
+                    word_id = new_id("word")
+                    word_ids.append(word_id)
+                    word_blocks.append({"Id":word_id,"BlockType":"WORD","Text":f"Column{column}","Confidence":99.0})
+                for _ in range(0 if row == 1 else rng.randint(1,words_per_cell)):
+                    word_id = new_id("word")
+                    word_ids.append(word_id)
+                    word_blocks.append({"Id":word_id,"BlockType":"WORD","Text":rng.choice(WORDS),"Confidence":99.0})
+                cell_blocks.append({
+                    "Id":cell_id,"BlockType":"CELL","RowIndex":row,"ColumnIndex":column,"RowSpan":1,"ColumnSpan":1,
+                    "Confidence":95.0,"Relationships":[{"Type":"CHILD","Ids":word_ids}],
+                })
+                cell_ids.append(cell_id)
+        # Textract does not promise any particular order for the cells of a table
+        rng.shuffle(cell_ids)
+        table_blocks.append({"Id":table_id,"BlockType":"TABLE","Relationships":[{"Type":"CHILD","Ids":cell_ids}]})
+        table_blocks.extend(cell_blocks)
+    return {"Blocks":[{"Id":new_id("page"),"BlockType":"PAGE"}] + word_blocks + table_blocks}
+
+def text_response(lines=50,words_per_line=8,seed=0):
+    rng = random.Random(seed)
+    new_id = _Ids()
+    blocks = [{"Id":new_id("page"),"BlockType":"PAGE"}]
+    for _ in range(lines):
+        words = [rng.choice(WORDS) for _ in range(words_per_line)]
+        word_ids = [new_id("word") for _ in words]
+        blocks.append({"Id":new_id("line"),"BlockType":"LINE","Text":" ".join(words),"Relationships":[{"Type":"CHILD","Ids":word_ids}]})
+        blocks.extend({"Id":word_id,"BlockType":"WORD","Text":word} for word_id,word in zip(word_ids,words))
+    return {"Blocks":blocks}
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
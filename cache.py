@@ -0,0 +1,151 @@
+import os
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+# *************************************!!!!!!!!!!!!! RESULT CACHE !!!!!!!!!!!!!!!!!!!********************************
+# Content-addressed, on-disk cache for extraction results. Entries are keyed by the SHA-256 of the document bytes plus
+# the Textract feature type, so re-uploading the same image (under any filename) skips the network round trip.
+
+def document_key(document_bytes,feature,digest=None):
+    # The SHA-256 can be passed in when it was already computed while the upload was being stored
+    digest = digest or hashlib.sha256(document_bytes).hexdigest()
+    return f"{feature.lower()}-{digest}"
+
+# A directory is only walked when a write takes it past its cap, and then pruned to this share of the cap, so the walk
+# happens once per many writes rather than on every one
+PRUNE_TO = 0.9
+# Writes between walks regardless of the cap, which expire old entries and count what other processes wrote
+RESCAN_WRITES = int(os.environ.get('CACHE_RESCAN_WRITES',100))
+
+def prune_directory(directory,max_bytes,max_age=None,target=None):
+    # Drops files older than max_age seconds, then the least recently used files until the directory holds no more
+    # than target bytes (max_bytes by default). Returns the bytes left
+    target = max_bytes if target is None else target
+    entries = []
+    now = time.time()
+    for root, dirs, files in os.walk(directory):
+        for file in files:
+            path = os.path.join(root,file)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if max_age is not None and now - stat.st_mtime > max_age:
+                _remove(path)
+                continue
+            entries.append((stat.st_atime,stat.st_size,path))
+    total = sum(size for _,size,_ in entries)
+    for _,size,path in sorted(entries):
+        if total <= target:
+            break
+        _remove(path)
+        total -= size
+    return total
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+class DirectoryBudget:
+    # Keeps a cache directory under max_bytes without walking it on every write. The directory is walked once to count
+    # its size, and each write then adds its bytes (less those of the file it replaced) to the running total. Only a
+    # write that takes the total past max_bytes, or every RESCAN_WRITES writes, walks and prunes it again.
+    def __init__(self,directory,max_bytes,max_age=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.total = None
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def added(self,size,replaced=0):
+        with self.lock:
+            self.writes += 1
+            if self.total is not None:
+                self.total += size - replaced
+            if self.total is None or self.total > self.max_bytes or self.writes >= RESCAN_WRITES:
+                self.total = prune_directory(self.directory,self.max_bytes,self.max_age,target=int(self.max_bytes * PRUNE_TO))
+                self.writes = 0
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+def directory_budget(directory,max_bytes,max_age=None):
+    # One budget per cache directory and process, shared by every writer to it; the latest limits apply
+    key = os.path.abspath(directory)
+    with _budgets_lock:
+        budget = _budgets.get(key)
+        if budget is None:
+            budget = _budgets[key] = DirectoryBudget(directory,max_bytes,max_age)
+    with budget.lock:
+        budget.max_bytes, budget.max_age = max_bytes, max_age
+    return budget
+
+def store_file(temp_path,path,budget):
+    # Moves a finished file into a cache directory and accounts for it
+    replaced = _size(path)
+    os.replace(temp_path,path)
+    budget.added(_size(path),replaced)
+
+class ResultCache:
+    def __init__(self,directory,max_bytes,max_age):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.budget = directory_budget(directory,max_bytes,max_age)
+        os.makedirs(directory,exist_ok=True)
+
+    def _path(self,key):
+        return os.path.join(self.directory,key[-2:],f"{key}.json")
+
+    def get(self,key):
+        path = self._path(key)
+        try:
+            with open(path,mode='r',encoding='utf-8') as cached:
+                entry = json.load(cached)
+        except (FileNotFoundError, ValueError):
+            return None
+        if time.time() - entry['created'] > self.max_age:
+            _remove(path)
+            return None
+        # Bump the access time so eviction treats this entry as recently used
+        try:
+            os.utime(path,(time.time(),os.stat(path).st_mtime))
+        except FileNotFoundError:
+            pass # pruned since it was read; the entry is still a hit
+        return entry['value']
+
+    def set(self,key,value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        # Write to a temporary file first so concurrent readers never see a half written entry
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),suffix='.tmp')
+        with os.fdopen(handle,mode='w',encoding='utf-8') as newfile:
+            json.dump({"created":time.time(),"value":value},newfile)
+        store_file(temp_path,path,self.budget)
+
+_result_cache = None
+
+def get_result_cache():
+    # Built on first use so settings from .env are picked up regardless of import order
+    global _result_cache
+    if _result_cache is None:
+        _result_cache = ResultCache(
+            directory=os.environ.get('TEXTRACT_CACHE_DIR',os.path.join('cache','textract')),
+            max_bytes=int(float(os.environ.get('TEXTRACT_CACHE_MAX_MB',256))*1024*1024),
+            max_age=float(os.environ.get('TEXTRACT_CACHE_MAX_AGE_DAYS',30))*24*60*60,
+        )
+    return _result_cache
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,58 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# *************************************!!!!!!!!!!!!! SQLITE CONFIGURATION !!!!!!!!!!!!!!!!!!!********************************
+# Sets SQLite up for a web app with several threads (requests, background jobs, batch workers) sharing one file:
+#
+# SQLITE_JOURNAL_MODE     WAL by default, so readers never block the writer and the writer never blocks readers
+# SQLITE_SYNCHRONOUS      NORMAL by default; with WAL this is still crash safe, only the last commits before a power
+#                         loss can be lost, and it saves an fsync on every commit
+# SQLITE_BUSY_TIMEOUT_MS  how long a connection waits for the write lock before "database is locked" (default 5000)
+# SQLITE_POOL_SIZE        connections kept open in the pool (default 10)
+# SQLITE_MAX_OVERFLOW     extra connections allowed under load (default 20)
+# SQLITE_POOL_TIMEOUT     seconds to wait for a free connection (default 30)
+
+def database_url():
+    # DATABASE_URL as the apps read it; a relative SQLite path is relative to the instance folder
+    return os.environ.get('DATABASE_URL','sqlite:///textract.db')
+
+def resolve_database_url(url,instance_path):
+    # Flask-SQLAlchemy puts relative SQLite paths in the app's instance folder; code outside an app (the reprocess CLI)
+    # resolves them the same way so it opens the same file
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database not in (None,'',':memory:') and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(instance_path,url.database))
+    return url
+
+def sqlite_settings():
+    return {
+        "journal_mode":os.environ.get('SQLITE_JOURNAL_MODE','WAL'),
+        "synchronous":os.environ.get('SQLITE_SYNCHRONOUS','NORMAL'),
+        "busy_timeout":int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS',5000)),
+    }
+
+def engine_options():
+    # Goes into SQLALCHEMY_ENGINE_OPTIONS, which has to be set before database.init_app(app)
+    return {
+        "pool_size":int(os.environ.get('SQLITE_POOL_SIZE',10)),
+        "max_overflow":int(os.environ.get('SQLITE_MAX_OVERFLOW',20)),
+        "pool_timeout":float(os.environ.get('SQLITE_POOL_TIMEOUT',30)),
+    }
+
+def configure_sqlite(engine,settings=None):
+    # Applied to every new connection; journal_mode=WAL is stored in the database file, the rest is per connection
+    if engine.dialect.name != 'sqlite':
+        return
+    settings = settings or sqlite_settings()
+
+    @event.listens_for(engine,'connect')
+    def set_sqlite_pragmas(dbapi_connection,connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={settings['synchronous']}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings['busy_timeout'])}")
+        cursor.close()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,52 @@
+import os
+import hashlib
+
+from cache import directory_budget, store_file
+from metrics import cache_lookup
+
+# *************************************!!!!!!!!!!!!! IMAGE DERIVATIVES !!!!!!!!!!!!!!!!!!!********************************
+# Thumbnails and previews of stored images, made the first time they are requested and kept in an on-disk cache
+# (least recently used files are dropped once DERIVATIVE_CACHE_MAX_MB is exceeded). The cache key includes the source
+# file's mtime and size, so a replaced source gets a fresh derivative.
+
+SIZES = {
+    "thumb":(360,360),
+    "preview":(1280,1280),
+}
+FORMATS = {
+    "webp":("WEBP","image/webp",{"quality":80,"method":4}),
+    "jpeg":("JPEG","image/jpeg",{"quality":82,"optimize":True,"progressive":True}),
+}
+
+def derivative_cache_dir():
+    return os.environ.get('DERIVATIVE_CACHE_DIR',os.path.join('cache','derivatives'))
+
+def source_version(source_path):
+    stat = os.stat(source_path)
+    return f"{stat.st_mtime_ns:x}{stat.st_size:x}"
+
+def get_derivative(source_path,size,image_format):
+    pil_format, mimetype, options = FORMATS[image_format]
+    key = hashlib.sha256(f"{os.path.abspath(source_path)}\0{source_version(source_path)}".encode()).hexdigest()
+    cache_dir = derivative_cache_dir()
+    path = os.path.abspath(os.path.join(cache_dir,f"{key}_{size}.{image_format}"))
+    cache_lookup('derivative',os.path.exists(path))
+    if os.path.exists(path):
+        os.utime(path)
+        return path,mimetype
+
+    os.makedirs(cache_dir,exist_ok=True)
+    from PIL import Image, ImageOps
+    with Image.open(source_path) as image:
+        # draft() lets the JPEG decoder downscale while decoding, so huge upscaled outputs are never fully decoded
+        image.draft('RGB',SIZES[size])
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(SIZES[size],Image.LANCZOS)
+        if image.mode not in ('RGB','L') and not (pil_format == 'WEBP' and image.mode == 'RGBA'):
+            image = image.convert('RGBA' if pil_format == 'WEBP' and 'A' in image.getbands() else 'RGB')
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        image.save(temp_path,format=pil_format,**options)
+    store_file(temp_path,path,directory_budget(cache_dir,int(float(os.environ.get('DERIVATIVE_CACHE_MAX_MB',256)) * 1024 * 1024)))
+    return path,mimetype
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,69 @@
+import os
+import json
+import zlib
+from datetime import date, datetime
+
+from sqlalchemy import func, or_
+from models import Extract, db_names
+
+# *************************************!!!!!!!!!!!!! BULK EXPORT !!!!!!!!!!!!!!!!!!!********************************
+# GET /v1/export streams Extract rows as NDJSON (one JSON object per line) for downstream syncs. The rows come from the
+# database in batches of EXPORT_BATCH_ROWS and the lines go out in chunks of about EXPORT_CHUNK_BYTES, gzipped on the
+# fly when the client accepts it, so memory stays flat however many rows are exported.
+# Incremental syncs pass since_id (rows added after that id) and/or since_edit_date (rows edited on or after that day).
+# The export stops at the highest id present when it starts, sent in the X-Export-Max-Id header: pass it back as
+# since_id on the next run.
+
+BATCH_ROWS = int(os.environ.get('EXPORT_BATCH_ROWS',1000))
+CHUNK_BYTES = int(os.environ.get('EXPORT_CHUNK_BYTES',64 * 1024))
+GZIP_LEVEL = int(os.environ.get('EXPORT_GZIP_LEVEL',6))
+
+# The extraction results are large, so they are only exported when asked for with ?include=
+OUTPUT_FIELDS = ('text_output','data_output','table_files')
+BASE_FIELDS = [column for column in db_names if column not in OUTPUT_FIELDS]
+
+def _default(value):
+    if isinstance(value,(date,datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def max_id(database):
+    return database.session.execute(database.select(func.max(Extract.id))).scalar() or 0
+
+def export_statement(database,columns,upper_id,filetype=None,since_id=None,since_edit_date=None):
+    statement = database.select(*[getattr(Extract,column) for column in columns]).where(Extract.id <= upper_id)
+    if filetype:
+        statement = statement.where(Extract.filetype == filetype)
+    # Both given: everything added since the last run plus anything older that was edited since
+    changed = []
+    if since_id is not None:
+        changed.append(Extract.id > since_id)
+    if since_edit_date is not None:
+        changed.append(Extract.edit_date >= since_edit_date)
+    if changed:
+        statement = statement.where(or_(*changed))
+    return statement.order_by(Extract.id).execution_options(yield_per=BATCH_ROWS)
+
+def ndjson_chunks(database,statement):
+    # Lines are joined into chunks so the response isn't written one small row at a time
+    buffer, size = [], 0
+    for row in database.session.execute(statement).mappings():
+        line = json.dumps(dict(row),default=_default,ensure_ascii=False).encode('utf-8') + b"\n"
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b"".join(buffer)
+
+def gzipped(chunks,level=GZIP_LEVEL):
+    # wbits=31 writes a gzip header and trailer, so the stream is a regular .gz file
+    compressor = zlib.compressobj(level,zlib.DEFLATED,31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,88 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from flask import Flask
+from dotenv import load_dotenv
+
+import metrics
+from models import database, Extract
+from schema import ensure_indexes, ensure_columns, ensure_column_types
+from db_config import database_url, engine_options, configure_sqlite
+from ingest import max_request_bytes
+from search import ensure_fts
+
+# *************************************!!!!!!!!!!!!! APPLICATION FACTORY !!!!!!!!!!!!!!!!!!!********************************
+# Builds the Flask app for main.py and api.py. Creating an app does no database or AWS work: the schema upkeep
+# (create_all, new columns and indexes, the search index) runs once per process on the first request, or earlier through
+# warm_up() (e.g. before serving, or right after a worker process starts). Apps can register more start-up work, such as
+# resuming queued jobs, with when_ready(), and work to finish before the process exits, such as draining the job queue,
+# with when_stopping().
+
+_ready_lock = threading.Lock()
+
+def create_app(import_name,secret_key_env):
+    load_dotenv(override=True) # SET THIS AS TRUE BECAUSE ENVIRONMENT VARIABLES WON'T CHANGE IF THEY WERE INITIALLY SET
+    app = Flask(import_name)
+    app.config['SECRET_KEY'] = os.environ.get(secret_key_env)
+    app.config['MAX_CONTENT_LENGTH'] = max_request_bytes()
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url()
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options()
+    database.init_app(app)
+    with app.app_context():
+        # WAL, synchronous and busy timeout pragmas on every connection (see db_config.py); no connection is opened yet
+        configure_sqlite(database.engine)
+    app.extensions['visionextract'] = {"ready":False,"ready_hooks":[],"stopping_hooks":[]}
+
+    @app.before_request
+    def ensure_ready():
+        if not app.extensions['visionextract']["ready"]:
+            warm_up(app)
+
+    # Stage timings, in-flight gauges and cache/error counters, served on /metrics
+    metrics.init_app(app,database)
+    return app
+
+def when_ready(app,callback):
+    app.extensions['visionextract']["ready_hooks"].append(callback)
+
+def when_stopping(app,callback):
+    app.extensions['visionextract']["stopping_hooks"].append(callback)
+
+def warm_up(app):
+    state = app.extensions['visionextract']
+    with _ready_lock:
+        if state["ready"]:
+            return
+        with app.app_context():
+            with _process_lock(app):
+                database.create_all()
+                ensure_columns(database,Extract)
+                ensure_column_types(database,Extract)
+                ensure_indexes(database,Extract)
+                ensure_fts(database)
+            for callback in state["ready_hooks"]:
+                callback()
+        state["ready"] = True
+
+@contextmanager
+def _process_lock(app):
+    # Preforked workers start together; on a new database they would all try to create the same tables
+    try:
+        import fcntl
+    except ImportError: # Windows, where the app runs as a single process
+        yield
+        return
+    os.makedirs(app.instance_path,exist_ok=True)
+    with open(os.path.join(app.instance_path,'.warm_up.lock'),'a') as handle:
+        fcntl.flock(handle,fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle,fcntl.LOCK_UN)
+
+def shut_down(app):
+    for callback in app.extensions['visionextract']["stopping_hooks"]:
+        callback()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,41 @@
+import os
+
+# *************************************!!!!!!!!!!!!! GUNICORN SETTINGS !!!!!!!!!!!!!!!!!!!********************************
+# Production serving: gunicorn -c gunicorn.conf.py   (VISIONEXTRACT_APP=api|main picks the app, see wsgi.py)
+# Every setting can be overridden from the environment. Each worker is a separate process with its own database pool,
+# Textract client, job queue threads (JOB_WORKERS) and upscaler workers (UPSCALE_CONCURRENCY).
+
+wsgi_app = "wsgi:app"
+bind = os.environ.get('GUNICORN_BIND',"0.0.0.0:5000" if os.environ.get('VISIONEXTRACT_APP') == 'main' else "0.0.0.0:4000")
+workers = int(os.environ.get('WEB_CONCURRENCY',os.cpu_count() or 1))
+# Each worker gets its share of the account's Textract quota (see textract_gateway.py)
+os.environ.setdefault('TEXTRACT_PROCESSES',str(workers))
+# More than one thread switches gunicorn to the gthread worker; requests mostly wait on Textract, the upscaler or SQLite
+threads = int(os.environ.get('GUNICORN_THREADS',4))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT',120))
+# How long a stopping worker gets to finish in-flight requests and running jobs before it is killed
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT',60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE',5))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS',0))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER',0))
+preload_app = os.environ.get('GUNICORN_PRELOAD') == '1'
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = "-"
+
+def post_worker_init(worker):
+    from wsgi import warm_worker
+    warm_worker(worker.wsgi)
+
+def worker_exit(server,worker):
+    # Runs after the worker stopped accepting requests: lets running background jobs finish
+    from factory import shut_down
+    if getattr(worker,"wsgi",None) is not None:
+        shut_down(worker.wsgi)
+
+def child_exit(server,worker):
+    # Metrics of dead workers are merged into the live ones when PROMETHEUS_MULTIPROC_DIR is used
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
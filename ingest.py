@@ -0,0 +1,85 @@
+import os
+import shutil
+import hashlib
+import tempfile
+
+from metrics import stage
+
+# *************************************!!!!!!!!!!!!! UPLOAD INGESTION !!!!!!!!!!!!!!!!!!!********************************
+# Streams an upload to disk exactly once, hashing and measuring it on the way, and keeps the bytes so they can be handed
+# straight to the extractor. Every other place the file has to appear gets a hardlink to that single copy.
+
+CHUNK_SIZE = 1024 * 1024
+
+class UploadTooLarge(ValueError):
+    pass
+
+def max_upload_bytes():
+    return int(float(os.environ.get('MAX_UPLOAD_MB',20)) * 1024 * 1024)
+
+def max_request_bytes():
+    # Applied as Flask's MAX_CONTENT_LENGTH, so oversized requests are refused from their Content-Length header
+    return int(float(os.environ.get('MAX_REQUEST_MB',100)) * 1024 * 1024)
+
+def link_or_copy(source,destination):
+    # Hardlink when possible; the temporary name + replace makes it safe to overwrite an existing file
+    if os.path.abspath(source) == os.path.abspath(destination):
+        return
+    # Already a link to the same file. rename() between two links of one file is a no-op that would leave the
+    # temporary link behind
+    try:
+        if os.path.samefile(source,destination):
+            return
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(destination) or '.',exist_ok=True)
+    temp_path = f"{destination}.{os.getpid()}.link"
+    try:
+        os.link(source,temp_path)
+    except OSError:
+        # Different filesystem, or one without hardlinks
+        shutil.copyfile(source,temp_path)
+    os.replace(temp_path,destination)
+
+def ingest_upload(upload,canonical_path,links=(),max_bytes=None,keep_bytes=True):
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    directory = os.path.dirname(canonical_path) or '.'
+    os.makedirs(directory,exist_ok=True)
+
+    digest = hashlib.sha256()
+    chunks = []
+    size = 0
+    with stage('upload_save'):
+        handle, temp_path = tempfile.mkstemp(dir=directory,suffix='.upload')
+        try:
+            with os.fdopen(handle,'wb') as newfile:
+                while True:
+                    chunk = upload.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise UploadTooLarge(f"{upload.filename} is larger than the {max_bytes / (1024 * 1024):g}MB upload limit")
+                    digest.update(chunk)
+                    newfile.write(chunk)
+                    if keep_bytes:
+                        chunks.append(chunk)
+            # mkstemp creates the file owner-only; uploads are served from static/ so they need normal read permissions
+            os.chmod(temp_path,0o644)
+            os.replace(temp_path,canonical_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    with stage('file_copy'):
+        for link in links:
+            link_or_copy(canonical_path,link)
+    return {
+        "path":canonical_path,
+        "sha256":digest.hexdigest(),
+        "size":size,
+        "bytes":b''.join(chunks) if keep_bytes else None,
+    }
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
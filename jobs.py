@@ -0,0 +1,214 @@
+import os
+import math
+import uuid
+import threading
+import socket
+import traceback
+import time
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import update
+from metrics import track, record_error, JOB_QUEUE_DEPTH, JOB_QUEUE_REJECTED
+
+# *************************************!!!!!!!!!!!!! JOB QUEUE !!!!!!!!!!!!!!!!!!!********************************
+# Background job runner for the slow upload endpoints. Jobs are rows in the application's SQLite database, so the
+# queue survives restarts, and a bounded thread pool executes them with the Flask app context pushed. At most max_queued
+# jobs may be waiting or running in a process; enqueue() raises QueueFull past that instead of growing the backlog.
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+def _worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def _is_alive(worker):
+    # A job marked running by a process that no longer exists on this host was interrupted and can be picked up again
+    host, _, pid = (worker or "").rpartition(':')
+    if host != socket.gethostname() or not pid.isdigit():
+        return False
+    try:
+        os.kill(int(pid),0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class QueueFull(Exception):
+    def __init__(self,retry_after):
+        super().__init__("The job queue is full")
+        self.retry_after = retry_after
+
+class JobQueue:
+    def __init__(self,app,database,model,handlers,max_workers,max_queued=None):
+        self.app = app
+        self.database = database
+        self.model = model
+        self.handlers = handlers
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix="job")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.average_seconds = None
+
+    def _submit(self,job_id):
+        with self.lock:
+            self.pending += 1
+        JOB_QUEUE_DEPTH.inc()
+        future = self.executor.submit(self._run_counted,job_id)
+        # A job cancelled by drain() never runs, so it is taken off the count here instead
+        future.add_done_callback(lambda future: self._left() if future.cancelled() else None)
+
+    def _left(self,seconds=None):
+        with self.lock:
+            self.pending -= 1
+            if seconds is not None:
+                self.average_seconds = seconds if self.average_seconds is None else 0.8 * self.average_seconds + 0.2 * seconds
+        JOB_QUEUE_DEPTH.dec()
+
+    def _run_counted(self,job_id):
+        start = time.monotonic()
+        try:
+            self._run(job_id)
+        finally:
+            self._left(time.monotonic() - start)
+
+    def retry_after(self):
+        # Roughly the time for the jobs ahead to get through the worker threads, in whole seconds
+        with self.lock:
+            return max(1,min(300,math.ceil((self.average_seconds or 1) * self.pending / self.max_workers)))
+
+    def describe(self):
+        with self.lock:
+            return {"workers":self.max_workers,"max_queued":self.max_queued,"pending":self.pending,
+                    "average_seconds":round(self.average_seconds,4) if self.average_seconds is not None else None}
+
+    def ensure_room(self):
+        # Also called by the upload endpoints before they read the upload, so a full queue costs the client nothing
+        if self.max_queued is None:
+            return
+        with self.lock:
+            full = self.pending >= self.max_queued
+        if full:
+            JOB_QUEUE_REJECTED.inc()
+            raise QueueFull(self.retry_after())
+
+    def enqueue(self,kind,payload,job_id=None):
+        self.ensure_room()
+        job = self.model(
+            id=job_id or uuid.uuid4().hex,
+            kind=kind,
+            status=QUEUED,
+            payload=payload,
+            created_at=datetime.now(),
+        )
+        self.database.session.add(job)
+        self.database.session.commit()
+        self._submit(job.id)
+        return job.id
+
+    def resume(self):
+        # Resubmits work that was still queued, or was running in a process that died, when the app last stopped
+        Job = self.model
+        with self.app.app_context():
+            pending = self.database.session.execute(
+                self.database.select(Job).where(Job.status.in_([QUEUED,RUNNING]))
+            ).scalars().all()
+            resumed = []
+            for job in pending:
+                if job.status == RUNNING:
+                    if _is_alive(job.worker):
+                        continue
+                    job.status = QUEUED
+                    job.started_at = None
+                resumed.append(job.id)
+            self.database.session.commit()
+        # Resumed jobs are always taken back, even past max_queued: they were accepted before the restart
+        for job_id in resumed:
+            self._submit(job_id)
+        return resumed
+
+    def _claim(self,job_id):
+        # Conditional update so that only one worker (in any process) moves a job from queued to running
+        Job = self.model
+        claimed = self.database.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == QUEUED)
+            .values(status=RUNNING,started_at=datetime.now(),worker=_worker_name())
+        )
+        self.database.session.commit()
+        return claimed.rowcount == 1
+
+    def _run(self,job_id):
+        with self.app.app_context():
+            if not self._claim(job_id):
+                return
+            job = self.database.session.get(self.model,job_id)
+            # Job kinds match the Extract file types, so the stage metrics line up with the synchronous endpoints
+            with track(f"job:{job.kind}",job.kind):
+                try:
+                    job.result = self.handlers[job.kind](job.payload)
+                    job.status = DONE
+                except Exception as e:
+                    traceback.print_exc()
+                    record_error("request")
+                    self.database.session.rollback()
+                    job = self.database.session.get(self.model,job_id)
+                    job.status = FAILED
+                    job.error = f"{type(e).__name__}: {e}"
+                job.finished_at = datetime.now()
+                # Any rows the handler added (e.g. the Extract entry) are committed together with the final status
+                try:
+                    self.database.session.commit()
+                except Exception as e:
+                    traceback.print_exc()
+                    record_error("request")
+                    self.database.session.rollback()
+                    self._fail(job_id,f"The job's result could not be saved: {type(e).__name__}: {e}")
+
+    def _fail(self,job_id,error):
+        # Otherwise the row would stay running under a live worker, which resume() never takes back. If even this
+        # fails, the row keeps this process's name and the next process to start resumes it
+        Job = self.model
+        try:
+            self.database.session.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == RUNNING)
+                .values(status=FAILED,error=error,result=None,finished_at=datetime.now())
+            )
+            self.database.session.commit()
+        except Exception:
+            traceback.print_exc()
+            self.database.session.rollback()
+
+    def shutdown(self,wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def drain(self):
+        # For a graceful stop: jobs already running finish, jobs not started yet stay queued in the database and are
+        # picked up by resume() in the next process that starts
+        self.executor.shutdown(wait=True,cancel_futures=True)
+
+def describe(job):
+    def seconds(start,end):
+        if start is None or end is None:
+            return None
+        return (end - start).total_seconds()
+    return {
+        "id":job.id,
+        "kind":job.kind,
+        "status":job.status,
+        "created_at":job.created_at.isoformat(),
+        "started_at":job.started_at.isoformat() if job.started_at else None,
+        "finished_at":job.finished_at.isoformat() if job.finished_at else None,
+        "queued_seconds":seconds(job.created_at,job.started_at),
+        "run_seconds":seconds(job.started_at,job.finished_at),
+        "result":job.result,
+        "error":job.error,
+    }
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -1,7 +1,4 @@
-from flask import Flask, jsonify, render_template, request, Response,redirect,url_for,flash,send_file,send_from_directory
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
-from sqlalchemy import Integer, String, Boolean, Date, JSON
+from flask import Flask, jsonify, render_template, request, Response,redirect,url_for,flash,send_file,send_from_directory,abort
 import random as r
 
 from datetime import date
@@ -10,47 +7,38 @@ import shutil
 from flask_bootstrap5 import Bootstrap
 
 from methods import upscale_images, extract_table, extract_text
-
-from dotenv import load_dotenv
+from ingest import ingest_upload, UploadTooLarge
+
+from models import database, Extract
+from factory import create_app, warm_up
+from schema import reset_table
+import metrics
+import admission
+from search import ensure_fts
 import os
-import zipfile
-from io import BytesIO
-import pd
+from werkzeug.utils import safe_join
+from archives import archive_response
+from derivatives import get_derivative, source_version, SIZES
+from tables import catalog, read_grid, replace_table
+from textract_gateway import TextractUnavailable
 from functools import wraps
+from sqlalchemy import and_
 
 
-load_dotenv(override=True) # SET THIS AS TRUE BECAUSE ENVIRONMENT VARIABLES WON'T CHANGE IF THEY WERE INITIALLY SET
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.environ.get('FLASK_KEY')
+app = create_app(__name__,'FLASK_KEY')
 Bootstrap(app)
+# The uploads upscale or call Textract within the request, so each gets a bounded lane (see admission.py)
+admission.init_app(app,{"add_image":"upscale","add_table":"textract","add_text":"textract"})
 
 print(os.environ.get('BASIC_KEY'))
 
-# Create DataBase
-class Base(DeclarativeBase):
-    pass
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///textract.db'
-database = SQLAlchemy(model_class=Base)
-database.init_app(app)
-                    
-# Textract Table Configuration
-            
-class Extract(database.Model):
-    id: Mapped[int] = mapped_column(Integer, primary_key = True)
-    name: Mapped[str] = mapped_column(String(250),unique = False, nullable=False)
-    filetype: Mapped[str] = mapped_column(String(100),nullable=False)
-    date: Mapped[Date] = mapped_column(Date,nullable=False)
-    file_location : Mapped[str] = mapped_column(String(250), nullable = False)
-    output_location : Mapped[str] = mapped_column(String(250),nullable=False)
-    input_size : Mapped[str] = mapped_column(String(100),unique=False,nullable=False)
-    output_size : Mapped[str] = mapped_column(String(100),unique=False,nullable=False)
-    text_output : Mapped[str] = mapped_column(String,nullable=True)
-    data_output : Mapped[dict] = mapped_column(JSON,nullable=True)
-    edit_date: Mapped[Date] = mapped_column(Date,nullable=True)
-
-with app.app_context():
-    database.create_all()
-    db_names = Extract.__table__.columns.keys()
+@app.errorhandler(TextractUnavailable)
+def textract_unavailable(error):
+    # The Textract gateway refused the call (rate limit, outage, retries used up): the client should come back later
+    response = jsonify(response={"Error":str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
 
 @app.route('/')
 def home():
@@ -68,9 +56,10 @@ def documentation():
 def functions():
     return render_template("menu.html")
 
+# History pages only select the columns they display, never the large text/data payloads
 @app.route('/history_images')
 def history_images():
-    image_history = database.session.execute(database.select(Extract).where(Extract.filetype == "image")).scalars().all()
+    image_history = database.session.execute(database.select(Extract.name,Extract.id,Extract.date,Extract.output_location).where(Extract.filetype == "image")).all()
     metadata = []
     for image in image_history:
         metadata.append({
@@ -83,7 +72,7 @@ def history_images():
 
 @app.route('/history_tables')
 def history_tables():
-    table_history = database.session.execute(database.select(Extract).where(Extract.filetype == "datatable")).scalars().all()
+    table_history = database.session.execute(database.select(Extract.name,Extract.id,Extract.date,Extract.file_location).where(Extract.filetype == "datatable")).all()
     metadata = []
     for table in table_history:
         metadata.append({
@@ -96,7 +85,7 @@ def history_tables():
 
 @app.route('/history_text')
 def history_text():
-    text_history = database.session.execute(database.select(Extract).where(Extract.filetype == "text")).scalars().all()
+    text_history = database.session.execute(database.select(Extract.name,Extract.id,Extract.date,Extract.file_location).where(Extract.filetype == "text")).all()
     metadata = []
     for text in text_history:
         metadata.append({
@@ -123,7 +112,7 @@ def find_file():
         flash(file_to_find.date.strftime("%Y-%m-%d"))
         flash(file_to_find.file_location)
         flash(file_to_find.output_location)
-        flash(f"{float(file_to_find.output_size):.3f}KB")
+        flash(f"{file_to_find.output_size:.3f}KB")
         flash(file_to_find.data_output)
         return redirect(url_for('functions')+"#exploreID")
 
@@ -200,13 +189,20 @@ def query_text():
 
 @app.route('/add_image',methods=['GET','POST'])
 def add_image():
+    metrics.set_filetype("image")
     source_images = request.files.getlist('images[]')
-    upscaled,input_path= upscale_images(source_images)
-    input_file_paths = [os.path.join(input_path,origin.filename) for origin in source_images]
-    for images,input_file_path in zip(upscaled,input_file_paths):
+    try:
+        upscaled,input_path,encodings = upscale_images(source_images,request.form.get('output_format'),request.form.get('quality'))
+    except ValueError as e:
+        return jsonify(response={"Failure":str(e)}),400
+    # The outputs come back sorted by name, not in upload order; each is named <stem>_out.<ext> after its input
+    input_file_paths = {os.path.splitext(origin.filename)[0]:os.path.join(input_path,origin.filename) for origin in source_images}
+    new_images = []
+    for images in upscaled:
         # file.filename only works if the file is directly a file, but if it is a list of path, or a path
         # we must use os.path.basename(file_path)
         filename = os.path.basename(images)
+        input_file_path = input_file_paths[os.path.splitext(filename)[0].removesuffix('_out')]
 
         new_image = Extract(
             name=filename,
@@ -215,27 +211,46 @@ def add_image():
             file_location = input_file_path,
             output_location = images,
             input_size = os.path.getsize(input_file_path)/1024,
-            output_size = os.path.getsize(images)/1024
+            output_size = encodings[images]['output_bytes']/1024,
+            output_format = encodings[images]['output_format'],
+            encode_seconds = encodings[images]['encode_seconds'],
+            duration_seconds = encodings[images]['seconds'],
         )
-        database.session.add(new_image)
-        database.session.commit()
+        new_images.append(new_image)
+    # One transaction for the whole upload instead of a commit per image
+    database.session.add_all(new_images)
+    database.session.commit()
     return jsonify(response={"Success":"New image files have been upscaled 4x and stored in the database."}),200
 
+def save_upload(upload):
+    # Written once to static/Source/inputs; input/ gets a hardlink to the same file instead of a second copy
+    image_path = os.path.join('input',upload.filename)
+    static_path = os.path.join('static',"Source","inputs",upload.filename)
+    ingested = ingest_upload(upload,static_path,links=[image_path])
+    return image_path,static_path,ingested
+
+@app.errorhandler(413)
+@app.errorhandler(UploadTooLarge)
+def upload_too_large(error):
+    return jsonify(response={"Failure":"Upload is larger than the configured maximum size."}),413
+
 @app.route('/add_table',methods=['GET','POST'])
 def add_table():
+    metrics.set_filetype("datatable")
     extract_image = request.files.get('dataextract')
     image_name = extract_image.filename
-    image_path = os.path.join('input',image_name)
-    static_path = os.path.join('static','Source',"inputs",image_name)
-    extract_image.save(image_path)
-    shutil.copy(image_path,static_path)
-    input_size_kbytes = os.path.getsize(image_path)/1024
+    image_path,static_path,ingested = save_upload(extract_image)
+    input_size_kbytes = ingested['size']/1024
     try:
-        datatable_list = extract_table(image_path)
+        tables,info = extract_table(image_path,document_bytes=ingested['bytes'],digest=ingested['sha256'])
+    except TextractUnavailable:
+        raise
     except Exception as e:
         return jsonify(response={"Failure":"Image could not be processed and data was not extracted"}),400
+    if not tables:
+        return jsonify(response={"Failure":"No data table was found in the image"}),400
     image_name = os.path.splitext(image_name)[0]
-    output_path = os.path.join('output',image_name,f'{image_name}_1.csv')
+    output_path = tables[0]['output_location']
     output_size_kbytes = os.path.getsize(output_path)/1024
 
     new_table = Extract(
@@ -246,22 +261,24 @@ def add_table():
         output_location = output_path,
         input_size = input_size_kbytes,
         output_size = output_size_kbytes,
-        data_output = datatable_list,
+        data_output = tables[0]['data'],
+        table_files = catalog(tables),
+        response_sha = info['response_sha'],
+        duration_seconds = info['seconds'],
     )
     database.session.add(new_table)
     database.session.commit()
-    return jsonify(response={"Success":"New .csv file has been made with the image of the data table provided."}),200
+    tables_found = [{key:value for key,value in table.items() if key != 'data'} for table in tables]
+    return jsonify(response={"Success":"New .csv file has been made with the image of the data table provided.",**info,
+                             "tables":tables_found}),200
 
 @app.route('/add_text',methods=['GET','POST'])
 def add_text():
+    metrics.set_filetype("text")
     extract_image = request.files.get('textract')
-    image_name = extract_image.filename
-    image_path = os.path.join('input',image_name)
-    static_path = os.path.join('static',"Source","inputs",image_name)
-    extract_image.save(static_path)
-    shutil.copy(static_path,image_path)
-    input_size_kbytes = os.path.getsize(image_path)/1024
-    text,image_name = extract_text(image_path)
+    image_path,static_path,ingested = save_upload(extract_image)
+    input_size_kbytes = ingested['size']/1024
+    text,image_name,info = extract_text(image_path,document_bytes=ingested['bytes'],digest=ingested['sha256'])
     output_path = os.path.join('output',f'{image_name}.txt')
     output_size_kbytes = os.path.getsize(output_path)/1024
 
@@ -274,10 +291,12 @@ def add_text():
         input_size = input_size_kbytes,
         output_size = output_size_kbytes,
         data_output = text,
+        response_sha = info['response_sha'],
+        duration_seconds = info['seconds'],
     )
     database.session.add(new_text)
     database.session.commit()
-    return jsonify(response={"Success":"New .txt file has been made with the image of the text provided."}),200
+    return jsonify(response={"Success":"New .txt file has been made with the image of the text provided.",**info}),200
 
 @app.route('/fix/<int:id>',methods=['POST','PATCH'])
 def fix(id):
@@ -300,8 +319,15 @@ def replace(id):
     file_type = data_to_edit.filetype
     key = request.args.get('key')
     if key == "TOPSECRET" and file_type == "datatable":
-        new_save_path = os.path.join(data_to_edit.output_location,"replace_file")
+        extension = '.json' if datatable_replace.filename.lower().endswith('.json') else '.csv'
+        new_save_path = os.path.join(os.path.dirname(data_to_edit.output_location),f"replace_file{extension}")
         datatable_replace.save(new_save_path)
+        try:
+            table_files,data_output = replace_table(read_grid(new_save_path),data_to_edit.output_location,data_to_edit.table_files)
+        except (ValueError,KeyError,TypeError,UnicodeDecodeError):
+            return jsonify(error="The replacement table could not be read"),400
+        data_to_edit.table_files = table_files
+        data_to_edit.data_output = data_output
         data_to_edit.output_size = os.path.getsize(data_to_edit.output_location)/1024
         data_to_edit.edit_date = date.today()
         database.session.commit()
@@ -325,11 +351,40 @@ def clear():
     api_key = request.form.get('APIKey')
     test_key = os.environ.get('API_KEY')
     if key == "TOPSECRET" and api_key == test_key:
-        database.drop_all(bind=database.engine)
-        database.create_all(bind=database.engine)
+        reset_table(database,Extract)
+        ensure_fts(database,rebuild=True)
         return jsonify(response={"Success":"Database cleared and reset."}),200
     return jsonify(error="Unauthorized"),403
 
+@app.template_global()
+def derivative_url(size,path):
+    # The source version in the URL lets browsers cache derivatives for a year and still see replaced images
+    try:
+        version = source_version(os.path.join(app.root_path,path))
+    except OSError:
+        version = "0"
+    return url_for('derivative',size=size,path=path,v=version)
+
+@app.route('/derivative/<string:size>/<path:path>',methods=['GET'])
+def derivative(size,path):
+    if size not in SIZES:
+        abort(404)
+    # Only images under static/ can be resized
+    source_path = safe_join(app.root_path,path)
+    static_root = os.path.abspath(app.static_folder)
+    if source_path is None or os.path.commonpath([os.path.abspath(source_path),static_root]) != static_root or not os.path.isfile(source_path):
+        abort(404)
+    # Only browsers that name WebP get it; "image/*" is also sent by browsers that cannot decode it
+    image_format = "webp" if any(mimetype == "image/webp" for mimetype,quality in request.accept_mimetypes if quality) else "jpeg"
+    try:
+        derivative_path,mimetype = get_derivative(source_path,size,image_format)
+    except OSError:
+        abort(404)
+    response = send_file(derivative_path,mimetype=mimetype,max_age=365*24*60*60)
+    response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    response.vary.add('Accept')
+    return response
+
 @app.route('/download/<string:type>/<path:directory>/<path:path>',methods=['GET']) # don't use str:/string: to accept arguments "type:variableName", use <path:___> because path takes forward slashes(//)
 def download(type,directory,path):
     print(directory)
@@ -340,26 +395,11 @@ def download(type,directory,path):
     elif type == "Text":
         path = str(path)+'.txt'
     elif type == "Table":
-        BASE_DIR = r"D:\My Files\Coding\Python Coding\4. Portfolio Projects\13.5 RESTful API"
-        folder_abs_path = os.path.join(BASE_DIR, "output",path)
-
-        # Create in-memory zip file
-        zip_buffer = BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(folder_abs_path):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    rel_path = os.path.relpath(full_path, folder_abs_path)
-                    zipf.write(full_path, arcname=rel_path)
-
-        zip_buffer.seek(0)
-
-        return send_file(
-            zip_buffer,
-            mimetype='application/zip',
-            as_attachment=True,
-            download_name=os.path.basename(path) + '.zip'
-        )
+        # Output folders are resolved under the app root, and safe_join keeps the path from escaping output/
+        folder_abs_path = safe_join(os.path.join(app.root_path,"output"),path)
+        if folder_abs_path is None or not os.path.isdir(folder_abs_path):
+            abort(404)
+        return archive_response(folder_abs_path,os.path.basename(path) + '.zip')
     print(directory)
     print(path)
     return send_from_directory(
@@ -369,4 +409,5 @@ def download(type,directory,path):
     )
 
 if __name__ == "__main__":
-    app.run(debug=True,host='0.0.0.0',port=5000)
\ No newline at end of file
+    warm_up(app)
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1',host='0.0.0.0',port=5000)
\ No newline at end of file
@@ -1,185 +1,385 @@
 import os
 import shutil
-import boto3
-import pandas as pd
+import threading
+import time
 from dotenv import load_dotenv
+from cache import get_result_cache, document_key
+from preprocess import preprocess_document
+from metrics import stage, cache_lookup
+from responses import store_response
+from textract_gateway import TextractGateway, make_client
+from tables import store_table, column_names
 
-textract = boto3.client('textract')
 os.makedirs('input',exist_ok=True)
 os.makedirs('output',exist_ok=True)
 
+# boto3, pandas and Pillow are only imported when first needed, so processes that never touch Textract (or tables,
+# or images) don't pay for them at start-up. Benchmarks and tests may assign a stub client to `textract` directly;
+# calls still go through the gateway (rate limits, retries, circuit breaker, see textract_gateway.py).
+textract = None
+_textract_pid = None
+_textract_lock = threading.Lock()
+_gateway = None
+
+def get_client():
+    # One client per process: a client inherited from the parent over fork() is not reused
+    global textract, _textract_pid
+    if textract is None or (_textract_pid is not None and _textract_pid != os.getpid()):
+        with _textract_lock:
+            if textract is None or (_textract_pid is not None and _textract_pid != os.getpid()):
+                textract = make_client()
+                _textract_pid = os.getpid()
+    return textract
+
+def get_textract():
+    # The process's Textract gateway; every extraction calls Textract through it
+    global _gateway
+    if _gateway is None or _gateway.pid != os.getpid():
+        with _textract_lock:
+            if _gateway is None or _gateway.pid != os.getpid():
+                _gateway = TextractGateway(get_client)
+    get_client()
+    return _gateway
+
+def gateway_status():
+    # Rate limits and circuit state of this process's gateway; None until the process has created it
+    return _gateway.describe() if _gateway is not None and _gateway.pid == os.getpid() else None
+
 # *************************************!!!!!!!!!!!!! METHOD 1 !!!!!!!!!!!!!!!!!!!********************************
 
-def extract_table(image_path):
+def extract_table(image_path,document_bytes=None,digest=None):
+    start = time.perf_counter()
     filename = os.path.basename(image_path) # get just the filename from its entire path
     filename = filename = os.path.splitext(filename)[0]
+    # Freshly ingested uploads pass their bytes (and hash) along so the file is not read back from disk
+    if document_bytes is None:
+        with open(image_path,mode='rb') as newfile:
+            document_bytes = newfile.read()
+
+    # Identical documents have already been analysed, so reuse the stored grids instead of calling Textract again
+    result_cache = get_result_cache()
+    cache_key = document_key(document_bytes,'TABLES',digest)
+    cached = result_cache.get(cache_key)
+    if isinstance(cached,list):
+        # Entries cached before raw responses were stored hold only the grids
+        cached = {"grids":cached,"response_sha":None}
+    info = {"cache_hit":cached is not None,"preprocess":None,"response_sha":None}
+    cache_lookup('textract',info["cache_hit"])
+    if info["cache_hit"]:
+        grids,info["response_sha"] = cached["grids"],cached["response_sha"]
+    else:
+        with stage('preprocess'):
+            payload,info["preprocess"] = preprocess_document(document_bytes)
+        with stage('textract_call'):
+            response = get_textract().analyze_document(
+                Document={'Bytes': payload},
+                FeatureTypes=['TABLES']
+            )
+        # The raw response is kept so outputs can be rebuilt later without calling Textract again
+        with stage('store_response'):
+            info["response_sha"] = store_response(response)
+        with stage('parse_blocks'):
+            grids = parse_tables(response['Blocks'])
+        result_cache.set(cache_key,{"grids":grids,"response_sha":info["response_sha"]})
+    tables = write_tables(filename,grids)
+    info["seconds"] = round(time.perf_counter() - start,4)
+    return tables,info
+
+def write_tables(filename,grids):
+    # Every table is stored as typed Parquet with a CSV export (see tables.py) and returned, not just the first one
     data_folder = os.path.join('output',filename)
     os.makedirs(data_folder,exist_ok=True)
-    with open(image_path,mode='rb') as newfile:
-        document_bytes = newfile.read()
-        
-    response = textract.analyze_document(
-        Document={'Bytes': document_bytes},
-        FeatureTypes=['TABLES']
-    )
-
-    # First, build a map of Block IDs to Block data
-    blocks_map = {block['Id']: block for block in response['Blocks']}
-
-    # Store tables with rows and cells
     tables = []
-    frames = []
-    
+    for t_index, grid in enumerate(grids, start=1):
+        output_location = os.path.join('output',filename,f'{filename}_{t_index}.csv')
+        stored = store_table(grid,os.path.join('output',filename,f'{filename}_{t_index}.parquet'),output_location)
+        df = grid_to_frame(grid)
+        try:
+            json_table = df.to_json()
+        except Exception as e:
+            # orient='columns' needs unique row labels (the first column), which tables don't always have
+            print(e)
+            json_table = df.reset_index(drop=True).to_json(orient="records")
+        tables.append({
+            "index":t_index,
+            "output_location":output_location,
+            "table_location":stored["location"],
+            "rows":stored["rows"],
+            "columns":len(stored["columns"]),
+            "schema":stored["columns"],
+            "data":json_table,
+        })
+    return tables
 
-    for block in response['Blocks']:
+def parse_tables(blocks):
+    # One pass indexes every block by Id and remembers where the tables are
+    blocks_map = {}
+    table_blocks = []
+    for block in blocks:
+        blocks_map[block['Id']] = block
         if block['BlockType'] == 'TABLE':
-            table = []
-            # Table has CHILD relationships that point to CELL blocks
-            for relationship in block.get('Relationships', []):
-                if relationship['Type'] == 'CHILD':
-                    for cell_id in relationship['Ids']:
-                        cell = blocks_map[cell_id]
-                        if cell['BlockType'] == 'CELL':
-                            row_index = cell['RowIndex']
-                            column_index = cell['ColumnIndex']
-                            # Get cell text by following relationships to WORD blocks
-                            cell_text = ''
-                            for rel in cell.get('Relationships', []):
-                                if rel['Type'] == 'CHILD':
-                                    words = [blocks_map[word_id]['Text'] for word_id in rel['Ids'] if blocks_map[word_id]['BlockType'] == 'WORD']
-                                    cell_text = ' '.join(words)
-
-                            # Ensure the table has enough rows
-                            while len(table) < row_index:
-                                table.append({})
-                            table[row_index - 1][column_index] = cell_text
-            tables.append(table)
-
-    for t_index, table in enumerate(tables, start=1):
-        df_rows = []
-        for row in table:
-            ordered_row = [row.get(i, '') for i in sorted(row)]
-            df_rows.append(ordered_row)
-        
-        df = pd.DataFrame(df_rows)
-        df.columns = df.iloc[0]
-        df = df[1:]
-        # Set the first column (which contains NaN) as the index
-        df.set_index(df.columns[0], inplace=True)
-        # Remove the index name completely
-        if not df.index.name:
-            df.index.name = None
-        # Remove column level names
-        if df.columns.name == 0:
-            df.columns.name = None
-        df.to_csv(f'output/{filename}/{filename}_{t_index}.csv')
-        frames.append(df)
-    try:
-        json_table = frames[0].to_json()
-    except Exception as e:
-        print(e)
-        json_table = frames[0].reset_index(drop=True).to_json(orient="records")
-    finally:
-        return json_table
+            table_blocks.append(block)
+
+    grids = []
+    for table in table_blocks:
+        cells = [blocks_map[cell_id] for cell_id in _child_ids(table)]
+        cells = [cell for cell in cells if cell['BlockType'] == 'CELL']
+        if not cells:
+            continue
+        # The grid is allocated once at its final size, including cells that span several rows/columns
+        row_count = max(cell['RowIndex'] + cell.get('RowSpan',1) - 1 for cell in cells)
+        column_count = max(cell['ColumnIndex'] + cell.get('ColumnSpan',1) - 1 for cell in cells)
+        grid = [[''] * column_count for _ in range(row_count)]
+        for cell in cells:
+            words = []
+            for word_id in _child_ids(cell):
+                word = blocks_map[word_id]
+                if word['BlockType'] == 'WORD':
+                    words.append(word['Text'])
+            # A spanning cell keeps its text in its top-left position, the positions it covers stay blank
+            grid[cell['RowIndex'] - 1][cell['ColumnIndex'] - 1] = ' '.join(words)
+        grids.append(grid)
+    return grids
+
+def _child_ids(block):
+    ids = []
+    for relationship in block.get('Relationships', ()):
+        if relationship['Type'] == 'CHILD':
+            ids.extend(relationship['Ids'])
+    return ids
+
+def grid_to_frame(grid):
+    import pandas as pd
+    # The first row holds the headers and the first column becomes the (unnamed when blank) index. The columns get the
+    # same unique names as the stored table, since blank or repeated headers break to_json
+    body = grid[1:]
+    index = pd.Index([row[0] for row in body], name=grid[0][0] or None)
+    return pd.DataFrame([row[1:] for row in body], index=index, columns=column_names(grid[0])[1:])
 
 # *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
 
 # *************************************!!!!!!!!!!!!! METHOD 2 !!!!!!!!!!!!!!!!!!!********************************
 
-def extract_text(image_path):
+def extract_text(image_path,document_bytes=None,digest=None):
+    start = time.perf_counter()
     image_name = os.path.basename(image_path)
     image_name = os.path.splitext(image_name)[0]
-    with open(image_path, 'rb') as document:
-        document_bytes = document.read()
+    if document_bytes is None:
+        with open(image_path, 'rb') as document:
+            document_bytes = document.read()
+
+    result_cache = get_result_cache()
+    cache_key = document_key(document_bytes,'TEXT',digest)
+    cached = result_cache.get(cache_key)
+    if isinstance(cached,str):
+        # Entries cached before raw responses were stored hold only the text
+        cached = {"text":cached,"response_sha":None}
+    info = {"cache_hit":cached is not None,"preprocess":None,"response_sha":None}
+    cache_lookup('textract',info["cache_hit"])
+    if info["cache_hit"]:
+        text,info["response_sha"] = cached["text"],cached["response_sha"]
+    else:
+        # Send request to Textract to detect handwriting, with a smaller re-encoded copy of the image
+        with stage('preprocess'):
+            payload,info["preprocess"] = preprocess_document(document_bytes)
+        with stage('textract_call'):
+            response = get_textract().detect_document_text(
+            Document={'Bytes': payload}
+            )
 
-    # Send request to Textract to detect handwriting
-    response = textract.detect_document_text(
-    Document={'Bytes': document_bytes}
-    )
+        with stage('store_response'):
+            info["response_sha"] = store_response(response)
 
-    # Extract and print the text
+        # Extract and print the text
+        with stage('parse_blocks'):
+            text = text_from_blocks(response['Blocks'])
+        result_cache.set(cache_key,{"text":text,"response_sha":info["response_sha"]})
+
+    write_text(image_name,text)
+    info["seconds"] = round(time.perf_counter() - start,4)
+    print(text)
+    return text,image_name,info
+
+def text_from_blocks(blocks):
     text = ''
-    for block in response['Blocks']:
+    for block in blocks:
         if block['BlockType'] == 'LINE':
             text += block['Text']
             text += ''' '''
-    
+    return text
+
+def write_text(image_name,text):
     # translated_path = os.path.join(output_dir,'new.txt')
-    with open(f'output/{image_name}.txt',mode="w") as newfile:
+    output_location = f'output/{image_name}.txt'
+    with stage('text_write'), open(output_location,mode="w") as newfile:
         newfile.write(text)
-    print(text)
-    return text,image_name
+    return output_location
 
 # *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
 
-from PIL import Image
-import subprocess
+import tempfile
+from upscaler import run_upscaler, model_signature
+from upscale_cache import get_upscale_cache
+from ingest import link_or_copy
 
 # *************************************!!!!!!!!!!!!! METHOD 3 !!!!!!!!!!!!!!!!!!!********************************
 
-def upscale_images(listImages):
-    base_dir = "Image Upscaler"
-    venv_python = os.path.join(base_dir, "venv", "Scripts", "python.exe") if os.name == "nt" else os.path.join(base_dir, "venv", "bin", "python")
-    input_dir = os.path.join(base_dir, "Real-ESRGAN", "inputs")
-    output_dir = os.path.join(base_dir, "Real-ESRGAN", "results")
-    script_path = os.path.join(base_dir, "Real-ESRGAN", "inference_realesrgan.py")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+# output_format -> (Pillow format, file extension). WebP is lossless unless a quality is given; JPEG defaults to 90
+OUTPUT_FORMATS = {
+    "png":("PNG",".png"),
+    "webp":("WEBP",".webp"),
+    "jpeg":("JPEG",".jpg"),
+}
+
+def output_settings(output_format=None,quality=None):
+    # None (or "original") keeps whatever the upscaler wrote; UPSCALE_OUTPUT_FORMAT/UPSCALE_OUTPUT_QUALITY set the defaults
+    output_format = (output_format or os.environ.get('UPSCALE_OUTPUT_FORMAT') or 'original').lower()
+    if output_format == 'jpg':
+        output_format = 'jpeg'
+    if output_format != 'original' and output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{output_format}', use one of: original, {', '.join(OUTPUT_FORMATS)}")
+    quality = quality if quality not in (None,'') else os.environ.get('UPSCALE_OUTPUT_QUALITY')
+    if quality not in (None,''):
+        quality = int(quality)
+        if not 1 <= quality <= 100:
+            raise ValueError("Output quality must be between 1 and 100")
+    else:
+        quality = None
+    return output_format,quality
+
+def upscale_images(listImages,output_format=None,quality=None):
+    output_format,quality = output_settings(output_format,quality)
     source_assets = "Source"
     input_path = os.path.join("static",source_assets,"inputs")
     output_path = os.path.join("static",source_assets,"outputs")
-
-    # Delete the Sources folder if it exists
-    if os.path.exists(source_assets):
-        shutil.rmtree(source_assets)
-
-    # Recreate directories
-    os.makedirs(input_dir, exist_ok=True)
-    os.makedirs(output_dir, exist_ok=True)
     os.makedirs(input_path, exist_ok=True)
     os.makedirs(output_path, exist_ok=True)
 
+    # Each call works in its own temporary workspace so concurrent upscales never see or delete each other's files
+    workspace_root = os.environ.get('UPSCALE_WORKSPACE_DIR')
+    if workspace_root:
+        os.makedirs(workspace_root, exist_ok=True)
+    workspace = tempfile.mkdtemp(prefix="upscale-", dir=workspace_root)
+    try:
+        return _upscale_in_workspace(listImages, workspace, input_path, output_path, output_format, quality)
+    finally:
+        # Clean up by deleting this request's input and result folders
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def _upscale_in_workspace(listImages, workspace, input_path, output_path, output_format, quality):
+    start = time.perf_counter()
+    input_dir = os.path.join(workspace, "inputs")
+    pending_dir = os.path.join(workspace, "pending")
+    output_dir = os.path.join(workspace, "results")
+    os.makedirs(input_dir)
+    os.makedirs(pending_dir)
+    os.makedirs(output_dir)
+
     # Save all input images
-    for image in listImages:
-        save_path = os.path.join(input_dir, image.filename)
-        image.save(save_path)
+    with stage('file_copy'):
+        for image in listImages:
+            # Accepts uploaded files or paths of files that were already saved (e.g. staged for a background job)
+            if isinstance(image,str):
+                link_or_copy(image,os.path.join(input_dir, os.path.basename(image)))
+            else:
+                save_path = os.path.join(input_dir, image.filename)
+                image.save(save_path)
 
-    # Run the upscaler with venv Python
-    try:
-        subprocess.run([
-            venv_python,
-            script_path,
-            "-i", input_dir,
-            "-o", output_dir,
-            "--fp32"
-        ], check=True)
-    except subprocess.CalledProcessError as e:
-        print("Upscaling failed:", e)
-        raise
-
-    # Collect processed images and save to Sources
-    processed_images = []
-    for filename in os.listdir(output_dir): # RETURNS ALL FILES AND DIRECTORIES WITHIN SPECIFIC DIRECTORY WITHIN A LIST
-        if filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
-            filepath = os.path.join(output_dir, filename)
-            img = Image.open(filepath) # opens as image object
-            finished_path = os.path.join(output_path, filename)
-            img.save(finished_path)
-            processed_images.append(finished_path)
-
-    # Collect processed images and save to Sources
-    before_images = []
-    for filename in os.listdir(input_dir):
-        if filename.lower().endswith((".png", ".jpg", ".jpeg", ".gif")):
-            filepath = os.path.join(input_dir, filename)
-            img = Image.open(filepath)
-            finished_path = os.path.join(input_path, filename)
-            img.save(finished_path)
-            before_images.append(finished_path)
-
-    # Clean up by deleting input and result folders
-    shutil.rmtree(input_dir)
-    shutil.rmtree(output_dir)
-
-    return processed_images,input_path
+    # Images that were upscaled before (or near duplicates of one, see upscale_cache.py) get the cached output linked
+    # into the results as the upscaler would have named it; only the rest go through the model
+    fp32 = True
+    signature = model_signature(fp32)
+    upscale_cache = get_upscale_cache()
+    cache_results = {}
+    pending = []
+    with stage('upscale_cache_lookup'):
+        for filename in sorted(os.listdir(input_dir)):
+            source = os.path.join(input_dir, filename)
+            stem = os.path.splitext(filename)[0]
+            cached_path = None
+            if upscale_cache is not None and filename.lower().endswith(IMAGE_EXTENSIONS):
+                cached_path,cache_results[f"{stem}_out"] = upscale_cache.lookup(source, signature)
+            if cached_path:
+                link_or_copy(cached_path, os.path.join(output_dir, f"{stem}_out{os.path.splitext(cached_path)[1]}"))
+            else:
+                link_or_copy(source, os.path.join(pending_dir, filename))
+                pending.append(filename)
+
+    # Run the upscaler through a resident worker (falls back to a one-shot venv Python run); at most
+    # UPSCALE_CONCURRENCY upscales run at once in this process
+    upscale_seconds = 0
+    if pending:
+        upscale_start = time.perf_counter()
+        with stage('upscale'):
+            run_upscaler(pending_dir, output_dir, fp32=fp32)
+        upscale_seconds = time.perf_counter() - upscale_start
+        if upscale_cache is not None:
+            with stage('upscale_cache_store'):
+                for filename in pending:
+                    stem, extension = os.path.splitext(filename)
+                    # The upscaler keeps the input's extension, except for images with alpha, which become PNG
+                    for output_name in (f"{stem}_out{extension}", f"{stem}_out.png"):
+                        if os.path.exists(os.path.join(output_dir, output_name)):
+                            upscale_cache.store(os.path.join(input_dir, filename), os.path.join(output_dir, output_name), signature)
+                            break
+
+    # Collect processed images into Sources. Results are moved as they are unless another format was asked for,
+    # so the (4x sized) images are only decoded when they really have to be re-encoded
+    with stage('image_collection'):
+        processed_images = []
+        encodings = {}
+        for filename in sorted(os.listdir(output_dir)): # RETURNS ALL FILES AND DIRECTORIES WITHIN SPECIFIC DIRECTORY WITHIN A LIST
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                filepath = os.path.join(output_dir, filename)
+                finished_path,encodings[finished_path] = collect_output(filepath, output_path, output_format, quality)
+                encodings[finished_path]["upscale_cache"] = cache_results.get(os.path.splitext(filename)[0], "off")
+                processed_images.append(finished_path)
+
+        # The inputs are linked into Sources byte for byte, never decoded
+        for filename in sorted(os.listdir(input_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                link_or_copy(os.path.join(input_dir, filename), os.path.join(input_path, filename))
+
+    # Every image is charged an equal share of the call's overhead, and the images that went through the model an
+    # equal share of the upscaler run on top of it
+    overhead = (time.perf_counter() - start - upscale_seconds) / max(1, len(processed_images))
+    ran = [path for path in processed_images if encodings[path]["upscale_cache"] in ("miss", "off")]
+    for finished_path in processed_images:
+        model_share = upscale_seconds / len(ran) if finished_path in ran else 0
+        encodings[finished_path]["seconds"] = round(overhead + model_share, 4)
+    return processed_images,input_path,encodings
+
+def collect_output(filepath,output_path,output_format,quality):
+    stem, extension = os.path.splitext(os.path.basename(filepath))
+    start = time.perf_counter()
+    if output_format == 'original' or (quality is None and OUTPUT_FORMATS[output_format][1] == extension.lower()):
+        finished_path = os.path.join(output_path, os.path.basename(filepath))
+        shutil.move(filepath, finished_path)
+        encoded_format = extension.lower().lstrip('.').replace('jpg','jpeg')
+    else:
+        pil_format, new_extension = OUTPUT_FORMATS[output_format]
+        finished_path = os.path.join(output_path, stem + new_extension)
+        options = {}
+        if pil_format == 'PNG':
+            options = {"compress_level":6}
+        elif pil_format == 'WEBP':
+            options = {"lossless":True} if quality is None else {"quality":quality}
+        elif pil_format == 'JPEG':
+            options = {"quality":quality or 90,"optimize":True}
+        from PIL import Image
+        with Image.open(filepath) as img:
+            if pil_format == 'JPEG' and img.mode not in ('RGB','L'):
+                img = img.convert('RGB')
+            temp_path = f"{finished_path}.{os.getpid()}.tmp"
+            img.save(temp_path, format=pil_format, **options)
+        os.replace(temp_path, finished_path)
+        encoded_format = output_format
+    return finished_path,{
+        "output_format":encoded_format,
+        "encode_seconds":round(time.perf_counter() - start,4),
+        "output_bytes":os.path.getsize(finished_path),
+    }
 
 # *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
 
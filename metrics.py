@@ -0,0 +1,154 @@
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+
+from flask import Response, request
+from sqlalchemy import event
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, generate_latest, CONTENT_TYPE_LATEST
+
+# *************************************!!!!!!!!!!!!! METRICS !!!!!!!!!!!!!!!!!!!********************************
+# Prometheus histograms for every pipeline stage (upload save, file copies, Textract call, block parsing, CSV write,
+# upscaler, image collection, DB commit), labelled by the endpoint and file type being processed, plus in-flight gauges
+# and cache/error counters. Served on /metrics by both apps.
+#
+# The endpoint/file type labels travel in a context variable, so code deep in methods.py can time a stage without
+# being told who called it. Requests set it in before_request, background jobs in JobQueue._run, and work handed to a
+# thread pool keeps it through bind(). Timing a stage is a perf_counter() pair and one histogram observe.
+#
+# With several worker processes (gunicorn), point PROMETHEUS_MULTIPROC_DIR at an empty directory shared by them.
+
+BUCKETS = (0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,120,300)
+
+STAGE_SECONDS = Histogram('visionextract_stage_seconds','Time spent in each pipeline stage',
+                          ['endpoint','filetype','stage'],buckets=BUCKETS)
+REQUEST_SECONDS = Histogram('visionextract_request_seconds','Time spent handling a request or background job',
+                            ['endpoint','filetype'],buckets=BUCKETS)
+IN_FLIGHT = Gauge('visionextract_in_flight','Requests and background jobs currently being handled',['endpoint'],
+                  multiprocess_mode='livesum')
+ADMISSION_IN_FLIGHT = Gauge('visionextract_admission_in_flight','Requests running in each admission lane',['lane'],
+                            multiprocess_mode='livesum')
+ADMISSION_WAITING = Gauge('visionextract_admission_waiting','Requests waiting for a slot in each admission lane',['lane'],
+                          multiprocess_mode='livesum')
+ADMISSION_REJECTED = Counter('visionextract_admission_rejected_total','Requests turned away with 429, by admission lane',['lane'])
+JOB_QUEUE_DEPTH = Gauge('visionextract_job_queue_depth','Background jobs submitted and not finished yet',
+                        multiprocess_mode='livesum')
+JOB_QUEUE_REJECTED = Counter('visionextract_job_queue_rejected_total','Jobs refused because the job queue was full')
+TEXTRACT_CALLS = Counter('visionextract_textract_calls_total','Textract call attempts by operation and outcome',
+                         ['operation','outcome'])
+TEXTRACT_CIRCUIT_OPEN = Gauge('visionextract_textract_circuit_open','1 while the Textract circuit breaker is open',
+                              multiprocess_mode='livemax')
+CACHE_LOOKUPS = Counter('visionextract_cache_lookups_total','Cache lookups by cache and result',['cache','result'])
+ERRORS = Counter('visionextract_errors_total','Failed stages and requests',['endpoint','filetype','stage'])
+
+_labels = contextvars.ContextVar('metric_labels',default=None)
+
+def current_labels():
+    labels = _labels.get()
+    return labels if labels is not None else {"endpoint":"none","filetype":"none"}
+
+def set_filetype(filetype):
+    # Called by routes that know what they are processing; later stages in the request pick it up
+    labels = _labels.get()
+    if labels is not None:
+        labels["filetype"] = filetype
+
+@contextmanager
+def stage(name):
+    labels = current_labels()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ERRORS.labels(labels["endpoint"],labels["filetype"],name).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(labels["endpoint"],labels["filetype"],name).observe(time.perf_counter() - start)
+
+@contextmanager
+def track(endpoint,filetype="none"):
+    # For work outside of a request, e.g. background jobs
+    token = _labels.set({"endpoint":endpoint,"filetype":filetype})
+    gauge = IN_FLIGHT.labels(endpoint)
+    gauge.inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        ERRORS.labels(endpoint,filetype,"request").inc()
+        raise
+    finally:
+        REQUEST_SECONDS.labels(endpoint,current_labels()["filetype"]).observe(time.perf_counter() - start)
+        gauge.dec()
+        _labels.reset(token)
+
+def bind(function):
+    # Thread pools don't inherit context variables, so the caller's labels are carried over explicitly
+    context = contextvars.copy_context()
+    def run(*args,**kwargs):
+        return context.run(function,*args,**kwargs)
+    return run
+
+def record_error(stage_name):
+    labels = current_labels()
+    ERRORS.labels(labels["endpoint"],labels["filetype"],stage_name).inc()
+
+def cache_lookup(cache,hit):
+    CACHE_LOOKUPS.labels(cache,"hit" if hit else "miss").inc()
+
+def metrics_response():
+    multiprocess_dir = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if multiprocess_dir:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry,path=multiprocess_dir)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry),mimetype=CONTENT_TYPE_LATEST)
+
+def _start_commit_timer(session):
+    session.info['metrics.commit_start'] = time.perf_counter()
+
+def _observe_commit(session):
+    start = session.info.pop('metrics.commit_start',None)
+    if start is not None:
+        labels = current_labels()
+        STAGE_SECONDS.labels(labels["endpoint"],labels["filetype"],"db_commit").observe(time.perf_counter() - start)
+
+def init_app(app,database):
+    @app.before_request
+    def start_request_metrics():
+        endpoint = request.endpoint or "none"
+        if endpoint == "metrics":
+            return
+        request.environ['metrics.token'] = _labels.set({"endpoint":endpoint,"filetype":"none"})
+        request.environ['metrics.start'] = time.perf_counter()
+        IN_FLIGHT.labels(endpoint).inc()
+
+    @app.after_request
+    def count_failed_responses(response):
+        # Also runs for the 500 response Flask builds from an unhandled exception
+        if response.status_code >= 500 and 'metrics.start' in request.environ:
+            labels = current_labels()
+            ERRORS.labels(labels["endpoint"],labels["filetype"],"request").inc()
+        return response
+
+    @app.teardown_request
+    def finish_request_metrics(error=None):
+        start = request.environ.pop('metrics.start',None)
+        if start is None:
+            return
+        labels = current_labels()
+        REQUEST_SECONDS.labels(labels["endpoint"],labels["filetype"]).observe(time.perf_counter() - start)
+        IN_FLIGHT.labels(labels["endpoint"]).dec()
+        _labels.reset(request.environ.pop('metrics.token'))
+
+    # Every commit (request handlers and background jobs alike) is timed from the final flush to the COMMIT. The
+    # listeners end up on the shared Session class, so they are only added once per process
+    if not event.contains(database.session,'before_commit',_start_commit_timer):
+        event.listen(database.session,'before_commit',_start_commit_timer)
+        event.listen(database.session,'after_commit',_observe_commit)
+
+    app.add_url_rule('/metrics','metrics',metrics_response)
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,50 @@
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy import Integer, String, Date, DateTime, Float, JSON
+
+# *************************************!!!!!!!!!!!!! MODELS !!!!!!!!!!!!!!!!!!!********************************
+# The database extension and the tables shared by the web app (main.py) and the API (api.py). Both apps are created
+# by factory.create_app(), which binds this one extension to each of them.
+
+# Create DataBase
+class Base(DeclarativeBase):
+    pass
+database = SQLAlchemy(model_class=Base)
+
+# Textract Table Configuration
+
+class Extract(database.Model):
+    id: Mapped[int] = mapped_column(Integer, primary_key = True)
+    name: Mapped[str] = mapped_column(String(250),unique = False, nullable=False, index=True)
+    filetype: Mapped[str] = mapped_column(String(100),nullable=False, index=True)
+    date: Mapped[Date] = mapped_column(Date,nullable=False, index=True)
+    file_location : Mapped[str] = mapped_column(String(250), nullable = False)
+    output_location : Mapped[str] = mapped_column(String(250),nullable=False)
+    input_size : Mapped[float] = mapped_column(Float,unique=False,nullable=False) # KB
+    output_size : Mapped[float] = mapped_column(Float,unique=False,nullable=False) # KB
+    text_output : Mapped[str] = mapped_column(String,nullable=True)
+    data_output : Mapped[dict] = mapped_column(JSON,nullable=True)
+    edit_date: Mapped[Date] = mapped_column(Date,nullable=True, index=True)
+    output_format: Mapped[str] = mapped_column(String(20),nullable=True)
+    encode_seconds: Mapped[float] = mapped_column(Float,nullable=True)
+    response_sha: Mapped[str] = mapped_column(String(64),nullable=True)
+    duration_seconds: Mapped[float] = mapped_column(Float,nullable=True)
+    table_files: Mapped[list] = mapped_column(JSON,nullable=True)
+
+# Background Job Configuration
+
+class Job(database.Model):
+    id: Mapped[str] = mapped_column(String(32), primary_key = True)
+    kind: Mapped[str] = mapped_column(String(50),nullable=False)
+    status: Mapped[str] = mapped_column(String(20),nullable=False)
+    payload: Mapped[dict] = mapped_column(JSON,nullable=False)
+    result: Mapped[dict] = mapped_column(JSON,nullable=True)
+    error: Mapped[str] = mapped_column(String,nullable=True)
+    worker: Mapped[str] = mapped_column(String(250),nullable=True)
+    created_at: Mapped[DateTime] = mapped_column(DateTime,nullable=False)
+    started_at: Mapped[DateTime] = mapped_column(DateTime,nullable=True)
+    finished_at: Mapped[DateTime] = mapped_column(DateTime,nullable=True)
+
+db_names = Extract.__table__.columns.keys()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
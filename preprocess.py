@@ -0,0 +1,77 @@
+import io
+import os
+import time
+
+# *************************************!!!!!!!!!!!!! TEXTRACT PRE-PROCESSING !!!!!!!!!!!!!!!!!!!********************************
+# Shrinks document images before they are sent to Textract: applies the EXIF orientation, converts to grayscale,
+# downscales anything over a pixel budget and re-encodes compactly. The original bytes are kept whenever the result
+# would not be smaller, and anything Pillow cannot open or re-encode (PDFs, corrupt images, decompression bombs)
+# passes through untouched.
+#
+# TEXTRACT_PREPROCESS        1/0, turns the stage on or off (default on)
+# TEXTRACT_PREPROCESS_MIN_KB documents smaller than this are sent as they are, since re-encoding them costs about as
+#                            much time as it saves in upload (default 256)
+# TEXTRACT_MAX_PIXELS        pixel budget; larger images are scaled down to fit (default 8 megapixels)
+# TEXTRACT_GRAYSCALE         1/0, convert to grayscale (default on)
+# TEXTRACT_JPEG_QUALITY      quality used when re-encoding photos as JPEG (default 85)
+
+LOSSLESS_FORMATS = {'PNG','GIF','BMP','TIFF'}
+
+def preprocess_settings():
+    return {
+        "enabled":os.environ.get('TEXTRACT_PREPROCESS','1') == '1',
+        "min_bytes":int(float(os.environ.get('TEXTRACT_PREPROCESS_MIN_KB',256)) * 1024),
+        "max_pixels":int(float(os.environ.get('TEXTRACT_MAX_PIXELS',8_000_000))),
+        "grayscale":os.environ.get('TEXTRACT_GRAYSCALE','1') == '1',
+        "jpeg_quality":int(os.environ.get('TEXTRACT_JPEG_QUALITY',85)),
+    }
+
+def _reencode(document_bytes,settings):
+    from PIL import Image, ImageOps
+    image = Image.open(io.BytesIO(document_bytes))
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+
+    if settings["grayscale"]:
+        if image.mode in ('RGBA','LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # Flatten transparency onto white so transparent areas don't turn black
+            background = Image.new('RGBA',image.size,'white')
+            image = Image.alpha_composite(background,image.convert('RGBA'))
+        image = image.convert('L')
+    elif image.mode not in ('RGB','L'):
+        image = image.convert('RGB')
+
+    width, height = image.size
+    if width * height > settings["max_pixels"]:
+        scale = (settings["max_pixels"] / (width * height)) ** 0.5
+        image = image.resize((max(1,int(width * scale)),max(1,int(height * scale))),Image.LANCZOS)
+
+    # Screenshots and scans stay lossless (PNG); photos are re-encoded as JPEG
+    output = io.BytesIO()
+    if source_format in LOSSLESS_FORMATS:
+        image.save(output,format='PNG',compress_level=6)
+    else:
+        image.save(output,format='JPEG',quality=settings["jpeg_quality"],optimize=True)
+    return output.getvalue()
+
+def preprocess_document(document_bytes,settings=None):
+    settings = settings or preprocess_settings()
+    start = time.perf_counter()
+    stats = {"original_bytes":len(document_bytes),"bytes":len(document_bytes),"saved_bytes":0,"seconds":0.0,"applied":False}
+    if not settings["enabled"] or len(document_bytes) < settings["min_bytes"]:
+        return document_bytes,stats
+    try:
+        processed = _reencode(document_bytes,settings)
+    except Exception:
+        # Not an image Pillow can read (e.g. a PDF), a truncated or corrupt one, or a decompression bomb: Textract gets
+        # the document as it was uploaded and reports on it itself
+        stats["seconds"] = round(time.perf_counter() - start,4)
+        return document_bytes,stats
+
+    stats["seconds"] = round(time.perf_counter() - start,4)
+    if len(processed) >= len(document_bytes):
+        return document_bytes,stats
+    stats.update({"bytes":len(processed),"saved_bytes":len(document_bytes) - len(processed),"applied":True})
+    return processed,stats
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import json
+import argparse
+import multiprocessing
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+from sqlalchemy import bindparam, select
+
+# *************************************!!!!!!!!!!!!! REPROCESSING !!!!!!!!!!!!!!!!!!!********************************
+# Rebuilds the outputs of text and data table rows (output files, output_location, output_size, data_output and the
+# stored tables in table_files) from the raw Textract responses kept by responses.py, without calling AWS. The parsing
+# runs on a pool of processes; the rows are then updated in a single transaction. text_output is left alone since it
+# only ever holds manual fixes.
+#
+# Used by POST /v1/reprocess, and from the command line (run from the repository root):
+#   python reprocess.py --all
+#   python reprocess.py --ids 3 7 12 --workers 4
+
+REPROCESSABLE = ('datatable','text')
+# The apps' instance folder (Flask puts it next to the modules), where a relative SQLite DATABASE_URL points
+INSTANCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),'instance')
+
+def rebuild_row(row):
+    # Runs in a pool process, so it only takes and returns plain data
+    from methods import parse_tables, write_tables, text_from_blocks, write_text
+    from responses import load_response
+    from tables import catalog
+
+    try:
+        response = load_response(row["response_sha"])
+        name = os.path.splitext(os.path.basename(row["file_location"]))[0]
+        if row["filetype"] == 'datatable':
+            tables = write_tables(name,parse_tables(response['Blocks']))
+            if not tables:
+                raise ValueError("No data table was found in the stored response")
+            output_location,data_output,table_files = tables[0]['output_location'],tables[0]['data'],catalog(tables)
+        else:
+            text = text_from_blocks(response['Blocks'])
+            output_location,data_output,table_files = write_text(name,text),text,None
+    except Exception as e:
+        return {"row_id":row["id"],"error":f"{type(e).__name__}: {e}"}
+    return {
+        "row_id":row["id"],
+        "output_location":output_location,
+        "output_size":os.path.getsize(output_location)/1024,
+        "data_output":data_output,
+        "table_files":table_files,
+    }
+
+def reprocess(engine,table,ids=None,filetype=None,workers=None):
+    start = time.perf_counter()
+    query = select(table.c.id,table.c.filetype,table.c.file_location,table.c.response_sha).where(table.c.filetype.in_(REPROCESSABLE))
+    if ids:
+        query = query.where(table.c.id.in_(ids))
+    if filetype:
+        query = query.where(table.c.filetype == filetype)
+    with engine.connect() as connection:
+        rows = [dict(row._mapping) for row in connection.execute(query)]
+    # Rows written before raw responses were stored have nothing to rebuild from
+    skipped = [row["id"] for row in rows if not row["response_sha"]]
+    rows = [row for row in rows if row["response_sha"]]
+
+    workers = min(workers or os.cpu_count() or 1,max(1,len(rows)))
+    if workers > 1:
+        # spawn: the web app has threads running, which fork() would copy in an unknown state
+        with ProcessPoolExecutor(max_workers=workers,mp_context=multiprocessing.get_context('spawn')) as pool:
+            results = list(pool.map(rebuild_row,rows,chunksize=max(1,len(rows) // (workers * 4))))
+    else:
+        results = [rebuild_row(row) for row in rows]
+
+    updates = [result for result in results if "error" not in result]
+    if updates:
+        statement = table.update().where(table.c.id == bindparam('row_id')).values(
+            output_location=bindparam('output_location'),
+            output_size=bindparam('output_size'),
+            data_output=bindparam('data_output'),
+            table_files=bindparam('table_files'),
+            # So incremental exports (GET /v1/export?since_edit_date=) pick up the rebuilt outputs
+            edit_date=date.today(),
+        )
+        with engine.begin() as connection:
+            connection.execute(statement,updates)
+    return {
+        "reprocessed":[result["row_id"] for result in updates],
+        "skipped":skipped,
+        "failed":{result["row_id"]:result["error"] for result in results if "error" in result},
+        "workers":workers,
+        "seconds":round(time.perf_counter() - start,3),
+    }
+
+def main():
+    from dotenv import load_dotenv
+    from sqlalchemy import MetaData, Table, create_engine
+    from db_config import database_url, resolve_database_url, configure_sqlite
+
+    load_dotenv(override=True)
+    parser = argparse.ArgumentParser(description="Rebuild text and data table outputs from the stored Textract responses")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--all',action='store_true',help="every text and data table row")
+    target.add_argument('--ids',type=int,nargs='+',help="only these Extract ids")
+    parser.add_argument('--filetype',choices=REPROCESSABLE)
+    parser.add_argument('--workers',type=int,help="worker processes (default: one per core)")
+    parser.add_argument('--database',help="SQLite file to update (default: the apps' database, from DATABASE_URL)")
+    args = parser.parse_args()
+
+    url = resolve_database_url(f"sqlite:///{os.path.abspath(args.database)}" if args.database else database_url(),INSTANCE_PATH)
+    if url.get_backend_name() == 'sqlite' and not os.path.isfile(url.database):
+        sys.exit(f"Database {url.database} does not exist")
+    engine = create_engine(url)
+    configure_sqlite(engine)
+    table = Table('extract',MetaData(),autoload_with=engine)
+    print(json.dumps(reprocess(engine,table,ids=args.ids,filetype=args.filetype,workers=args.workers)))
+
+if __name__ == "__main__":
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,37 @@
+import os
+import gzip
+import json
+import hashlib
+import tempfile
+
+# *************************************!!!!!!!!!!!!! RAW RESPONSE STORE !!!!!!!!!!!!!!!!!!!********************************
+# Every Textract response is kept gzipped and content-addressed (TEXTRACT_RESPONSE_DIR, default responses/), at
+# <dir>/<sha[:2]>/<sha>.json.gz where sha is the SHA-256 of the canonical JSON. Extract rows point at theirs through
+# response_sha, so outputs can be rebuilt later (see reprocess.py) without sending the document to AWS again.
+# Identical responses are stored once.
+
+def response_dir():
+    return os.environ.get('TEXTRACT_RESPONSE_DIR','responses')
+
+def response_path(sha):
+    return os.path.join(response_dir(),sha[:2],f"{sha}.json.gz")
+
+def store_response(response):
+    response = {key:value for key,value in response.items() if key != 'ResponseMetadata'}
+    # sort_keys makes the serialisation (and so the address) independent of dict ordering
+    data = json.dumps(response,sort_keys=True,separators=(',',':')).encode()
+    sha = hashlib.sha256(data).hexdigest()
+    path = response_path(sha)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),suffix='.tmp')
+        with os.fdopen(handle,'wb') as raw, gzip.GzipFile(fileobj=raw,mode='wb',mtime=0) as newfile:
+            newfile.write(data)
+        os.replace(temp_path,path)
+    return sha
+
+def load_response(sha):
+    with gzip.open(response_path(sha),'rb') as newfile:
+        return json.loads(newfile.read())
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
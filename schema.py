@@ -0,0 +1,56 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateTable
+
+# *************************************!!!!!!!!!!!!! SCHEMA UPKEEP !!!!!!!!!!!!!!!!!!!********************************
+# database.create_all() only creates missing tables, so anything added to an existing table later (indexes, columns)
+# is applied here for databases that were created by an older version of the app.
+
+def ensure_indexes(database,model):
+    for index in model.__table__.indexes:
+        index.create(bind=database.engine,checkfirst=True)
+
+def ensure_columns(database,model):
+    # New columns must be nullable (or have a server default) since existing rows get no value for them
+    table = model.__table__
+    existing = {column['name'] for column in inspect(database.engine).get_columns(table.name)}
+    with database.engine.begin() as connection:
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=database.engine.dialect)
+            connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN "{column.name}" {column_type}'))
+
+def ensure_column_types(database,model):
+    # SQLite can't change a column's type in place, so a table whose columns were declared with another type (e.g. the
+    # sizes, once String and now Float) is rebuilt: a copy is created with the current definition, the rows are
+    # copied over with CAST, and the copy replaces the original in one transaction. Indexes and triggers go with the
+    # old table; ensure_indexes() and ensure_fts() put them back.
+    table = model.__table__
+    dialect = database.engine.dialect
+    existing = {column['name']:column['type'] for column in inspect(database.engine).get_columns(table.name)}
+    changed = [column.name for column in table.columns
+               if column.name in existing and existing[column.name]._type_affinity is not column.type._type_affinity]
+    if not changed:
+        return []
+    staging = f"{table.name}_migrating"
+    create = str(CreateTable(table).compile(dialect=dialect)).replace(f"TABLE {table.name} ",f'TABLE "{staging}" ',1)
+    columns = [column for column in table.columns if column.name in existing]
+    selected = ", ".join(
+        f'CAST("{column.name}" AS {column.type.compile(dialect=dialect)})' if column.name in changed else f'"{column.name}"'
+        for column in columns
+    )
+    names = ", ".join(f'"{column.name}"' for column in columns)
+    with database.engine.begin() as connection:
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS "{staging}"')
+        connection.exec_driver_sql(create)
+        connection.exec_driver_sql(f'INSERT INTO "{staging}" ({names}) SELECT {selected} FROM {table.name}')
+        connection.exec_driver_sql(f'DROP TABLE {table.name}')
+        connection.exec_driver_sql(f'ALTER TABLE "{staging}" RENAME TO {table.name}')
+    return changed
+
+def reset_table(database,model):
+    # Drops and recreates one table (with its indexes), leaving the other tables in the shared metadata alone
+    model.__table__.drop(bind=database.engine,checkfirst=True)
+    model.__table__.create(bind=database.engine)
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
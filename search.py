@@ -0,0 +1,96 @@
+from sqlalchemy import text
+
+# *************************************!!!!!!!!!!!!! FULL-TEXT SEARCH !!!!!!!!!!!!!!!!!!!********************************
+# SQLite FTS5 index over the extracted content of every Extract row. Triggers keep it in step with every insert, update
+# (PATCH /fix, replace) and delete, whichever app or code path makes the change. data_output is stored as JSON (the
+# text of a text file, or a table as pandas JSON), so the triggers index it as plain text: the JSON string is decoded,
+# and a table is reduced to its headers and cells. Otherwise escapes such as \n would run into the next word and the
+# JSON punctuation would be indexed with the content. The index keeps its own copy of what it indexed, which is also
+# what search snippets are cut from.
+
+FTS_TABLE = "extract_fts"
+
+def _decoded(value):
+    # The JSON string's text, or the stored text itself when it isn't a JSON string
+    return f"(CASE WHEN NOT json_valid({value}) THEN {value} WHEN json_type({value}) = 'text' THEN json_extract({value},'$') ELSE {value} END)"
+
+def _flattened(value):
+    # Object keys (table headers and row labels) and every scalar value, space separated
+    decoded = _decoded(value)
+    return f"""(CASE WHEN json_valid({decoded}) AND json_type({decoded}) IN ('object','array') THEN (
+        SELECT group_concat(part,' ') FROM (
+            SELECT key AS part FROM json_tree({decoded}) WHERE typeof(key) = 'text'
+            UNION ALL
+            SELECT value FROM json_tree({decoded}) WHERE atom IS NOT NULL
+        )) ELSE {decoded} END)"""
+
+def _insert(row):
+    return f"""INSERT INTO {FTS_TABLE}(rowid, name, text_output, data_output)
+        SELECT {row}.id, {row}.name, {row}.text_output, {_flattened(f"{row}.data_output")}"""
+
+CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name, text_output, data_output, tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS extract_fts_insert AFTER INSERT ON extract BEGIN
+        {_insert("new")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS extract_fts_delete AFTER DELETE ON extract BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS extract_fts_update AFTER UPDATE ON extract BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        {_insert("new")};
+    END""",
+]
+REBUILD_STATEMENTS = [f"DELETE FROM {FTS_TABLE}",f"{_insert('extract')} FROM extract"]
+TRIGGERS = ("extract_fts_insert","extract_fts_delete","extract_fts_update")
+
+def ensure_fts(database,rebuild=False):
+    # The triggers live on the extract table, so they have to be recreated whenever that table is (e.g. after /clear)
+    with database.engine.begin() as connection:
+        existing = connection.execute(
+            text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"),{"name":FTS_TABLE}
+        ).first()
+        if existing is not None and "content='extract'" in existing.sql:
+            # Built by an older version as an external-content index over the raw JSON: replaced, and filled again
+            for trigger in TRIGGERS:
+                connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+            connection.exec_driver_sql(f"DROP TABLE {FTS_TABLE}")
+            existing = None
+        for statement in CREATE_STATEMENTS:
+            connection.exec_driver_sql(statement)
+        if rebuild or existing is None:
+            for statement in REBUILD_STATEMENTS:
+                connection.exec_driver_sql(statement)
+
+def match_expression(query):
+    # User input is matched as plain terms (all of them must appear); a trailing * keeps prefix matching
+    terms = []
+    for term in query.split():
+        prefix = term.endswith('*')
+        term = term.rstrip('*').replace('"','""')
+        if term:
+            terms.append(f'"{term}"*' if prefix else f'"{term}"')
+    return ' '.join(terms)
+
+def search(database,query,filetype=None,limit=20,offset=0):
+    expression = match_expression(query)
+    if not expression:
+        return []
+    # bm25 weights: a hit in the file name counts twice as much as one in the extracted content
+    statement = f"""
+        SELECT extract.id, extract.name, extract.filetype, extract.date, extract.output_location,
+               snippet({FTS_TABLE}, -1, '[', ']', '...', 12) AS snippet,
+               bm25({FTS_TABLE}, 2.0, 1.0, 1.0) AS score
+        FROM {FTS_TABLE} JOIN extract ON extract.id = {FTS_TABLE}.rowid
+        WHERE {FTS_TABLE} MATCH :expression {"AND extract.filetype = :filetype" if filetype else ""}
+        ORDER BY score
+        LIMIT :limit OFFSET :offset
+    """
+    rows = database.session.execute(
+        text(statement),{"expression":expression,"filetype":filetype,"limit":limit,"offset":offset}
+    ).mappings().all()
+    return [dict(row) for row in rows]
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,69 @@
+from sqlalchemy import text
+
+# *************************************!!!!!!!!!!!!! USAGE STATISTICS !!!!!!!!!!!!!!!!!!!********************************
+# Totals, averages and percentiles of the stored sizes and processing times for GET /v1/stats, overall, per file type and
+# per day. SQLite does all the aggregation (the percentiles with window functions), so only one row per group reaches
+# Python however long the history is.
+
+GROUPS = {"filetype":"filetype","day":"date"}
+METRICS = {"input_kb":"input_size","output_kb":"output_size","duration_seconds":"duration_seconds"}
+PERCENTILES = (50,95,99)
+
+def _where(conditions):
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+def _aggregates(database,group,conditions,params):
+    sums = ", ".join(f"SUM({column}) AS {name}_total, AVG({column}) AS {name}_avg" for name,column in METRICS.items())
+    statement = f"SELECT {group} AS grp, COUNT(*) AS files, {sums} FROM extract {_where(conditions)} GROUP BY grp ORDER BY grp"
+    return database.session.execute(text(statement),params).mappings().all()
+
+def _percentiles(database,group,column,conditions,params):
+    # Nearest rank: the value at position ceil(p/100 * n) among the group's sorted non-null values
+    picks = ", ".join(f"MAX(CASE WHEN position = (total * {p} + 99) / 100 THEN value END) AS p{p}" for p in PERCENTILES)
+    statement = f"""
+        SELECT grp, {picks} FROM (
+            SELECT {group} AS grp, {column} AS value,
+                   ROW_NUMBER() OVER (PARTITION BY {group} ORDER BY {column}) AS position,
+                   COUNT(*) OVER (PARTITION BY {group}) AS total
+            FROM extract {_where([*conditions,f"{column} IS NOT NULL"])}
+        ) GROUP BY grp
+    """
+    return {row["grp"]:row for row in database.session.execute(text(statement),params).mappings()}
+
+def _rounded(value):
+    return round(value,4) if value is not None else None
+
+def _summarise(database,group,conditions,params):
+    ranked = {name:_percentiles(database,group,column,conditions,params) for name,column in METRICS.items()}
+    summary = []
+    for row in _aggregates(database,group,conditions,params):
+        entry = {"files":row["files"]}
+        for name in METRICS:
+            ranks = ranked[name].get(row["grp"],{})
+            entry[name] = {"total":_rounded(row[f"{name}_total"]),"avg":_rounded(row[f"{name}_avg"]),
+                           **{f"p{p}":_rounded(ranks.get(f"p{p}")) for p in PERCENTILES}}
+        summary.append((row["grp"],entry))
+    return summary
+
+def usage_stats(database,filetype=None,since=None,until=None,groups=tuple(GROUPS)):
+    conditions, params = [], {}
+    if filetype:
+        conditions.append("filetype = :filetype")
+        params["filetype"] = filetype
+    # Dates are stored as ISO strings, so they compare correctly as text
+    if since:
+        conditions.append("date >= :since")
+        params["since"] = since.isoformat()
+    if until:
+        conditions.append("date <= :until")
+        params["until"] = until.isoformat()
+
+    totals = _summarise(database,"'all'",conditions,params)
+    empty = {"files":0,**{name:{"total":None,"avg":None,**{f"p{p}":None for p in PERCENTILES}} for name in METRICS}}
+    return {
+        "totals":totals[0][1] if totals else empty,
+        **{f"by_{name}":[{name:grp,**entry} for grp,entry in _summarise(database,column,conditions,params)]
+           for name,column in GROUPS.items() if name in groups},
+    }
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,310 @@
+import os
+import re
+import tempfile
+
+from metrics import stage
+
+# *************************************!!!!!!!!!!!!! TABLE STORE !!!!!!!!!!!!!!!!!!!********************************
+# Every extracted table is stored as a Parquet file with typed columns, inferred once when the table is extracted, next
+# to the CSV export (output/<name>/<name>_<n>.parquet and .csv), which keeps the cells exactly as read. The Extract row
+# lists its tables, with their column names, types and currency units, in table_files. query_tables() projects, filters
+# and aggregates over one or many stored tables. It only reads the columns a query needs, one record batch at a time,
+# so no whole CSV or JSON blob is loaded.
+
+BATCH_ROWS = 8192
+CURRENCY = "$€£¥"
+# Plain or comma-grouped digits with an optional decimal part: 12, -3.5, 1,234,567.89
+NUMBER = re.compile(r"^[+-]?(\d{1,3}(,\d{3})+|\d+)?(\.\d+)?$")
+# Past these a number would be rounded, so the column stays text
+MAX_FLOAT_DIGITS = 15
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+OPERATORS = {"=":"equal","!=":"not_equal","<":"less","<=":"less_equal",">":"greater",">=":"greater_equal"}
+AGGREGATES = ("count","sum","mean","min","max")
+
+# !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! STORING !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+
+def column_names(header):
+    # Parquet needs unique, non-empty names: blank headers become column_<n>, repeats get _2, _3, ...
+    names, seen = [], set()
+    for position, name in enumerate(header, start=1):
+        name = ' '.join(str(name).split()) or f"column_{position}"
+        candidate, suffix = name, 2
+        while candidate in seen:
+            candidate = f"{name}_{suffix}"
+            suffix += 1
+        seen.add(candidate)
+        names.append(candidate)
+    return names
+
+def _number(value):
+    # The cell as (currency symbol or "", int or float), or None if it isn't a number that survives the conversion
+    # exactly: leading zeros (zip codes, ids), more than 15 significant digits or values past int64 stay text
+    currency = ""
+    if value[0] in CURRENCY:
+        currency, value = value[0], value[1:].strip()
+    if not NUMBER.match(value) or not any(character.isdigit() for character in value):
+        return None
+    value = value.replace(',','')
+    whole, _, fraction = value.lstrip('+-').partition('.')
+    if len(whole) > 1 and whole[0] == '0':
+        return None
+    if '.' in value:
+        if len((whole + fraction).lstrip('0')) > MAX_FLOAT_DIGITS:
+            return None
+        return currency,float(value)
+    number = int(value)
+    if not INT64_MIN <= number <= INT64_MAX:
+        return None
+    return currency,number
+
+def _numbers(values):
+    # The column's values as numbers (None for blank cells) and their currency symbol ("" for none), or None if any
+    # cell isn't a number or the cells don't share one currency
+    numbers, currencies = [], set()
+    for value in values:
+        value = value.strip()
+        if not value:
+            numbers.append(None)
+            continue
+        parsed = _number(value)
+        if parsed is None:
+            return None
+        currencies.add(parsed[0])
+        numbers.append(parsed[1])
+    if len(currencies) > 1:
+        return None
+    return numbers,currencies.pop() if currencies else ""
+
+def typed_column(values):
+    # The column as an Arrow array, and the currency its numbers were written in ("" for none)
+    import pyarrow as pa
+    parsed = _numbers(values)
+    if parsed is not None and any(number is not None for number in parsed[0]):
+        numbers, currency = parsed
+        if all(isinstance(number,int) or number is None for number in numbers):
+            return pa.array(numbers,type=pa.int64()),currency
+        # Integers mixed with decimals become doubles, which only hold 15 significant digits exactly
+        if all(number is None or isinstance(number,float) or abs(number) < 10 ** MAX_FLOAT_DIGITS for number in numbers):
+            return pa.array([float(number) if number is not None else None for number in numbers],type=pa.float64()),currency
+    return pa.array([value.strip() or None for value in values],type=pa.string()),""
+
+def typed_table(grid):
+    import pyarrow as pa
+    # The first row of the grid holds the headers; every cell below it is typed with the rest of its column. A currency
+    # stripped from a column is kept as its "unit" in the field metadata, which the Parquet file stores with the schema
+    names = column_names(grid[0])
+    body = grid[1:]
+    arrays, fields = [], []
+    for position, name in enumerate(names):
+        array, currency = typed_column([row[position] for row in body])
+        arrays.append(array)
+        fields.append(pa.field(name,array.type,metadata={"unit":currency} if currency else None))
+    return pa.Table.from_arrays(arrays,schema=pa.schema(fields))
+
+def _write_atomically(path,write):
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path),suffix='.tmp')
+    os.close(handle)
+    try:
+        write(temp_path)
+        os.replace(temp_path,path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+def write_csv(grid,path):
+    import csv
+    # The cells exactly as Textract read them, laid out like the pandas export this replaced
+    with open(path,'w',newline='',encoding='utf-8') as newfile:
+        csv.writer(newfile,lineterminator='\n').writerows(grid)
+
+def records(grid):
+    # The table as JSON records of the cells as read, keyed by the stored column names
+    names = column_names(grid[0])
+    return [dict(zip(names,row)) for row in grid[1:]]
+
+def describe_columns(schema):
+    columns = []
+    for field in schema:
+        column = {"name":field.name,"type":str(field.type)}
+        if field.metadata and b"unit" in field.metadata:
+            column["unit"] = field.metadata[b"unit"].decode()
+        columns.append(column)
+    return columns
+
+def store_table(grid,parquet_path,csv_path):
+    # Parquet gets the typed table for queries; the CSV keeps the raw cells so the export matches the document
+    import pyarrow.parquet as pq
+    table = typed_table(grid)
+    with stage('parquet_write'):
+        _write_atomically(parquet_path,lambda path: pq.write_table(table,path))
+    with stage('csv_write'):
+        _write_atomically(csv_path,lambda path: write_csv(grid,path))
+    return {
+        "location":parquet_path,
+        "rows":table.num_rows,
+        "columns":describe_columns(table.schema),
+    }
+
+def catalog(tables):
+    # The entries kept in Extract.table_files for the tables returned by methods.write_tables()
+    return [{"index":table["index"],"location":table["table_location"],"rows":table["rows"],"columns":table["schema"]}
+            for table in tables]
+
+def replace_table(grid,output_location,table_files):
+    # An uploaded table replaces table 1 of a data table row: its Parquet file and CSV export are rewritten in place.
+    # Returns the row's new table_files and data_output (the table as JSON records)
+    import json
+    current = (table_files or [{}])[0]
+    parquet_path = current.get("location") or f"{os.path.splitext(output_location)[0]}.parquet"
+    stored = store_table(grid,parquet_path,output_location)
+    entry = {"index":1,"location":parquet_path,"rows":stored["rows"],"columns":stored["columns"]}
+    return [entry,*(table_files or [])[1:]],json.dumps(records(grid))
+
+def read_grid(path):
+    # A replacement table uploaded as CSV, or as JSON (a list of records, or {"column":[values]}), as a grid of text
+    import csv
+    import json
+    if path.lower().endswith('.json'):
+        with open(path,encoding='utf-8') as newfile:
+            data = json.load(newfile)
+        if isinstance(data,dict):
+            columns = list(data)
+            data = [dict(zip(columns,values)) for values in zip(*data.values())]
+        columns = list(dict.fromkeys(key for record in data for key in record))
+        grid = [columns,*[["" if record.get(column) is None else str(record.get(column)) for column in columns] for record in data]]
+    else:
+        with open(path,newline='',encoding='utf-8-sig') as newfile:
+            grid = [row for row in csv.reader(newfile)]
+        width = max((len(row) for row in grid),default=0)
+        grid = [row + [''] * (width - len(row)) for row in grid]
+    if not grid or not grid[0]:
+        raise ValueError("The table has no columns")
+    return grid
+
+# !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!! QUERYING !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!
+
+def _conditions(where):
+    conditions = []
+    for condition in where or []:
+        if not isinstance(condition,(list,tuple)) or len(condition) != 3:
+            raise ValueError("Each where condition must be [column, operator, value].")
+        column, operator, value = condition
+        if operator not in (*OPERATORS,"in","contains"):
+            raise ValueError(f"Unknown operator {operator!r}; use one of {', '.join([*OPERATORS,'in','contains'])}.")
+        if operator == "in" and not isinstance(value,list):
+            raise ValueError("The value of an 'in' condition must be a list.")
+        conditions.append((column,operator,value))
+    return conditions
+
+def _aggregate_spec(aggregate):
+    spec = {}
+    for column, functions in (aggregate or {}).items():
+        functions = [functions] if isinstance(functions,str) else list(functions)
+        unknown = [function for function in functions if function not in AGGREGATES]
+        if unknown:
+            raise ValueError(f"Unknown aggregates {', '.join(map(str,unknown))}; use {', '.join(AGGREGATES)}.")
+        spec[column] = functions
+    return spec
+
+def _mask(batch,conditions):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    mask = None
+    for column, operator, value in conditions:
+        values = batch.column(column)
+        try:
+            if operator == "contains":
+                test = pc.match_substring(values.cast(pa.string()),str(value),ignore_case=True)
+            elif operator == "in":
+                test = pc.is_in(values,value_set=pa.array(value).cast(values.type))
+            else:
+                test = getattr(pc,OPERATORS[operator])(values,pa.scalar(value))
+        except (pa.ArrowNotImplementedError,pa.ArrowInvalid,pa.ArrowTypeError) as e:
+            raise ValueError(f"Can't compare column {column!r} ({values.type}) with {value!r}.") from e
+        mask = test if mask is None else pc.and_kleene(mask,test)
+    return mask
+
+def _accumulate(groups,batch,group_by,spec):
+    import pyarrow as pa
+    # Per-batch partial aggregates, merged into one running entry per group
+    partials = [([],"count_all")]
+    for column in spec:
+        partials += [(column,"count"),(column,"min"),(column,"max")]
+        if {"sum","mean"} & set(spec[column]):
+            partials.append((column,"sum"))
+    try:
+        result = pa.Table.from_batches([batch]).group_by(group_by).aggregate(partials)
+    except (pa.ArrowNotImplementedError,pa.ArrowTypeError) as e:
+        raise ValueError(f"Aggregate not supported for these column types: {e}") from e
+    for row in result.to_pylist():
+        key = tuple(row[column] for column in group_by)
+        entry = groups.setdefault(key,{"rows":0,**{column:{"count":0,"sum":None,"min":None,"max":None} for column in spec}})
+        entry["rows"] += row["count_all"]
+        for column in spec:
+            running = entry[column]
+            running["count"] += row[f"{column}_count"]
+            if row.get(f"{column}_sum") is not None:
+                running["sum"] = row[f"{column}_sum"] + (running["sum"] or 0)
+            for function, pick in (("min",min),("max",max)):
+                value = row[f"{column}_{function}"]
+                if value is not None:
+                    running[function] = value if running[function] is None else pick(running[function],value)
+
+def _finish(groups,group_by,spec,limit):
+    results = []
+    for key in sorted(groups,key=lambda key: tuple((value is None,str(value)) for value in key))[:limit]:
+        entry = groups[key]
+        result = {**dict(zip(group_by,key)),"rows":entry["rows"]}
+        for column, functions in spec.items():
+            running = entry[column]
+            values = {"count":running["count"],"sum":running["sum"],"min":running["min"],"max":running["max"],
+                      "mean":running["sum"] / running["count"] if running["count"] and running["sum"] is not None else None}
+            result[column] = {function:values[function] for function in functions}
+        results.append(result)
+    return results
+
+def query_tables(sources,columns=None,where=None,group_by=None,aggregate=None,limit=100):
+    # sources: (extract_id, table entry from Extract.table_files) pairs, e.g. streamed from the database
+    import pyarrow.parquet as pq
+    conditions = _conditions(where)
+    spec = _aggregate_spec(aggregate)
+    group_by = list(group_by or [])
+    if group_by and not spec:
+        raise ValueError("group_by needs at least one aggregate.")
+    rows, groups, skipped = [], {}, []
+    tables_scanned = rows_scanned = 0
+    for extract_id, table in sources:
+        available = [column["name"] for column in table["columns"]]
+        projected = list(dict.fromkeys((group_by + list(spec)) if spec else (columns or available)))
+        needed = list(dict.fromkeys(projected + [condition[0] for condition in conditions]))
+        missing = [column for column in needed if column not in available]
+        if missing:
+            skipped.append({"id":extract_id,"table":table["index"],"missing":missing})
+            continue
+        try:
+            parquet = pq.ParquetFile(table["location"])
+        except OSError:
+            skipped.append({"id":extract_id,"table":table["index"],"missing_file":table["location"]})
+            continue
+        tables_scanned += 1
+        with stage('table_scan'):
+            for batch in parquet.iter_batches(batch_size=BATCH_ROWS,columns=needed):
+                rows_scanned += batch.num_rows
+                mask = _mask(batch,conditions)
+                if mask is not None:
+                    batch = batch.filter(mask)
+                if spec:
+                    _accumulate(groups,batch,group_by,spec)
+                    continue
+                for record in batch.select(projected).to_pylist():
+                    rows.append({"id":extract_id,"table":table["index"],**record})
+                    if len(rows) >= limit:
+                        return {"rows":rows,"truncated":True,"tables_scanned":tables_scanned,
+                                "rows_scanned":rows_scanned,"skipped":skipped}
+    summary = {"tables_scanned":tables_scanned,"rows_scanned":rows_scanned,"skipped":skipped}
+    if spec:
+        return {"groups":_finish(groups,group_by,spec,limit),"truncated":len(groups) > limit,**summary}
+    return {"rows":rows,"truncated":False,**summary}
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the top of the repository and the benchmark helpers (stubs, synthetic responses) in benchmarks/
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0,REPO_DIR)
+sys.path.insert(0,os.path.join(REPO_DIR,'benchmarks'))
+
+# Read when the apps are imported, so they are set before any test module imports them
+os.environ.setdefault('API_KEY','test-key')
+os.environ.setdefault('DATABASE_URL',f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='visionextract-tests-'),'textract.db')}")
+os.environ.setdefault('AWS_DEFAULT_REGION','us-east-1')
+os.environ.setdefault('TEXTRACT_BATCH_WORKERS','3')
+# The stub client stands in for Textract; the gateway's rate limits would only slow the tests down
+os.environ.setdefault('TEXTRACT_ANALYZE_TPS','0')
+os.environ.setdefault('TEXTRACT_DETECT_TPS','0')
+
+import pytest
+
+AUTH = {"Authorization":f"Bearer {os.environ['API_KEY']}"}
+
+@pytest.fixture
+def app(tmp_path,monkeypatch):
+    # The v1 API on the test database, emptied, with its relative paths (uploads, outputs, caches) in a fresh directory
+    import api
+    from factory import warm_up
+    from models import database, Extract
+    monkeypatch.chdir(tmp_path)
+    for directory in ('input','output',os.path.join('static','Source','inputs')):
+        os.makedirs(directory)
+    warm_up(api.app)
+    with api.app.app_context():
+        database.session.query(Extract).delete()
+        database.session.commit()
+    return api.app
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def add_rows(app):
+    # Inserts Extract rows from keyword dicts (name and filetype at least) and returns their ids
+    from datetime import date
+    from models import database, Extract
+
+    def add(*rows):
+        with app.app_context():
+            extracts = [Extract(**{"date":date.today(),"file_location":"in","output_location":"out","input_size":1.0,
+                                   "output_size":1.0,**row}) for row in rows]
+            database.session.add_all(extracts)
+            database.session.commit()
+            return [extract.id for extract in extracts]
+    return add
@@ -0,0 +1,116 @@
+import gc
+import time
+import threading
+
+import pytest
+from flask import Flask, Response, stream_with_context
+from werkzeug.test import EnvironBuilder
+
+import admission
+from admission import Budget, Lane, Rejected
+
+@pytest.fixture
+def app(monkeypatch):
+    # One slot in the bulk lane and no queue, so a second bulk request is turned away at once
+    monkeypatch.setenv('ADMISSION_BULK_LIMIT','1')
+    monkeypatch.setenv('ADMISSION_BULK_QUEUE','0')
+    app = Flask(__name__)
+    app.extensions['visionextract'] = {}
+
+    @app.route('/report')
+    def report():
+        return {"rows":3}
+
+    @app.route('/export')
+    def export():
+        return Response(stream_with_context(f"line {index}\n" for index in range(3)),mimetype='application/x-ndjson')
+
+    @app.route('/broken')
+    def broken():
+        raise RuntimeError("failed")
+
+    @app.route('/page')
+    def page():
+        return "page"
+
+    admission.init_app(app,{"report":"bulk","export":"bulk","broken":"bulk"})
+    return app
+
+def bulk(app):
+    return app.extensions['visionextract']["admission"]["lanes"]["bulk"]
+
+def call(app,path):
+    # Runs the request the way a WSGI server does, returning the unclosed response body
+    statuses = []
+    body = app.wsgi_app(EnvironBuilder(path=path).get_environ(),
+                        lambda status,headers,exc_info=None: statuses.append((status,dict(headers))))
+    return body,statuses
+
+def test_full_lane_answers_429_with_retry_after(app):
+    body, statuses = call(app,'/export')
+    assert statuses[0][0] == '200 OK'
+    with app.test_client().get('/report') as response:
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+    # Other lanes are not affected
+    with app.test_client().get('/page') as response:
+        assert response.status_code == 200
+    b"".join(body)
+    body.close()
+    assert bulk(app).in_flight == 0
+    with app.test_client().get('/report') as response:
+        assert response.status_code == 200
+
+def test_streamed_response_holds_its_slot_until_closed(app):
+    body, statuses = call(app,'/export')
+    assert b"".join(body) == b"line 0\nline 1\nline 2\n"
+    assert bulk(app).in_flight == 1
+    body.close()
+    assert bulk(app).in_flight == 0
+
+def test_slot_is_not_leaked_when_the_response_is_never_closed(app):
+    body, statuses = call(app,'/report')
+    assert bulk(app).in_flight == 0
+    body, statuses = call(app,'/export')
+    assert bulk(app).in_flight == 1
+    del body
+    gc.collect()
+    assert bulk(app).in_flight == 0
+
+def test_slot_is_released_when_the_view_fails(app):
+    app.testing = False
+    with app.test_client().get('/broken') as response:
+        assert response.status_code == 500
+    assert bulk(app).in_flight == 0 and bulk(app).budget.used == 0
+
+def test_lane_queue_and_retry_after():
+    lane = Lane("bulk",limit=1,queue=1,wait=5)
+    started = lane.acquire()
+    waiter = threading.Thread(target=lambda: lane.release(lane.acquire()))
+    waiter.start()
+    while lane.describe()["waiting"] == 0:
+        time.sleep(0.01)
+    # The queue is full too
+    with pytest.raises(Rejected) as rejected:
+        lane.acquire()
+    assert rejected.value.retry_after == lane.retry_after() >= 1
+    lane.release(started)
+    waiter.join(5)
+    assert (lane.in_flight,lane.waiting,lane.rejected) == (0,0,1)
+
+def test_waiting_request_is_turned_away_after_the_wait():
+    lane = Lane("bulk",limit=1,queue=1,wait=0.05)
+    lane.acquire()
+    with pytest.raises(Rejected):
+        lane.acquire()
+    assert lane.waiting == 0
+
+def test_heavy_lanes_share_one_budget():
+    budget = Budget(1)
+    upload, textract = Lane("upload",4,0,0,budget=budget), Lane("textract",4,0,0,budget=budget)
+    started = upload.acquire()
+    with pytest.raises(Rejected):
+        textract.acquire()
+    upload.release(started)
+    textract.release(textract.acquire())
+    assert budget.used == 0
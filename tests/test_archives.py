@@ -0,0 +1,62 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+import archives
+import main
+
+@pytest.fixture
+def output(tmp_path,monkeypatch):
+    # main resolves output folders under its root path, and the archive cache is relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main.app,'root_path',str(tmp_path))
+    folder = tmp_path / "output" / "report"
+    (folder / "tables").mkdir(parents=True)
+    (folder / "report.csv").write_text("Quarter,Revenue\n" * 500)
+    (folder / "tables" / "report_0.parquet").write_bytes(os.urandom(4096))
+    (folder / "page.png").write_bytes(os.urandom(2048))
+    return folder
+
+def download(path):
+    with main.app.test_client().get(f'/download/Table/output/{path}') as response:
+        return response.status_code,response.get_data()
+
+def test_folder_is_streamed_as_a_zip(output):
+    with main.app.test_client().get('/download/Table/output/report') as response:
+        assert response.status_code == 200 and response.is_streamed
+        assert response.headers['Content-Disposition'] == 'attachment; filename="report.zip"'
+        data = response.get_data()
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert sorted(archive.namelist()) == ["page.png","report.csv","tables/report_0.parquet"]
+        assert archive.read("report.csv") == (output / "report.csv").read_bytes()
+        assert archive.read("tables/report_0.parquet") == (output / "tables" / "report_0.parquet").read_bytes()
+        # Already compressed formats are stored, everything else deflated
+        assert archive.getinfo("page.png").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("tables/report_0.parquet").compress_type == zipfile.ZIP_STORED
+        assert archive.getinfo("report.csv").compress_type == zipfile.ZIP_DEFLATED
+
+def test_second_download_is_served_from_the_cache(output,monkeypatch):
+    status, first = download("report")
+    assert status == 200
+    assert len(os.listdir(archives.archive_cache_dir())) == 1
+
+    def no_stream(*args):
+        raise AssertionError("an unchanged folder should not be zipped again")
+
+    monkeypatch.setattr(archives,'_stream',no_stream)
+    assert download("report") == (200,first)
+
+def test_changed_folder_is_zipped_again(output):
+    download("report")
+    (output / "report.csv").write_text("Quarter,Revenue\nQ1,10\n")
+    status, data = download("report")
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("report.csv") == b"Quarter,Revenue\nQ1,10\n"
+    assert len(os.listdir(archives.archive_cache_dir())) == 2
+
+def test_paths_outside_output_are_not_found(output,tmp_path):
+    (tmp_path / "secret").mkdir()
+    assert download("..%2Fsecret")[0] == 404
+    assert download("missing")[0] == 404
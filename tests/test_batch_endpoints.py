@@ -0,0 +1,128 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import api
+import methods
+from models import database, Extract
+from stub_textract import StubTextract
+
+HEADERS = {"Authorization":f"Bearer {os.environ['API_KEY']}"}
+
+class CountingTextract(StubTextract):
+    # Records the most calls that were ever in progress at once
+    def __init__(self,**kwargs):
+        super().__init__(**kwargs)
+        self.in_progress = 0
+        self.most_in_progress = 0
+
+    def _call(self,document):
+        with self.lock:
+            self.in_progress += 1
+            self.most_in_progress = max(self.most_in_progress,self.in_progress)
+        try:
+            return super()._call(document)
+        finally:
+            with self.lock:
+                self.in_progress -= 1
+
+def image_bytes(seed):
+    # A different image for every file, so none of them is answered from the result cache
+    buffer = io.BytesIO()
+    Image.new('RGB',(32,32),(seed * 37 % 256,seed * 91 % 256,seed * 13 % 256)).save(buffer,format='PNG')
+    return buffer.getvalue()
+
+def uploads(field,count,prefix):
+    return {field:[(io.BytesIO(image_bytes(index)),f"{prefix}_{index}.png") for index in range(count)]}
+
+@pytest.fixture
+def client(tmp_path,monkeypatch):
+    # Uploads, outputs, the result cache and stored responses all go under relative paths, here a fresh directory
+    monkeypatch.chdir(tmp_path)
+    for directory in ('input','output'):
+        os.makedirs(directory)
+    monkeypatch.setattr(methods,'textract',CountingTextract(latency=0.2,sleep=True))
+    with api.app.app_context():
+        database.create_all()
+        database.session.query(Extract).delete()
+        database.session.commit()
+    yield api.app.test_client()
+
+def saved_rows():
+    with api.app.app_context():
+        return database.session.query(Extract).order_by(Extract.id).all()
+
+def test_table_batch_returns_each_file(client):
+    with client.post('/v1/add_table_batch',headers=HEADERS,data=uploads('dataextract[]',3,"table"),
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 200
+        files = response.get_json()['response']['files']
+    assert [result['file'] for result in files] == ["table_0.png","table_1.png","table_2.png"]
+    for result in files:
+        assert 'error' not in result
+        assert os.path.exists(result['output_location'])
+        assert result['tables'] and result['seconds'] > 0
+    rows = saved_rows()
+    assert sorted(row.id for row in rows) == sorted(result['id'] for result in files)
+    assert {row.filetype for row in rows} == {"datatable"}
+
+def test_text_batch_returns_each_file(client):
+    with client.post('/v1/add_text_batch',headers=HEADERS,data=uploads('textract[]',3,"text"),
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 200
+        files = response.get_json()['response']['files']
+    assert [result['file'] for result in files] == ["text_0.png","text_1.png","text_2.png"]
+    for result in files:
+        assert 'error' not in result
+        assert os.path.exists(result['output_location'])
+    rows = saved_rows()
+    assert len(rows) == 3
+    assert all(row.filetype == "text" and row.data_output for row in rows)
+
+def test_failed_extraction_is_reported_for_that_file(client,monkeypatch):
+    build = api.build_text_row
+
+    def failing_build(image_path,*args,**kwargs):
+        if os.path.basename(image_path) == "text_1.png":
+            raise ValueError("unreadable")
+        return build(image_path,*args,**kwargs)
+
+    monkeypatch.setattr(api,'build_text_row',failing_build)
+    with client.post('/v1/add_text_batch',headers=HEADERS,data=uploads('textract[]',3,"text"),
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 200
+        files = response.get_json()['response']['files']
+    assert files[1]['error'] == "ValueError: unreadable" and 'id' not in files[1]
+    assert 'id' in files[0] and 'id' in files[2]
+    assert len(saved_rows()) == 2
+
+def test_batch_rolls_back_when_a_row_cannot_be_saved(client,monkeypatch):
+    build = api.build_table_row
+
+    def unsaveable_build(image_path,*args,**kwargs):
+        row,details = build(image_path,*args,**kwargs)
+        if os.path.basename(image_path) == "table_2.png":
+            row.name = None # NOT NULL, so the insert fails
+        return row,details
+
+    monkeypatch.setattr(api,'build_table_row',unsaveable_build)
+    with client.post('/v1/add_table_batch',headers=HEADERS,data=uploads('dataextract[]',4,"table"),
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 500
+    assert saved_rows() == []
+    # The session is usable again afterwards
+    with client.post('/v1/add_table_batch',headers=HEADERS,data=uploads('dataextract[]',1,"again"),
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 200
+    assert len(saved_rows()) == 1
+
+def test_concurrency_is_capped_by_the_pool(client):
+    workers = int(os.environ['TEXTRACT_BATCH_WORKERS'])
+    assert api.textract_pool._max_workers == workers
+    with client.post('/v1/add_text_batch',headers=HEADERS,data=uploads('textract[]',workers * 3,"text"),
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 200
+    assert methods.textract.calls == workers * 3
+    assert methods.textract.most_in_progress == workers
@@ -0,0 +1,45 @@
+import os
+
+import cache
+from cache import ResultCache
+
+def directory_size(directory):
+    return sum(os.path.getsize(os.path.join(root,file)) for root,_,files in os.walk(directory) for file in files)
+
+def test_writes_do_not_walk_the_cache(tmp_path,monkeypatch):
+    walks = []
+    walk = os.walk
+    monkeypatch.setattr(cache.os,'walk',lambda directory: walks.append(directory) or walk(directory))
+    result_cache = ResultCache(str(tmp_path),max_bytes=10 * 1024 * 1024,max_age=3600)
+    for index in range(50):
+        result_cache.set(f"text-{index:064x}",["row"] * 10)
+    # Counted once on the first write, never again while the cache is under its cap
+    assert len(walks) == 1
+    assert result_cache.get(f"text-{0:064x}") == ["row"] * 10
+
+def test_cache_stays_under_its_cap(tmp_path):
+    result_cache = ResultCache(str(tmp_path),max_bytes=20_000,max_age=3600)
+    for index in range(200):
+        result_cache.set(f"text-{index:064x}",["x" * 100])
+        assert directory_size(str(tmp_path)) <= 20_000
+    assert result_cache.budget.total == directory_size(str(tmp_path))
+
+def test_caches_on_one_directory_share_a_budget(tmp_path):
+    first = ResultCache(str(tmp_path),max_bytes=20_000,max_age=3600)
+    second = ResultCache(str(tmp_path),max_bytes=20_000,max_age=3600)
+    assert first.budget is second.budget
+    for index in range(100):
+        (first if index % 2 else second).set(f"text-{index:064x}",["x" * 100])
+        assert directory_size(str(tmp_path)) <= 20_000
+
+def test_entry_pruned_after_it_was_read_is_still_a_hit(tmp_path,monkeypatch):
+    result_cache = ResultCache(str(tmp_path),max_bytes=10 * 1024 * 1024,max_age=3600)
+    key = f"text-{1:064x}"
+    result_cache.set(key,"text")
+
+    def pruned(path,times):
+        os.remove(path)
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(cache.os,'utime',pruned)
+    assert result_cache.get(key) == "text"
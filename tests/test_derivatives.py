@@ -0,0 +1,60 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import derivatives
+import main
+
+@pytest.fixture
+def site(app,tmp_path,monkeypatch):
+    # The site app on the test database, rooted in the test directory (the working directory, see conftest) with the
+    # repository's templates linked in
+    monkeypatch.setattr(main.app,'root_path',str(tmp_path))
+    os.symlink(os.path.join(os.path.dirname(os.path.abspath(main.__file__)),'templates'),'templates')
+    Image.new('RGB',(1600,1200),(200,40,40)).save(os.path.join('static','Source','inputs','scan.png'))
+    Image.new('RGB',(50,50)).save('secret.png')
+    return main.app.test_client()
+
+def get(site,path,accept="image/avif,image/webp,image/*"):
+    with site.get(path,headers={"Accept":accept}) as response:
+        return response.status_code,response.headers,response.get_data()
+
+def test_thumbnail_is_resized_and_cached_for_a_year(site):
+    status, headers, data = get(site,'/derivative/thumb/static/Source/inputs/scan.png')
+    assert status == 200 and headers['Content-Type'] == 'image/webp'
+    assert headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    assert headers['Vary'] == 'Accept'
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == 'WEBP' and max(image.size) == derivatives.SIZES["thumb"][0]
+
+@pytest.mark.parametrize("accept",["image/jpeg","image/png,image/*;q=0.8","image/webp;q=0,image/*"])
+def test_jpeg_unless_webp_is_named(site,accept):
+    status, headers, data = get(site,'/derivative/preview/static/Source/inputs/scan.png',accept=accept)
+    assert status == 200 and headers['Content-Type'] == 'image/jpeg'
+    with Image.open(io.BytesIO(data)) as image:
+        assert image.format == 'JPEG' and image.size == (1280,960)
+
+def test_repeat_requests_are_served_from_the_cache(site,monkeypatch):
+    first = get(site,'/derivative/thumb/static/Source/inputs/scan.png')[2]
+    assert len(os.listdir(derivatives.derivative_cache_dir())) == 1
+    monkeypatch.setattr(Image,'open',lambda *args,**kwargs: pytest.fail("the cached thumbnail should be reused"))
+    assert get(site,'/derivative/thumb/static/Source/inputs/scan.png')[2] == first
+
+@pytest.mark.parametrize("path",[
+    '/derivative/huge/static/Source/inputs/scan.png',
+    '/derivative/thumb/secret.png',
+    '/derivative/thumb/static/..%2Fsecret.png',
+    '/derivative/thumb/static/Source/inputs/missing.png',
+])
+def test_only_known_sizes_of_files_under_static_are_served(site,path):
+    assert get(site,path)[0] == 404
+
+def test_history_page_links_to_thumbnails(site,add_rows):
+    add_rows({"name":"scan","filetype":"image","output_location":"static/Source/inputs/scan.png"})
+    with site.get('/history_images') as response:
+        page = response.get_data(as_text=True)
+    version = derivatives.source_version(os.path.join('static','Source','inputs','scan.png'))
+    assert f'src="/derivative/thumb/static/Source/inputs/scan.png?v={version}"' in page
+    assert f'/derivative/preview/static/Source/inputs/scan.png?v={version}' in page
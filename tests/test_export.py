@@ -0,0 +1,71 @@
+import gzip
+import json
+from datetime import date
+
+import export
+from conftest import AUTH
+
+def export_rows(client,query='',gzip_ok=False):
+    headers = {**AUTH,"Accept-Encoding":"gzip" if gzip_ok else "identity"}
+    with client.get(f'/v1/export{query}',headers=headers) as response:
+        assert response.status_code == 200
+        data = response.get_data()
+        if gzip_ok:
+            assert response.headers['Content-Encoding'] == 'gzip'
+            data = gzip.decompress(data)
+        return response.headers,[json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+def test_rows_are_exported_as_ndjson_without_the_outputs(client,add_rows):
+    ids = add_rows({"name":"a","filetype":"text","date":date(2025,3,1),"data_output":"hello"},
+                   {"name":"b","filetype":"datatable","table_files":[{"index":1}]})
+    headers, rows = export_rows(client)
+    assert headers['Content-Type'] == 'application/x-ndjson'
+    assert headers['X-Export-Max-Id'] == str(ids[-1])
+    assert [row["id"] for row in rows] == ids
+    assert rows[0]["date"] == "2025-03-01" and rows[0]["name"] == "a"
+    assert set(rows[0]) == set(export.BASE_FIELDS)
+
+def test_outputs_are_included_when_asked(client,add_rows):
+    add_rows({"name":"a","filetype":"text","data_output":"hello","text_output":"fixed"})
+    rows = export_rows(client,'?include=data_output')[1]
+    assert rows[0]["data_output"] == "hello" and "text_output" not in rows[0]
+    rows = export_rows(client,'?include=all')[1]
+    assert set(rows[0]) == set(export.BASE_FIELDS) | set(export.OUTPUT_FIELDS)
+    with client.get('/v1/export?include=secrets',headers=AUTH) as response:
+        assert response.status_code == 400
+
+def test_gzip_stream_holds_every_row(client,add_rows,monkeypatch):
+    # Small chunks, so the compressed stream is made of many of them
+    monkeypatch.setattr(export,'CHUNK_BYTES',256)
+    monkeypatch.setattr(export,'BATCH_ROWS',7)
+    ids = add_rows(*[{"name":f"file_{index}","filetype":"image"} for index in range(60)])
+    headers, rows = export_rows(client,gzip_ok=True)
+    assert headers['Vary'] == 'Accept-Encoding'
+    assert [row["id"] for row in rows] == ids
+
+def test_incremental_export(client,add_rows):
+    old_id, edited_id = add_rows({"name":"old","filetype":"text"},
+                                 {"name":"edited","filetype":"text","edit_date":date(2025,6,2)})
+    headers, rows = export_rows(client)
+    last_run = int(headers['X-Export-Max-Id'])
+    new_id, = add_rows({"name":"new","filetype":"image"})
+    assert [row["id"] for row in export_rows(client,f'?since_id={last_run}')[1]] == [new_id]
+    assert [row["id"] for row in export_rows(client,'?since_edit_date=2025-06-01')[1]] == [edited_id]
+    # Both: the new rows plus the older edited ones
+    rows = export_rows(client,f'?since_id={last_run}&since_edit_date=2025-06-01')[1]
+    assert [row["id"] for row in rows] == [edited_id,new_id]
+    assert [row["id"] for row in export_rows(client,'?filetype=text&since_id=0')[1]] == [old_id,edited_id]
+    with client.get('/v1/export?since_id=last',headers=AUTH) as response:
+        assert response.status_code == 400
+
+def test_rows_added_during_an_export_wait_for_the_next_one(client,add_rows,monkeypatch):
+    monkeypatch.setattr(export,'CHUNK_BYTES',1)
+    ids = add_rows({"name":"a","filetype":"text"},{"name":"b","filetype":"text"})
+    with client.get('/v1/export',headers={**AUTH,"Accept-Encoding":"identity"},buffered=False) as response:
+        chunks = response.iter_encoded()
+        first = next(chunks)
+        late_id, = add_rows({"name":"late","filetype":"text"})
+        lines = (first + b"".join(chunks)).decode('utf-8').splitlines()
+        assert response.headers['X-Export-Max-Id'] == str(ids[-1])
+    assert [json.loads(line)["id"] for line in lines] == ids
+    assert [row["id"] for row in export_rows(client,f'?since_id={ids[-1]}')[1]] == [late_id]
@@ -0,0 +1,38 @@
+from sqlalchemy import inspect
+
+from conftest import AUTH
+from models import database
+
+def test_history_pages_by_id(client,add_rows):
+    ids = add_rows(*[{"name":f"image_{index}","filetype":"image"} for index in range(5)],{"name":"notes","filetype":"text"})
+    seen, after_id = [], 0
+    while after_id is not None:
+        with client.get(f'/v1/history_images?limit=2&after_id={after_id}',headers=AUTH) as response:
+            assert response.status_code == 200
+            page = response.get_json()
+        assert len(page["All image files"]) <= 2
+        seen += [row["id"] for row in page["All image files"]]
+        after_id = page["next_after_id"]
+    assert seen == ids[:5]
+
+def test_history_leaves_out_the_large_columns_unless_asked(client,add_rows):
+    add_rows({"name":"notes","filetype":"text","text_output":"long text","data_output":"long text"})
+    with client.get('/v1/history_text',headers=AUTH) as response:
+        row = response.get_json()["All text files"][0]
+    assert "text_output" not in row and "data_output" not in row and row["name"] == "notes"
+    with client.get('/v1/history_text?fields=name,data_output',headers=AUTH) as response:
+        row = response.get_json()["All text files"][0]
+    assert set(row) == {"id","name","data_output"} and row["data_output"] == "long text"
+    with client.get('/v1/history_text?fields=all',headers=AUTH) as response:
+        assert response.get_json()["All text files"][0]["text_output"] == "long text"
+
+def test_history_rejects_bad_parameters(client):
+    with client.get('/v1/history_tables?fields=name,secret',headers=AUTH) as response:
+        assert response.status_code == 400
+    with client.get('/v1/history_tables?after_id=x',headers=AUTH) as response:
+        assert response.status_code == 400
+
+def test_listing_columns_are_indexed(app):
+    with app.app_context():
+        indexed = {tuple(index["column_names"]) for index in inspect(database.engine).get_indexes("extract")}
+    assert {("filetype",),("date",),("name",)} <= indexed
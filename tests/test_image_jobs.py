@@ -0,0 +1,50 @@
+import io
+import os
+import time
+
+from PIL import Image
+
+import methods
+from conftest import AUTH
+from models import database, Extract
+
+def png(size):
+    buffer = io.BytesIO()
+    Image.effect_noise((size,size),64).convert('RGB').save(buffer,format='PNG')
+    return buffer.getvalue()
+
+def fake_upscaler(input_dir,output_dir,fp32=True):
+    # Writes <stem>_out.png at 4x, as the real upscaler names its results
+    for filename in os.listdir(input_dir):
+        with Image.open(os.path.join(input_dir,filename)) as image:
+            image.resize((image.width * 4,image.height * 4)).save(os.path.join(output_dir,f"{os.path.splitext(filename)[0]}_out.png"))
+
+def wait_for(client,status_url):
+    for _ in range(200):
+        with client.get(status_url,headers=AUTH) as response:
+            job = response.get_json()["Job"]
+        if job["status"] not in ("queued","running"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"{status_url} did not finish")
+
+def test_outputs_are_paired_with_their_inputs(app,client,monkeypatch):
+    monkeypatch.setenv('UPSCALE_CACHE','0')
+    monkeypatch.setattr(methods,'run_upscaler',fake_upscaler)
+    uploads = {"b.png":png(8),"a.png":png(24)}
+    # Uploaded in the opposite order to the one the outputs are collected in
+    with client.post('/v1/add_image',headers=AUTH,data={"images[]":[(io.BytesIO(data),name) for name,data in uploads.items()]},
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 202
+        status_url = response.get_json()["response"]["status_url"]
+    job = wait_for(client,status_url)
+    assert job["status"] == "done", job
+    with app.app_context():
+        rows = database.session.query(Extract).filter(Extract.id.in_(job["result"]["ids"])).all()
+        assert len(rows) == 2
+        for row in rows:
+            source = os.path.basename(row.file_location)
+            assert row.name == f"{os.path.splitext(source)[0]}_out.png"
+            assert row.input_size == len(uploads[source]) / 1024
+            with Image.open(row.output_location) as output, Image.open(row.file_location) as original:
+                assert output.size == (original.width * 4,original.height * 4)
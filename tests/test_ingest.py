@@ -0,0 +1,61 @@
+import io
+import os
+import hashlib
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+from conftest import AUTH
+from ingest import ingest_upload, link_or_copy, UploadTooLarge
+
+class CountingStream(io.BytesIO):
+    # Counts how many times the upload is read to the end
+    def __init__(self,data):
+        super().__init__(data)
+        self.passes = 0
+
+    def read(self,size=-1):
+        chunk = super().read(size)
+        if not chunk:
+            self.passes += 1
+        return chunk
+
+def upload(data,filename="scan.png"):
+    return FileStorage(stream=CountingStream(data),filename=filename)
+
+def test_upload_is_read_once_and_linked_everywhere_else(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    file = upload(data)
+    canonical = tmp_path / "static" / "scan.png"
+    link = tmp_path / "input" / "scan.png"
+    ingested = ingest_upload(file,str(canonical),links=[str(link)])
+    assert file.stream.passes == 1
+    assert os.path.samefile(canonical,link)
+    assert canonical.read_bytes() == data
+    assert ingested == {"path":str(canonical),"sha256":hashlib.sha256(data).hexdigest(),"size":len(data),"bytes":data}
+    # Only the one file was written next to the canonical copy
+    assert os.listdir(tmp_path / "static") == ["scan.png"]
+
+def test_bytes_are_not_kept_unless_asked(tmp_path):
+    ingested = ingest_upload(upload(b"abc"),str(tmp_path / "scan.png"),keep_bytes=False)
+    assert ingested["bytes"] is None and ingested["size"] == 3
+
+def test_relinking_the_same_file_leaves_nothing_behind(tmp_path):
+    source, destination = tmp_path / "a.png", tmp_path / "b.png"
+    source.write_bytes(b"image")
+    link_or_copy(str(source),str(destination))
+    link_or_copy(str(source),str(destination))
+    assert os.path.samefile(source,destination)
+    assert sorted(os.listdir(tmp_path)) == ["a.png","b.png"]
+
+def test_too_large_upload_leaves_no_file(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        ingest_upload(upload(b"x" * 2048),str(tmp_path / "scan.png"),links=[str(tmp_path / "link.png")],max_bytes=1024)
+    assert os.listdir(tmp_path) == []
+
+def test_too_large_upload_is_refused_by_the_api(client,monkeypatch):
+    monkeypatch.setenv('MAX_UPLOAD_MB','0.001')
+    with client.post('/v1/add_text',headers=AUTH,data={"textract":(io.BytesIO(b"x" * 4096),"big.png")},
+                     content_type='multipart/form-data') as response:
+        assert response.status_code == 413
+    assert os.listdir(os.path.join('static','Source','inputs')) == [] and os.listdir('input') == []
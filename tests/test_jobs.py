@@ -0,0 +1,107 @@
+import threading
+from datetime import datetime
+
+import pytest
+from flask import Flask
+
+from jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED, _worker_name
+from models import database, Job
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'jobs.db'}"
+    database.init_app(app)
+    with app.app_context():
+        database.create_all()
+    yield app
+    with app.app_context():
+        database.engine.dispose()
+
+def make_queue(app,handlers,max_workers=1,max_queued=None):
+    return JobQueue(app,database,Job,handlers=handlers,max_workers=max_workers,max_queued=max_queued)
+
+def job_row(app,job_id):
+    with app.app_context():
+        return database.session.get(Job,job_id)
+
+def add_job(app,job_id,status,worker=None):
+    with app.app_context():
+        database.session.add(Job(id=job_id,kind="echo",status=status,payload={"value":job_id},worker=worker,
+                                 created_at=datetime.now(),started_at=datetime.now() if status == RUNNING else None))
+        database.session.commit()
+
+def test_submitted_job_runs_and_stores_its_result(app):
+    queue = make_queue(app,{"echo":lambda payload: {"echo":payload["value"]}})
+    with app.test_request_context():
+        job_id = queue.enqueue("echo",{"value":7})
+    queue.shutdown()
+    job = job_row(app,job_id)
+    assert (job.status,job.result,job.error) == (DONE,{"echo":7},None)
+    assert job.started_at and job.finished_at
+    assert queue.pending == 0
+
+def test_failing_handler_marks_the_job_failed(app):
+    def fail(payload):
+        raise ValueError("bad payload")
+
+    queue = make_queue(app,{"echo":fail})
+    with app.test_request_context():
+        job_id = queue.enqueue("echo",{})
+    queue.shutdown()
+    job = job_row(app,job_id)
+    assert (job.status,job.error) == (FAILED,"ValueError: bad payload")
+
+def test_job_whose_result_cannot_be_saved_is_failed_not_left_running(app):
+    # The result is not JSON serializable, so the final commit fails
+    queue = make_queue(app,{"echo":lambda payload: {"value":object()}})
+    with app.test_request_context():
+        job_id = queue.enqueue("echo",{})
+    queue.shutdown()
+    job = job_row(app,job_id)
+    assert job.status == FAILED
+    assert job.error.startswith("The job's result could not be saved")
+    assert queue.pending == 0
+
+def test_a_job_is_claimed_once(app):
+    add_job(app,"claimed",QUEUED)
+    queue = make_queue(app,{})
+    with app.app_context():
+        assert queue._claim("claimed")
+        assert not queue._claim("claimed")
+    job = job_row(app,"claimed")
+    assert (job.status,job.worker) == (RUNNING,_worker_name())
+
+def test_resume_takes_back_queued_and_interrupted_jobs(app):
+    add_job(app,"queued",QUEUED)
+    add_job(app,"interrupted",RUNNING,worker="gone-host:1")
+    add_job(app,"running_here",RUNNING,worker=_worker_name())
+    add_job(app,"done",DONE)
+    ran = []
+    queue = make_queue(app,{"echo":lambda payload: ran.append(payload["value"]) or {}})
+    assert sorted(queue.resume()) == ["interrupted","queued"]
+    queue.shutdown()
+    assert sorted(ran) == ["interrupted","queued"]
+    assert job_row(app,"running_here").status == RUNNING
+
+def test_drain_finishes_running_jobs_and_leaves_the_rest_queued(app):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(payload):
+        started.set()
+        release.wait(10)
+        return {}
+
+    queue = make_queue(app,{"echo":slow},max_workers=1,max_queued=10)
+    with app.test_request_context():
+        job_ids = [queue.enqueue("echo",{}) for _ in range(4)]
+    assert started.wait(10)
+    assert queue.pending == 4
+    draining = threading.Thread(target=queue.drain)
+    draining.start()
+    release.set()
+    draining.join(10)
+    assert [job_row(app,job_id).status for job_id in job_ids] == [DONE,QUEUED,QUEUED,QUEUED]
+    # The cancelled jobs no longer count towards the queue's depth
+    assert queue.pending == 0
+    assert queue.retry_after() == 1
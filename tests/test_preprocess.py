@@ -0,0 +1,38 @@
+import io
+
+from PIL import Image
+
+from preprocess import preprocess_document, preprocess_settings
+
+def settings(**overrides):
+    return {**preprocess_settings(),"min_bytes":0,**overrides}
+
+def png_bytes(size=(400,300)):
+    buffer = io.BytesIO()
+    Image.effect_noise(size,64).convert('RGB').save(buffer,format='PNG')
+    return buffer.getvalue()
+
+def test_large_image_is_scaled_down_and_reencoded():
+    document = png_bytes((800,600))
+    processed, stats = preprocess_document(document,settings(max_pixels=120_000))
+    assert stats["applied"] and stats["bytes"] == len(processed) < len(document)
+    with Image.open(io.BytesIO(processed)) as image:
+        assert image.format == 'PNG' and image.mode == 'L'
+        assert image.size[0] * image.size[1] <= 120_000
+
+def test_documents_pillow_cannot_read_pass_through():
+    document = b"%PDF-1.7\n" + b"0" * 4096
+    processed, stats = preprocess_document(document,settings())
+    assert processed == document and not stats["applied"]
+
+def test_truncated_image_passes_through():
+    # The header opens fine; the pixel data fails to decode once the image is converted
+    document = png_bytes()[:2000]
+    processed, stats = preprocess_document(document,settings())
+    assert processed == document and not stats["applied"]
+
+def test_decompression_bomb_passes_through(monkeypatch):
+    monkeypatch.setattr(Image,'MAX_IMAGE_PIXELS',1000)
+    document = png_bytes()
+    processed, stats = preprocess_document(document,settings())
+    assert processed == document and not stats["applied"]
@@ -0,0 +1,39 @@
+import json
+import sys
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+
+import reprocess
+from models import Extract
+
+@pytest.fixture
+def instance(tmp_path,monkeypatch):
+    monkeypatch.setattr(reprocess,'INSTANCE_PATH',str(tmp_path))
+    monkeypatch.setattr('dotenv.load_dotenv',lambda **kwargs: False)
+    return tmp_path
+
+def run(monkeypatch,*args):
+    monkeypatch.setattr(sys,'argv',['reprocess.py',*args])
+    reprocess.main()
+
+def test_cli_uses_the_apps_database(instance,monkeypatch,capsys):
+    # A relative SQLite DATABASE_URL is in the instance folder, as it is for the apps
+    monkeypatch.setenv('DATABASE_URL','sqlite:///other.db')
+    engine = create_engine(f"sqlite:///{instance / 'other.db'}")
+    Extract.__table__.create(engine)
+    with engine.begin() as connection:
+        connection.execute(Extract.__table__.insert().values(id=1,name="notes",filetype="text",date=date.today(),
+                                                             file_location="in",output_location="out",input_size=1.0,
+                                                             output_size=1.0))
+    engine.dispose()
+    run(monkeypatch,'--all','--workers','1')
+    assert json.loads(capsys.readouterr().out)["skipped"] == [1]
+
+def test_cli_reports_a_missing_database(instance,monkeypatch):
+    monkeypatch.setenv('DATABASE_URL','sqlite:///missing.db')
+    with pytest.raises(SystemExit,match=f"Database {instance / 'missing.db'} does not exist"):
+        run(monkeypatch,'--all')
+    with pytest.raises(SystemExit,match="Database .*elsewhere.db does not exist"):
+        run(monkeypatch,'--all','--database','elsewhere.db')
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from conftest import AUTH
+
+def search_ids(client,query):
+    with client.get(f'/v1/search?q={query}',headers=AUTH) as response:
+        assert response.status_code == 200
+        return [result["id"] for result in response.get_json()["Results"]]
+
+def test_table_cells_are_findable(client,add_rows):
+    # Stored the way methods.extract_tables does: the table as pandas JSON, kept in a JSON column
+    table = pd.DataFrame({"Quarter":["Q1","Q2"],"Revenue":["Widgets\nsold","1200"]}).set_index("Quarter").to_json()
+    table_id, = add_rows({"name":"report","filetype":"datatable","data_output":table})
+    assert search_ids(client,"sold") == [table_id]
+    assert search_ids(client,"Widgets") == [table_id]
+    assert search_ids(client,"Revenue") == [table_id]
+
+def test_text_after_an_escape_is_findable(client,add_rows):
+    text_id, = add_rows({"name":"notes","filetype":"text","data_output":"first line\nsecondword"})
+    assert search_ids(client,"secondword") == [text_id]
+    # The JSON punctuation is not part of the index
+    assert search_ids(client,"n") == []
+
+def test_edits_and_deletes_keep_the_index_current(app,client,add_rows):
+    from models import database, Extract
+    text_id, = add_rows({"name":"notes","filetype":"text","data_output":"before"})
+    with app.app_context():
+        database.session.get(Extract,text_id).data_output = "after"
+        database.session.commit()
+    assert search_ids(client,"before") == [] and search_ids(client,"after") == [text_id]
+    with app.app_context():
+        database.session.delete(database.session.get(Extract,text_id))
+        database.session.commit()
+    assert search_ids(client,"after") == []
@@ -0,0 +1,78 @@
+import math
+import sqlite3
+from datetime import date
+
+from sqlalchemy import inspect
+
+from conftest import AUTH
+from factory import create_app, warm_up
+from models import database, Extract
+from stats import usage_stats
+
+def nearest_rank(values,p):
+    return sorted(values)[math.ceil(p / 100 * len(values)) - 1]
+
+def stats(client,query=''):
+    with client.get(f'/v1/stats{query}',headers=AUTH) as response:
+        return response.status_code,response.get_json()
+
+def test_totals_and_percentiles(client,add_rows):
+    sizes = [float(size) for size in range(1,21)]
+    add_rows(*[{"name":f"text_{size}","filetype":"text","input_size":size,"output_size":size / 2,
+                "duration_seconds":size / 10} for size in sizes],
+             {"name":"photo","filetype":"image","input_size":100.0,"output_size":400.0})
+    status, body = stats(client)
+    assert status == 200
+    totals = body["totals"]
+    assert totals["files"] == 21
+    assert totals["input_kb"]["total"] == sum(sizes) + 100
+    assert totals["input_kb"]["p50"] == nearest_rank(sizes + [100.0],50)
+    assert totals["input_kb"]["p99"] == 100.0
+    # Rows without a processing time are left out of its figures
+    assert totals["duration_seconds"]["avg"] == round(sum(sizes) / 10 / 20,4)
+    text = {entry["filetype"]:entry for entry in body["by_filetype"]}["text"]
+    assert text["files"] == 20
+    assert text["output_kb"]["avg"] == round(sum(sizes) / 2 / 20,4)
+    assert [text["input_kb"][f"p{p}"] for p in (50,95,99)] == [nearest_rank(sizes,p) for p in (50,95,99)]
+
+def test_filters_and_daily_breakdown(client,add_rows):
+    add_rows({"name":"old","filetype":"text","date":date(2025,1,1),"input_size":4.0},
+             {"name":"new","filetype":"text","date":date(2025,1,2),"input_size":6.0},
+             {"name":"table","filetype":"datatable","date":date(2025,1,2),"input_size":8.0})
+    status, body = stats(client,'?since=2025-01-02&group=day')
+    assert set(body) == {"totals","by_day"}
+    assert body["by_day"] == [{"day":"2025-01-02",**body["totals"]}]
+    assert body["totals"]["input_kb"]["total"] == 14.0
+    status, body = stats(client,'?filetype=text&until=2025-01-01')
+    assert body["totals"]["files"] == 1 and body["by_filetype"][0]["filetype"] == "text"
+    status, body = stats(client,'?filetype=image')
+    assert body["totals"]["files"] == 0 and body["totals"]["input_kb"]["p50"] is None
+
+def test_bad_parameters_are_rejected(client):
+    assert stats(client,'?since=yesterday')[0] == 400
+    assert stats(client,'?group=hour')[0] == 400
+
+def test_text_sizes_from_an_older_database_become_numbers(tmp_path,monkeypatch):
+    # The first versions declared the sizes as strings; warm_up() rebuilds the table with them as floats
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as connection:
+        connection.execute("""CREATE TABLE extract (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(250) NOT NULL,
+            filetype VARCHAR(100) NOT NULL, date DATE NOT NULL, file_location VARCHAR(250) NOT NULL,
+            output_location VARCHAR(250) NOT NULL, input_size VARCHAR(250) NOT NULL, output_size VARCHAR(250) NOT NULL,
+            text_output VARCHAR, data_output JSON)""")
+        connection.executemany("INSERT INTO extract VALUES (?,?,'text','2025-01-01','in','out',?,?,NULL,?)",
+                               [(1,"a","9.5","1.25",'"nine"'),(2,"b","10.5","2.75",'"ten"')])
+    monkeypatch.setenv('DATABASE_URL',f"sqlite:///{path}")
+    app = create_app(__name__,'FLASK_KEY')
+    app.instance_path = str(tmp_path)
+    warm_up(app)
+    with app.app_context():
+        columns = {column['name']:column['type'] for column in inspect(database.engine).get_columns('extract')}
+        assert columns['input_size']._type_affinity is Extract.input_size.type._type_affinity
+        assert database.session.get(Extract,2).input_size == 10.5
+        # Sums are numeric, not string concatenation or lexical percentiles
+        assert usage_stats(database)["totals"]["input_kb"] == {"total":20.0,"avg":10.0,"p50":9.5,"p95":10.5,"p99":10.5}
+        # The search index and the new columns came back with the rebuilt table
+        assert {"response_sha","table_files"} <= set(columns)
+        assert database.session.execute(database.text("SELECT rowid FROM extract_fts WHERE extract_fts MATCH 'ten'")).all() == [(2,)]
+        database.engine.dispose()
@@ -0,0 +1,113 @@
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import AUTH
+from tables import store_table, replace_table
+
+GRID = [
+    ["","Zip","Price","Euro","Id","Mixed"],
+    ["a","00501","$1,200","€3","12345678901234567890","$5"],
+    ["b","12345","$3.50","€4","1","7"],
+]
+
+def test_csv_keeps_cells_as_read(tmp_path):
+    store_table(GRID,str(tmp_path / "t.parquet"),str(tmp_path / "t.csv"))
+    assert (tmp_path / "t.csv").read_text(encoding='utf-8').splitlines() == [
+        ",Zip,Price,Euro,Id,Mixed",
+        'a,00501,"$1,200",€3,12345678901234567890,$5',
+        "b,12345,$3.50,€4,1,7",
+    ]
+
+def test_parquet_types_and_units(tmp_path):
+    stored = store_table(GRID,str(tmp_path / "t.parquet"),str(tmp_path / "t.csv"))
+    columns = {column["name"]:column for column in stored["columns"]}
+    assert columns["Zip"]["type"] == "string"
+    assert columns["Id"]["type"] == "string"
+    assert columns["Mixed"]["type"] == "string"
+    assert (columns["Price"]["type"],columns["Price"]["unit"]) == ("double","$")
+    assert (columns["Euro"]["type"],columns["Euro"]["unit"]) == ("int64","€")
+    rows = pq.read_table(str(tmp_path / "t.parquet")).to_pylist()
+    assert rows[0]["Zip"] == "00501"
+    assert rows[0]["Price"] == 1200.0
+    assert rows[0]["Id"] == "12345678901234567890"
+
+def test_replace_keeps_raw_data_output(tmp_path):
+    _, data_output = replace_table(GRID,str(tmp_path / "t.csv"),None)
+    assert json.loads(data_output)[0] == {"column_1":"a","Zip":"00501","Price":"$1,200","Euro":"€3",
+                                          "Id":"12345678901234567890","Mixed":"$5"}
+
+SALES = [
+    ["Region","Product","Units","Revenue"],
+    ["North","Widget","10","$1,000"],
+    ["South","Widget","5","$500.50"],
+    ["North","Gadget","2","$80"],
+]
+RETURNS = [
+    ["Region","Product","Units"],
+    ["North","Widget","1"],
+    ["West","Gadget","3"],
+]
+
+@pytest.fixture
+def stored_tables(add_rows,tmp_path):
+    # Two data table rows: one with the sales table, one with a returns table (no Revenue) as its table 1 and the sales
+    # table again as its table 2
+    def entry(index,grid,name):
+        stored = store_table(grid,str(tmp_path / f"{name}.parquet"),str(tmp_path / f"{name}.csv"))
+        return {"index":index,"location":stored["location"],"rows":stored["rows"],"columns":stored["columns"]}
+    return add_rows({"name":"sales","filetype":"datatable","table_files":[entry(1,SALES,"sales")]},
+                    {"name":"returns","filetype":"datatable","table_files":[entry(1,RETURNS,"returns"),entry(2,SALES,"again")]},
+                    {"name":"notes","filetype":"text"})
+
+def query(client,body):
+    with client.post('/v1/tables/query',headers=AUTH,json=body) as response:
+        return response.status_code,response.get_json()
+
+def test_query_projects_and_filters(client,stored_tables):
+    sales_id, returns_id, _ = stored_tables
+    status, result = query(client,{"columns":["Product","Units"],"where":[["Units",">=",5]]})
+    assert status == 200
+    assert result["rows"] == [
+        {"id":sales_id,"table":1,"Product":"Widget","Units":10},
+        {"id":sales_id,"table":1,"Product":"Widget","Units":5},
+        {"id":returns_id,"table":2,"Product":"Widget","Units":10},
+        {"id":returns_id,"table":2,"Product":"Widget","Units":5},
+    ]
+    assert (result["tables_scanned"],result["rows_scanned"],result["truncated"]) == (3,8,False)
+    status, result = query(client,{"ids":[sales_id],"columns":["Revenue"],
+                                   "where":[["Region","in",["South"]],["Product","contains","widg"]]})
+    assert result["rows"] == [{"id":sales_id,"table":1,"Revenue":500.5}]
+
+def test_query_skips_tables_without_the_columns(client,stored_tables):
+    sales_id, returns_id, _ = stored_tables
+    status, result = query(client,{"table":1,"columns":["Revenue"]})
+    assert [row["Revenue"] for row in result["rows"]] == [1000.0,500.5,80.0]
+    assert result["skipped"] == [{"id":returns_id,"table":1,"missing":["Revenue"]}]
+
+def test_query_stops_at_the_limit(client,stored_tables):
+    status, result = query(client,{"columns":["Units"],"limit":2})
+    assert [row["Units"] for row in result["rows"]] == [10,5]
+    assert result["truncated"] is True and result["rows_scanned"] == 3
+
+def test_query_aggregates_by_group(client,stored_tables):
+    status, result = query(client,{"group_by":["Region"],"aggregate":{"Units":["sum","mean","max"],"Revenue":"sum"},
+                                   "table":2})
+    assert status == 200
+    assert result["groups"] == [
+        {"Region":"North","rows":2,"Units":{"sum":12,"mean":6.0,"max":10},"Revenue":{"sum":1080.0}},
+        {"Region":"South","rows":1,"Units":{"sum":5,"mean":5.0,"max":5},"Revenue":{"sum":500.5}},
+    ]
+
+@pytest.mark.parametrize("body",[
+    {"where":[["Units","~",1]]},
+    {"where":[["Units","in",3]]},
+    {"where":[["Units",">","many"]]},
+    {"group_by":["Region"]},
+    {"aggregate":{"Units":"median"}},
+    {"limit":"all"},
+])
+def test_query_rejects_bad_requests(client,stored_tables,body):
+    status, result = query(client,body)
+    assert status == 400 and "Error" in result["response"]
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from textract_gateway import TextractGateway, TextractUnavailable, CLOSED, OPEN, HALF_OPEN
+
+class FailingTextract:
+    def __init__(self):
+        self.calls = 0
+
+    def analyze_document(self,**kwargs):
+        from botocore.exceptions import ClientError
+        self.calls += 1
+        raise ClientError({"Error":{"Code":"InternalServerError","Message":"down"},
+                           "ResponseMetadata":{"HTTPStatusCode":500}},"AnalyzeDocument")
+
+@pytest.fixture
+def gateway(monkeypatch):
+    monkeypatch.setenv('TEXTRACT_ANALYZE_TPS','1')
+    monkeypatch.setenv('TEXTRACT_PROCESSES','1')
+    monkeypatch.setenv('TEXTRACT_MAX_WAIT','0.5')
+    monkeypatch.setenv('TEXTRACT_MAX_ATTEMPTS','1')
+    monkeypatch.setenv('TEXTRACT_BREAKER_FAILURES','2')
+    monkeypatch.setenv('TEXTRACT_BREAKER_RESET','0.1')
+    client = FailingTextract()
+    gateway = TextractGateway(lambda: client)
+    return gateway,client
+
+def test_breaker_opens_after_consecutive_failures(gateway):
+    gateway,client = gateway
+    gateway.buckets["analyze_document"] = None
+    for _ in range(2):
+        with pytest.raises(TextractUnavailable):
+            gateway.analyze_document(Document={'Bytes':b'x'},FeatureTypes=['TABLES'])
+    assert gateway.breaker.state == OPEN
+    with pytest.raises(TextractUnavailable):
+        gateway.analyze_document(Document={'Bytes':b'x'},FeatureTypes=['TABLES'])
+    assert client.calls == 2
+
+def test_half_open_trial_refused_by_rate_limit_keeps_breaker_open(gateway):
+    gateway,client = gateway
+    breaker = gateway.breaker
+    breaker.opened_at = time.monotonic() - 1
+    breaker.state = OPEN
+    breaker.consecutive = 2
+    # Empty the bucket so the trial call would have to wait past TEXTRACT_MAX_WAIT
+    bucket = gateway.buckets["analyze_document"]
+    bucket.tokens = -5
+    bucket.updated = time.monotonic()
+    with pytest.raises(TextractUnavailable):
+        gateway.analyze_document(Document={'Bytes':b'x'},FeatureTypes=['TABLES'])
+    assert client.calls == 0
+    assert breaker.state == HALF_OPEN
+    assert breaker.consecutive == 2
+    assert not breaker.trial_running
+    # The next call is the trial; it reaches the failing service and opens the breaker again
+    bucket.tokens = 1
+    with pytest.raises(TextractUnavailable):
+        gateway.analyze_document(Document={'Bytes':b'x'},FeatureTypes=['TABLES'])
+    assert client.calls == 1
+    assert breaker.state == OPEN
+
+def test_rate_limit_refusal_does_not_reset_failure_count(gateway):
+    gateway,client = gateway
+    gateway.breaker.consecutive = 1
+    bucket = gateway.buckets["analyze_document"]
+    bucket.tokens = -5
+    bucket.updated = time.monotonic()
+    with pytest.raises(TextractUnavailable):
+        gateway.analyze_document(Document={'Bytes':b'x'},FeatureTypes=['TABLES'])
+    assert client.calls == 0
+    assert gateway.breaker.state == CLOSED
+    assert gateway.breaker.consecutive == 1
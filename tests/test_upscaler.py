@@ -0,0 +1,41 @@
+import sys
+import time
+
+import pytest
+
+import upscaler
+from upscaler import ResidentUpscaler, UpscalerTimeout
+
+# Announces itself ready like upscaler_worker.py, then answers requests only when asked to
+FAKE_WORKER = '''
+import json, sys, time
+print(json.dumps({"ready": True}), flush=True)
+for line in sys.stdin:
+    message = json.loads(line)
+    if message["input_dir"].endswith("hang"):
+        time.sleep(60)
+    print(json.dumps({"ok": True, "outputs": []}), flush=True)
+'''
+
+@pytest.fixture
+def fake_worker(tmp_path,monkeypatch):
+    script = tmp_path / "worker.py"
+    script.write_text(FAKE_WORKER)
+    monkeypatch.setattr(upscaler,'venv_python',lambda: sys.executable)
+    monkeypatch.setattr(upscaler,'WORKER_SCRIPT',str(script))
+    monkeypatch.setattr(upscaler,'REALESRGAN_DIR',str(tmp_path))
+    worker = ResidentUpscaler(startup_timeout=10,request_timeout=0.5)
+    yield worker
+    worker.stop()
+
+@pytest.mark.skipif(sys.platform == "win32",reason="the timeout relies on select() over pipes")
+def test_hung_worker_is_killed_and_replaced(fake_worker,tmp_path):
+    assert fake_worker.upscale(str(tmp_path / "in"),str(tmp_path / "out")) == []
+    hung = fake_worker.process
+    start = time.monotonic()
+    with pytest.raises(UpscalerTimeout):
+        fake_worker.upscale(str(tmp_path / "hang"),str(tmp_path / "out"))
+    assert time.monotonic() - start < 5
+    assert fake_worker.process is None and hung.poll() is not None
+    # The next upscale starts a fresh worker
+    assert fake_worker.upscale(str(tmp_path / "in"),str(tmp_path / "out")) == []
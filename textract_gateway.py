@@ -0,0 +1,228 @@
+import os
+import math
+import time
+import random
+import threading
+
+from metrics import stage, TEXTRACT_CALLS, TEXTRACT_CIRCUIT_OPEN
+
+# *************************************!!!!!!!!!!!!! TEXTRACT GATEWAY !!!!!!!!!!!!!!!!!!!********************************
+# Every Textract call goes through one gateway per process (methods.get_textract()). The gateway:
+#   - spaces calls with a token bucket per operation, at TEXTRACT_ANALYZE_TPS / TEXTRACT_DETECT_TPS (the account's
+#     quota, default 10) divided by TEXTRACT_PROCESSES (default WEB_CONCURRENCY, or 1) since every worker process has
+#     its own bucket. 0 turns the limit off. A call that would wait longer than TEXTRACT_MAX_WAIT seconds is refused.
+#   - retries throttling and transient errors (5xx, timeouts, dropped connections) up to TEXTRACT_MAX_ATTEMPTS times,
+#     sleeping a random time up to an exponentially growing cap ("full jitter"). Throttling also slows the bucket down
+#     (by a quarter each time, to at most a quarter of the quota), and every success brings it back towards the quota.
+#   - stops calling Textract for TEXTRACT_BREAKER_RESET seconds once TEXTRACT_BREAKER_FAILURES calls in a row have
+#     failed with a transient error, so an outage makes requests fail at once (TextractUnavailable, answered with 503)
+#     instead of each one going through its retries. After the pause, one trial call decides whether to close it again.
+# botocore's own retries are turned off so they don't stack with these. The client's connection pool holds
+# TEXTRACT_MAX_POOL connections (default: enough for the batch and job threads), and TEXTRACT_ENDPOINT_URL points it at
+# another endpoint, e.g. the local stub server in benchmarks/stub_textract_server.py.
+
+OPERATIONS = {"analyze_document":"TEXTRACT_ANALYZE_TPS","detect_document_text":"TEXTRACT_DETECT_TPS"}
+THROTTLING_CODES = {"ThrottlingException","ProvisionedThroughputExceededException","LimitExceededException",
+                    "RequestLimitExceeded","TooManyRequestsException","Throttling"}
+TRANSIENT_CODES = {"InternalServerError","InternalFailure","ServiceUnavailable","ServiceUnavailableException"}
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+class TextractUnavailable(RuntimeError):
+    def __init__(self,message,retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def _number(name,default):
+    return float(os.environ.get(name,default))
+
+def make_client():
+    import boto3
+    from botocore.config import Config
+    pool = int(os.environ.get('TEXTRACT_MAX_POOL',0)) or (int(os.environ.get('TEXTRACT_BATCH_WORKERS',8))
+                                                          + int(os.environ.get('JOB_WORKERS',2)) + 2)
+    config = Config(
+        max_pool_connections=pool,
+        connect_timeout=_number('TEXTRACT_CONNECT_TIMEOUT',5),
+        read_timeout=_number('TEXTRACT_READ_TIMEOUT',60),
+        tcp_keepalive=True,
+        retries={"mode":"standard","total_max_attempts":1},
+    )
+    return boto3.client('textract',config=config,endpoint_url=os.environ.get('TEXTRACT_ENDPOINT_URL') or None)
+
+def classify(error):
+    # "throttled", "transient" (worth retrying, counts towards the breaker) or None (the request itself is at fault)
+    response = getattr(error,'response',None)
+    if isinstance(response,dict):
+        code = response.get('Error',{}).get('Code')
+        status = response.get('ResponseMetadata',{}).get('HTTPStatusCode') or 0
+        if code in THROTTLING_CODES or status == 429:
+            return "throttled"
+        if code in TRANSIENT_CODES or status >= 500:
+            return "transient"
+        return None
+    try:
+        from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+    except ImportError:
+        return None
+    if isinstance(error,(BotoConnectionError,HTTPClientError)):
+        return "transient"
+    return None
+
+class TokenBucket:
+    def __init__(self,rate,burst=1):
+        # A burst of 1 spaces calls evenly: the quota is counted per second, so a full bucket emptied at once followed
+        # by the refill would go over it
+        self.quota = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token now and returns how long to wait before using it (0 when one was available)
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity,self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def cancel(self):
+        with self.lock:
+            self.tokens += 1
+
+    def throttled(self):
+        with self.lock:
+            self.rate = max(self.quota / 4,self.rate * 0.75)
+
+    def succeeded(self):
+        with self.lock:
+            self.rate = min(self.quota,self.rate + self.quota / 20)
+
+class CircuitBreaker:
+    def __init__(self,failures,reset_seconds):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.consecutive = 0
+        self.opened_at = 0
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def _set(self,state):
+        self.state = state
+        TEXTRACT_CIRCUIT_OPEN.set(1 if state == OPEN else 0)
+
+    def allow(self):
+        # Raises TextractUnavailable while open; lets a single trial call through once the pause is over
+        with self.lock:
+            if self.state == CLOSED:
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self._set(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.trial_running:
+                self.trial_running = True
+                return
+        raise TextractUnavailable("Textract is failing, calls are paused",max(1,math.ceil(remaining)))
+
+    def release_trial(self):
+        # The trial call never reached Textract (e.g. the rate limit refused it): let another call be the trial,
+        # without judging the service
+        with self.lock:
+            self.trial_running = False
+
+    def record(self,failed):
+        with self.lock:
+            self.trial_running = False
+            if not failed:
+                self.consecutive = 0
+                self._set(CLOSED)
+                return
+            self.consecutive += 1
+            if self.state == HALF_OPEN or self.consecutive >= self.failures:
+                self.opened_at = time.monotonic()
+                self._set(OPEN)
+
+class TextractGateway:
+    def __init__(self,client_factory):
+        # client_factory returns the client to call (boto3, or a stub assigned by a benchmark), looked up on every call
+        self.client_factory = client_factory
+        self.pid = os.getpid()
+        processes = max(1,int(os.environ.get('TEXTRACT_PROCESSES',os.environ.get('WEB_CONCURRENCY',1))))
+        self.buckets = {}
+        for operation,setting in OPERATIONS.items():
+            tps = _number(setting,10) / processes
+            self.buckets[operation] = TokenBucket(tps) if tps > 0 else None
+        self.max_wait = _number('TEXTRACT_MAX_WAIT',30)
+        self.max_attempts = max(1,int(os.environ.get('TEXTRACT_MAX_ATTEMPTS',4)))
+        self.backoff_base = _number('TEXTRACT_BACKOFF_BASE',0.25)
+        self.backoff_cap = _number('TEXTRACT_BACKOFF_CAP',8)
+        self.breaker = CircuitBreaker(int(os.environ.get('TEXTRACT_BREAKER_FAILURES',5)),_number('TEXTRACT_BREAKER_RESET',30))
+
+    def analyze_document(self,**kwargs):
+        return self.call('analyze_document',**kwargs)
+
+    def detect_document_text(self,**kwargs):
+        return self.call('detect_document_text',**kwargs)
+
+    def _wait_for_token(self,operation):
+        bucket = self.buckets.get(operation)
+        if bucket is None:
+            return
+        wait = bucket.reserve()
+        if wait > self.max_wait:
+            bucket.cancel()
+            TEXTRACT_CALLS.labels(operation,"refused").inc()
+            raise TextractUnavailable(f"Over the {operation} rate limit, retry later",max(1,math.ceil(wait)))
+        if wait:
+            with stage('textract_rate_wait'):
+                time.sleep(wait)
+
+    def call(self,operation,**kwargs):
+        try:
+            self.breaker.allow()
+        except TextractUnavailable:
+            TEXTRACT_CALLS.labels(operation,"refused").inc()
+            raise
+        for attempt in range(1,self.max_attempts + 1):
+            try:
+                self._wait_for_token(operation)
+            except TextractUnavailable:
+                self.breaker.release_trial()
+                raise
+            try:
+                response = getattr(self.client_factory(),operation)(**kwargs)
+            except Exception as e:
+                kind = classify(e)
+                if kind == "throttled" and self.buckets.get(operation) is not None:
+                    self.buckets[operation].throttled()
+                if kind is None:
+                    # The request was rejected on its merits; the service itself is fine
+                    self.breaker.record(failed=False)
+                    TEXTRACT_CALLS.labels(operation,"error").inc()
+                    raise
+                TEXTRACT_CALLS.labels(operation,kind).inc()
+                if attempt == self.max_attempts:
+                    self.breaker.record(failed=kind == "transient")
+                    raise TextractUnavailable(f"Textract {operation} failed after {attempt} attempts: {e}",
+                                              max(1,math.ceil(self.backoff_cap))) from e
+                time.sleep(random.uniform(0,min(self.backoff_cap,self.backoff_base * 2 ** attempt)))
+                continue
+            if self.buckets.get(operation) is not None:
+                self.buckets[operation].succeeded()
+            self.breaker.record(failed=False)
+            TEXTRACT_CALLS.labels(operation,"ok").inc()
+            return response
+
+    def describe(self):
+        return {
+            "circuit":self.breaker.state,
+            "consecutive_failures":self.breaker.consecutive,
+            "rate_limits":{operation:None if bucket is None else {"quota_tps":round(bucket.quota,3),"current_tps":round(bucket.rate,3)}
+                           for operation,bucket in self.buckets.items()},
+        }
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,217 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from ingest import link_or_copy
+from metrics import cache_lookup
+
+# *************************************!!!!!!!!!!!!! UPSCALE CACHE !!!!!!!!!!!!!!!!!!!********************************
+# Real-ESRGAN outputs kept on disk (UPSCALE_CACHE_DIR, default cache/upscale) so an image that was already upscaled is
+# never run through the model again. Entries are keyed by the SHA-256 of the input bytes plus the model signature
+# (model, scale, precision), and listed in an SQLite index next to the files.
+#
+# With UPSCALE_CACHE_SIMILAR=1, an input with no exact match may also reuse the output of a near duplicate: an image
+# of the same size whose 64-bit difference hash (dHash) is within UPSCALE_CACHE_MAX_DISTANCE bits (default 3), e.g. the
+# same scan saved again at another JPEG quality. The hash is split into four 16-bit bands that are indexed; two hashes
+# within 3 bits of each other share at least one band, so only those candidates are compared.
+#
+# Cached files are hardlinked into static/Source/outputs, so a reused output costs no extra disk space and evicting it
+# (least recently used first, once the cache grows past UPSCALE_CACHE_MAX_MB) never breaks a row that points at it.
+
+BANDS = 4
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    dhash INTEGER,
+    band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+    width INTEGER, height INTEGER,
+    path TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_entries_last_used ON entries (last_used);
+CREATE INDEX IF NOT EXISTS ix_entries_band0 ON entries (signature, band0);
+CREATE INDEX IF NOT EXISTS ix_entries_band1 ON entries (signature, band1);
+CREATE INDEX IF NOT EXISTS ix_entries_band2 ON entries (signature, band2);
+CREATE INDEX IF NOT EXISTS ix_entries_band3 ON entries (signature, band3);
+"""
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path,'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE),b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def difference_hash(path):
+    # 64 bits: is each pixel brighter than its right-hand neighbour, on a 9x8 grayscale thumbnail.
+    # Returns (hash, (width, height)), or (None, None) for files Pillow can't read
+    from PIL import Image
+    try:
+        with Image.open(path) as image:
+            size = image.size
+            image.draft('L',(64,64)) # JPEGs are decoded at a fraction of their size
+            pixels = list(image.convert('L').resize((9,8),Image.Resampling.LANCZOS).getdata())
+    except OSError:
+        return None,None
+    value = 0
+    for row in range(8):
+        for column in range(8):
+            value = (value << 1) | (pixels[row * 9 + column] > pixels[row * 9 + column + 1])
+    return value,size
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def _bands(value):
+    return [(value >> (16 * band)) & 0xFFFF for band in range(BANDS)]
+
+class UpscaleCache:
+    def __init__(self,directory,max_bytes,similar=False,max_distance=3):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.similar = similar
+        self.max_distance = max_distance
+        self.index_path = os.path.join(directory,'index.db')
+        self.lock = threading.Lock()
+        self.session = {"hits":0,"similar_hits":0,"misses":0}
+        os.makedirs(directory,exist_ok=True)
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        # One short transaction per call; the index is shared by every thread and worker process
+        connection = sqlite3.connect(self.index_path,timeout=30)
+        connection.row_factory = sqlite3.Row
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def _count(self,result):
+        with self.lock:
+            self.session[result] += 1
+
+    def lookup(self,input_path,signature,digest=None):
+        # Returns (cached output path, "hit" or "similar") or (None, "miss"). A cached file that has gone missing is
+        # dropped from the index and counts as a miss
+        key = f"{signature}-{digest or file_digest(input_path)}"
+        with self._connect() as connection:
+            row = connection.execute("SELECT key, path FROM entries WHERE key = ?",(key,)).fetchone()
+            result = "hit"
+            if row is None and self.similar:
+                row = self._nearest(connection,input_path,signature)
+                result = "similar"
+            if row is not None and not os.path.exists(row["path"]):
+                connection.execute("DELETE FROM entries WHERE key = ?",(row["key"],))
+                row = None
+            if row is None:
+                cache_lookup('upscale',False)
+                self._count("misses")
+                return None,"miss"
+            connection.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?",(time.time(),row["key"]))
+        cache_lookup('upscale',True)
+        self._count("hits" if result == "hit" else "similar_hits")
+        return row["path"],result
+
+    def _nearest(self,connection,input_path,signature):
+        value,size = difference_hash(input_path)
+        if value is None:
+            return None
+        bands = _bands(value)
+        if self.max_distance < BANDS:
+            # One indexed lookup per band (SQLite would scan for the equivalent OR)
+            union = " UNION ".join(f"SELECT key, path, dhash FROM entries WHERE signature = ? AND band{band} = ? "
+                                   f"AND width = ? AND height = ?" for band in range(BANDS))
+            candidates = connection.execute(union,[parameter for band in bands for parameter in (signature,band,*size)])
+        else:
+            # Beyond three bits two hashes may share no band, so every entry of the same size is compared
+            candidates = connection.execute("SELECT key, path, dhash FROM entries WHERE signature = ? AND width = ? AND height = ?",
+                                            (signature,*size))
+        best, best_distance = None, self.max_distance + 1
+        for candidate in candidates:
+            distance = bin((candidate["dhash"] & ((1 << 64) - 1)) ^ value).count("1")
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
+
+    def store(self,input_path,output_path,signature,digest=None):
+        # Keeps a hardlink to a fresh upscaler output under the input's key
+        key = f"{signature}-{digest or file_digest(input_path)}"
+        cached_path = os.path.join(self.directory,key[-2:],f"{key}{os.path.splitext(output_path)[1]}")
+        link_or_copy(output_path,cached_path)
+        # Hashed even with similar lookups off, so turning them on later finds the existing entries
+        value,size = difference_hash(input_path)
+        bands = _bands(value) if value is not None else [None] * BANDS
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries (key, signature, dhash, band0, band1, band2, band3, width, height, path, bytes, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key,signature,_signed(value) if value is not None else None,*bands,*(size or (None,None)),cached_path,
+                 os.path.getsize(cached_path),now,now))
+            self._evict(connection)
+        return cached_path
+
+    def _evict(self,connection):
+        total = connection.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in connection.execute("SELECT key, path, bytes FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(row["path"])
+            except FileNotFoundError:
+                pass
+            connection.execute("DELETE FROM entries WHERE key = ?",(row["key"],))
+            total -= row["bytes"]
+
+    def stats(self):
+        with self._connect() as connection:
+            row = connection.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(bytes), 0) AS bytes, "
+                                     "COALESCE(SUM(hits), 0) AS hits FROM entries").fetchone()
+        with self.lock:
+            session = dict(self.session)
+        lookups = sum(session.values())
+        return {
+            "entries":row["entries"],
+            "size_mb":round(row["bytes"] / 1024 / 1024,2),
+            "max_mb":round(self.max_bytes / 1024 / 1024,2),
+            "hits_on_cached_entries":row["hits"],
+            "similar_lookups":self.similar,
+            # Since this process started
+            "process":{**session,"hit_ratio":round((session["hits"] + session["similar_hits"]) / lookups,4) if lookups else None},
+        }
+
+_upscale_cache = None
+_upscale_cache_lock = threading.Lock()
+
+def get_upscale_cache():
+    # None when UPSCALE_CACHE=0. Built on first use so settings from .env are picked up regardless of import order
+    global _upscale_cache
+    if os.environ.get('UPSCALE_CACHE','1') == '0':
+        return None
+    with _upscale_cache_lock:
+        if _upscale_cache is None:
+            _upscale_cache = UpscaleCache(
+                directory=os.environ.get('UPSCALE_CACHE_DIR',os.path.join('cache','upscale')),
+                max_bytes=int(float(os.environ.get('UPSCALE_CACHE_MAX_MB',2048))*1024*1024),
+                similar=os.environ.get('UPSCALE_CACHE_SIMILAR') == '1',
+                max_distance=int(os.environ.get('UPSCALE_CACHE_MAX_DISTANCE',3)),
+            )
+    return _upscale_cache
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
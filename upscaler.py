@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import atexit
+import select
+import threading
+import subprocess
+
+# *************************************!!!!!!!!!!!!! UPSCALER PROCESS !!!!!!!!!!!!!!!!!!!********************************
+# Talks to a long-lived upscaler_worker.py process over its stdin/stdout pipes so Real-ESRGAN and its weights are loaded
+# once per app process instead of once per request. If the worker cannot be started (or UPSCALER_MODE=subprocess),
+# the original one-shot inference_realesrgan.py run is used instead.
+
+BASE_DIR = "Image Upscaler"
+REALESRGAN_DIR = os.path.join(BASE_DIR, "Real-ESRGAN")
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "upscaler_worker.py")
+
+# What the outputs depend on besides the input bytes (see upscale_cache.py); the worker and the one-shot script both
+# use these defaults
+MODEL_NAME = "RealESRGAN_x4plus"
+OUTSCALE = 4
+
+def model_signature(fp32=True):
+    return f"{MODEL_NAME}-x{OUTSCALE}-{'fp32' if fp32 else 'fp16'}"
+
+class UpscalerError(RuntimeError):
+    pass
+
+class UpscalerTimeout(UpscalerError):
+    pass
+
+def venv_python():
+    return os.path.join(BASE_DIR, "venv", "Scripts", "python.exe") if os.name == "nt" else os.path.join(BASE_DIR, "venv", "bin", "python")
+
+def run_once(input_dir,output_dir,fp32=True):
+    script_path = os.path.join(REALESRGAN_DIR, "inference_realesrgan.py")
+    command = [venv_python(), script_path, "-i", input_dir, "-o", output_dir]
+    if fp32:
+        command.append("--fp32")
+    try:
+        subprocess.run(command, check=True)
+    except subprocess.CalledProcessError as e:
+        print("Upscaling failed:", e)
+        raise
+
+class ResidentUpscaler:
+    def __init__(self,startup_timeout,request_timeout=None):
+        self.startup_timeout = startup_timeout
+        self.request_timeout = request_timeout
+        self.process = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        self.process = subprocess.Popen(
+            [os.path.abspath(venv_python()), WORKER_SCRIPT, "--model-dir", os.path.abspath(REALESRGAN_DIR)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            cwd=REALESRGAN_DIR,
+        )
+        # Wait for the "ready" line, which the worker sends once the model weights are loaded
+        if os.name != "nt":
+            ready, _, _ = select.select([self.process.stdout], [], [], self.startup_timeout)
+            if not ready:
+                self.stop()
+                raise UpscalerError("Upscaler worker did not become ready in time")
+        line = self.process.stdout.readline()
+        if not line or not json.loads(line).get("ready"):
+            self.stop()
+            raise UpscalerError("Upscaler worker exited during startup")
+
+    def _request(self,message):
+        if self.process is None or self.process.poll() is not None:
+            self._start()
+        try:
+            self.process.stdin.write(json.dumps(message) + "\n")
+            self.process.stdin.flush()
+            # A hung worker would otherwise hold this request, and its upscale slot, forever
+            if os.name != "nt" and self.request_timeout:
+                ready, _, _ = select.select([self.process.stdout], [], [], self.request_timeout)
+                if not ready:
+                    self.stop()
+                    raise UpscalerTimeout(f"Upscaler worker did not answer within {self.request_timeout:g}s and was restarted")
+            line = self.process.stdout.readline()
+        except (BrokenPipeError, OSError):
+            line = ""
+        if not line:
+            # The worker died mid request (e.g. out of memory); drop it so the next call starts a fresh one
+            self.stop()
+            raise UpscalerError("Upscaler worker crashed")
+        return json.loads(line)
+
+    def upscale(self,input_dir,output_dir,fp32=True):
+        message = {"input_dir": os.path.abspath(input_dir), "output_dir": os.path.abspath(output_dir), "fp32": fp32}
+        with self.lock:
+            try:
+                reply = self._request(message)
+            except UpscalerTimeout:
+                # Not retried: the same images would most likely hang the next worker too
+                raise
+            except UpscalerError:
+                # Retry once on a freshly started worker before giving up
+                reply = self._request(message)
+        if not reply.get("ok"):
+            raise UpscalerError(reply.get("error", "Upscaling failed"))
+        return reply["outputs"]
+
+    def stop(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=5)
+            except Exception:
+                pass
+            self.process = None
+
+# Every upscale holds one slot; each slot that needs a resident worker checks one out of the idle list, so there are never
+# more workers (and loaded models) than UPSCALE_CONCURRENCY
+_slots = None
+_idle = []
+_workers = []
+_pool_lock = threading.Lock()
+
+def upscale_concurrency():
+    return max(1, int(os.environ.get('UPSCALE_CONCURRENCY', os.cpu_count() or 1)))
+
+def _get_slots():
+    global _slots
+    with _pool_lock:
+        if _slots is None:
+            _slots = threading.BoundedSemaphore(upscale_concurrency())
+        return _slots
+
+def _checkout():
+    with _pool_lock:
+        if _idle:
+            return _idle.pop()
+        worker = ResidentUpscaler(startup_timeout=float(os.environ.get('UPSCALER_STARTUP_TIMEOUT', 300)),
+                                  request_timeout=float(os.environ.get('UPSCALER_REQUEST_TIMEOUT', 900)))
+        _workers.append(worker)
+        return worker
+
+def _checkin(worker):
+    with _pool_lock:
+        _idle.append(worker)
+
+def stop_all():
+    with _pool_lock:
+        for worker in _workers:
+            worker.stop()
+
+atexit.register(stop_all)
+
+def preload():
+    # Starts one resident worker ahead of the first upscale, so its model load doesn't land on a request
+    if os.environ.get('UPSCALER_MODE', 'resident') != 'resident':
+        return
+    worker = _checkout()
+    try:
+        with worker.lock:
+            if worker.process is None or worker.process.poll() is not None:
+                worker._start()
+    except (UpscalerError, OSError, ValueError) as e:
+        print("Upscaler preload failed, the first upscale will start the worker:", e, file=sys.stderr)
+    finally:
+        _checkin(worker)
+
+def run_upscaler(input_dir,output_dir,fp32=True):
+    with _get_slots():
+        if os.environ.get('UPSCALER_MODE', 'resident') == 'resident':
+            worker = _checkout()
+            try:
+                return worker.upscale(input_dir, output_dir, fp32=fp32)
+            except UpscalerTimeout:
+                raise
+            except (UpscalerError, OSError, ValueError) as e:
+                print("Resident upscaler unavailable, falling back to a one-shot run:", e, file=sys.stderr)
+            finally:
+                _checkin(worker)
+        run_once(input_dir, output_dir, fp32=fp32)
+        return [os.path.join(output_dir, filename) for filename in os.listdir(output_dir)]
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
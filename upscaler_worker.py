@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import glob
+import argparse
+
+# *************************************!!!!!!!!!!!!! RESIDENT UPSCALER WORKER !!!!!!!!!!!!!!!!!!!********************************
+# Runs inside the Real-ESRGAN venv ("Image Upscaler/venv") and keeps the model loaded between requests.
+# Requests and responses are single JSON lines: {"input_dir": ..., "output_dir": ..., "fp32": true}
+# is answered with {"ok": true, "outputs": [...]} or {"ok": false, "error": "..."}.
+# Mirrors the defaults of inference_realesrgan.py (RealESRGAN_x4plus, outscale 4, suffix "out").
+
+MODEL_URL = 'https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.0/RealESRGAN_x4plus.pth'
+
+def load_model(model_dir,fp32):
+    from basicsr.archs.rrdbnet_arch import RRDBNet
+    from realesrgan import RealESRGANer
+
+    model = RRDBNet(num_in_ch=3, num_out_ch=3, num_feat=64, num_block=23, num_grow_ch=32, scale=4)
+    model_path = os.path.join(model_dir, 'weights', 'RealESRGAN_x4plus.pth')
+    if not os.path.isfile(model_path):
+        from basicsr.utils.download_util import load_file_from_url
+        model_path = load_file_from_url(url=MODEL_URL, model_dir=os.path.join(model_dir, 'weights'), progress=True, file_name=None)
+    return RealESRGANer(scale=4, model_path=model_path, model=model, tile=0, tile_pad=10, pre_pad=0, half=not fp32)
+
+def upscale_directory(upsampler,input_dir,output_dir,suffix='out'):
+    import cv2
+
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = []
+    for path in sorted(glob.glob(os.path.join(input_dir, '*'))):
+        imgname, extension = os.path.splitext(os.path.basename(path))
+        img = cv2.imread(path, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            continue
+        img_mode = 'RGBA' if len(img.shape) == 3 and img.shape[2] == 4 else None
+        output, _ = upsampler.enhance(img, outscale=4)
+        extension = 'png' if img_mode == 'RGBA' else extension[1:]
+        save_path = os.path.join(output_dir, f'{imgname}_{suffix}.{extension}')
+        cv2.imwrite(save_path, output)
+        outputs.append(save_path)
+    return outputs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model-dir', default='.')
+    args = parser.parse_args()
+    sys.path.insert(0, os.path.abspath(args.model_dir))
+
+    # Keep the protocol channel clean: anything the libraries print goes to stderr instead
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w', buffering=1)
+    sys.stdout = sys.stderr
+
+    upsamplers = {}
+    upsamplers[True] = load_model(args.model_dir, fp32=True)
+    protocol.write(json.dumps({"ready": True, "pid": os.getpid()}) + "\n")
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            fp32 = bool(request.get('fp32', True))
+            if fp32 not in upsamplers:
+                upsamplers[fp32] = load_model(args.model_dir, fp32=fp32)
+            outputs = upscale_directory(upsamplers[fp32], request['input_dir'], request['output_dir'])
+            reply = {"ok": True, "outputs": outputs}
+        except Exception as e:
+            reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        protocol.write(json.dumps(reply) + "\n")
+
+if __name__ == '__main__':
+    main()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************
@@ -0,0 +1,42 @@
+import os
+import sys
+import threading
+import importlib
+
+# *************************************!!!!!!!!!!!!! WSGI ENTRY POINT !!!!!!!!!!!!!!!!!!!********************************
+# Entry point for a preforking server (see gunicorn.conf.py):
+#   gunicorn -c gunicorn.conf.py                            serves the RESTful API (api.py)
+#   VISIONEXTRACT_APP=main gunicorn -c gunicorn.conf.py     serves the web interface (main.py)
+# Each worker process calls warm_worker() once after it has loaded the app, and shut_down() when it stops.
+
+APPS = ("api","main")
+
+def load_app(name=None):
+    name = name or os.environ.get('VISIONEXTRACT_APP','api')
+    if name not in APPS:
+        sys.exit(f"VISIONEXTRACT_APP must be one of {', '.join(APPS)}, not {name!r}")
+    return importlib.import_module(name).app
+
+app = load_app()
+
+def warm_worker(app):
+    from factory import warm_up
+    from models import database
+    import methods
+
+    with app.app_context():
+        # With preload_app the parent's pooled connections were copied by fork(); leave them to the parent and
+        # open fresh ones here (a no-op when the app was loaded in this worker)
+        database.engine.dispose(close=False)
+        # Schema checks, job resume and the first pooled connection (with its SQLite pragmas) before any traffic
+        warm_up(app)
+        with database.engine.connect() as connection:
+            connection.exec_driver_sql("SELECT 1")
+    # boto3 and the Textract client are otherwise created on the first extraction request
+    methods.get_textract()
+    if os.environ.get('UPSCALER_PRELOAD') == '1':
+        # Loading the model can take longer than the server's worker timeout, so it runs next to the serving loop
+        import upscaler
+        threading.Thread(target=upscaler.preload,name="upscaler-preload",daemon=True).start()
+
+# *************************************!!!!!!!!!!!!! END !!!!!!!!!!!!!!!!!!!********************************